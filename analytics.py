@@ -0,0 +1,359 @@
+import itertools
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import DAY_SHIFT_START, NIGHT_SHIFT_START, PRODUCT_MIXERS, UTILIZATION_MAX_BATCH_HOURS
+from utils import get_msk_time
+
+# Коды действий из history тикета
+ACTION_CODES = {
+    'ticket_created': 0,
+    'sample_sent_to_lab': 1,
+    'sample_received_by_lab': 2,
+    'analysis_approved': 3,
+    'correction_required': 4,
+    'mixer_discharged': 5,
+}
+
+# Этапы: ключ, название, действие начала, действия окончания
+STAGES = [
+    ('to_lab', 'Создание → проба передана', 'ticket_created', ('sample_sent_to_lab',)),
+    ('lab_queue', 'Проба передана → начало анализа', 'sample_sent_to_lab', ('sample_received_by_lab',)),
+    ('analysis', 'Анализ → допуск или корректировка', 'sample_received_by_lab',
+     ('analysis_approved', 'correction_required')),
+    ('discharge', 'Допуск → откачка', 'analysis_approved', ('mixer_discharged',)),
+]
+
+# Разрезы статистики: поле тикета -> название
+DIMENSIONS = {'product': 'Продукт', 'technology': 'Технология', 'mixer': 'Миксер'}
+
+PERCENTILES = (50, 90, 99)
+
+
+class FlatHistory:
+    """История всех тикетов в виде плоских массивов NumPy
+
+    Событие i: тикет ticket[i], действие action[i], время ts[i] (секунды).
+    События отсортированы по тикету и времени. Для каждого разреза
+    хранятся код значения тикета и список значений.
+    """
+
+    def __init__(self, tickets: Iterable[Dict[str, Any]]):
+        ticket_index: List[int] = []
+        actions: List[int] = []
+        timestamps: List[str] = []
+        # Тикеты читаются один раз (можно передать генератор архива): от тикета остаются только значения разрезов
+        dimension_values: Dict[str, List[str]] = {field: [] for field in DIMENSIONS}
+        tickets_count = 0
+        for i, ticket in enumerate(tickets):
+            tickets_count += 1
+            for field, values in dimension_values.items():
+                values.append(str(ticket.get(field) or 'Не указан'))
+            for event in ticket.get('history') or []:
+                code = ACTION_CODES.get(event.get('action'))
+                timestamp = event.get('timestamp')
+                if code is None or not timestamp:
+                    continue
+                ticket_index.append(i)
+                actions.append(code)
+                # Все метки времени пишутся по МСК (get_msk_time); зона отбрасывается
+                timestamps.append(timestamp[:19])
+
+        ts = np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+        ticket_arr = np.array(ticket_index, dtype=np.int32)
+        order = np.lexsort((ts, ticket_arr))
+        self.ticket = ticket_arr[order]
+        self.action = np.array(actions, dtype=np.int8)[order]
+        self.ts = ts[order]
+        self.tickets_count = tickets_count
+
+        self.codes: Dict[str, np.ndarray] = {}
+        self.labels: Dict[str, List[str]] = {}
+        for field in DIMENSIONS:
+            values = np.array(dimension_values[field], dtype=object)
+            if len(values):
+                labels, codes = np.unique(values, return_inverse=True)
+            else:
+                labels, codes = np.array([], dtype=object), np.array([], dtype=np.int64)
+            self.labels[field] = [str(label) for label in labels]
+            self.codes[field] = codes.astype(np.int32)
+
+    def stage_durations(self, start_action: str, end_actions: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+        """(индексы тикетов, длительности в минутах) для каждого начала этапа
+
+        Окончание - ближайшее следующее событие из end_actions того же тикета.
+        """
+        starts = np.flatnonzero(self.action == ACTION_CODES[start_action])
+        ends = np.flatnonzero(np.isin(self.action, [ACTION_CODES[a] for a in end_actions]))
+        if not len(starts) or not len(ends):
+            return np.array([], dtype=np.int32), np.array([], dtype=np.float64)
+
+        next_end = np.searchsorted(ends, starts, side='right')
+        has_end = next_end < len(ends)
+        starts = starts[has_end]
+        ends = ends[next_end[has_end]]
+        same_ticket = self.ticket[starts] == self.ticket[ends]
+        starts, ends = starts[same_ticket], ends[same_ticket]
+
+        minutes = (self.ts[ends] - self.ts[starts]) / 60.0
+        valid = minutes >= 0
+        return self.ticket[starts][valid], minutes[valid]
+
+
+def grouped_percentiles(groups: np.ndarray, values: np.ndarray, n_groups: int,
+                        percentiles: Sequence[int] = PERCENTILES) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Перцентили (линейная интерполяция, как np.percentile) по группам за один проход
+
+    Возвращает (counts[n_groups], means[n_groups], result[n_groups, len(percentiles)]);
+    для пустых групп - NaN.
+    """
+    counts = np.bincount(groups, minlength=n_groups)
+    sums = np.bincount(groups, weights=values, minlength=n_groups)
+    result = np.full((n_groups, len(percentiles)), np.nan)
+    means = np.full(n_groups, np.nan)
+    nonempty = counts > 0
+    means[nonempty] = sums[nonempty] / counts[nonempty]
+    if not len(values):
+        return counts, means, result
+
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    n = counts[nonempty]
+    base = offsets[nonempty]
+    for j, p in enumerate(percentiles):
+        position = (n - 1) * (p / 100.0)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        fraction = position - low
+        result[nonempty, j] = (sorted_values[base + low] * (1 - fraction)
+                               + sorted_values[base + high] * fraction)
+    return counts, means, result
+
+
+def _natural_key(label: str) -> List[Any]:
+    """Миксер_9 раньше Миксер_10"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', label)]
+
+
+def _summary(count: int, mean: float, values: np.ndarray) -> Dict[str, Any]:
+    summary = {'count': int(count), 'mean': round(float(mean), 1) if count else None}
+    for p, value in zip(PERCENTILES, values):
+        summary[f'p{p}'] = round(float(value), 1) if count else None
+    return summary
+
+
+def stage_report(tickets: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Перцентили длительностей этапов: общие и по продуктам, технологиям, миксерам"""
+    flat = FlatHistory(tickets)
+    report: Dict[str, Any] = {
+        'generated_at': get_msk_time().isoformat(),
+        'tickets': flat.tickets_count,
+        'events': int(len(flat.ts)),
+        'percentiles': list(PERCENTILES),
+        'stages': [{'key': key, 'label': label} for key, label, _, _ in STAGES],
+        'dimensions': dict(DIMENSIONS),
+        'overall': {},
+        'by': {field: {} for field in DIMENSIONS},
+    }
+
+    for key, _, start_action, end_actions in STAGES:
+        ticket_idx, minutes = flat.stage_durations(start_action, end_actions)
+        counts, means, values = grouped_percentiles(np.zeros(len(minutes), dtype=np.int64), minutes, 1)
+        report['overall'][key] = _summary(counts[0], means[0], values[0])
+
+        for field in DIMENSIONS:
+            labels = flat.labels[field]
+            counts, means, values = grouped_percentiles(flat.codes[field][ticket_idx], minutes, len(labels))
+            report['by'][field][key] = {
+                labels[i]: _summary(counts[i], means[i], values[i])
+                for i in sorted(range(len(labels)), key=lambda i: _natural_key(labels[i])) if counts[i]
+            }
+    return report
+
+
+class StageAnalytics:
+    """Отчет по этапам с кэшем до изменения файлов базы
+
+    Пока tickets.json и archive_tickets.json не менялись, повторные
+    запросы отдают готовый отчет без чтения и разбора истории.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple] = None
+        self._report: Optional[Dict[str, Any]] = None
+
+    def _files_signature(self) -> Tuple:
+        signature = []
+        for path in (self.db.db_path, self.db.archive_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            signature = self._files_signature()
+            if self._report is None or signature != self._signature:
+                self._report = stage_report(itertools.chain(self.db._load_tickets(), self.db.iter_archive()))
+                self._signature = signature
+            return self._report
+
+
+HOUR = 3600
+
+
+def _epoch_seconds(timestamps: Sequence[str]) -> np.ndarray:
+    """Секунды от эпохи для ISO-строк по МСК (зона отбрасывается, как в FlatHistory)"""
+    return np.array([ts[:19] for ts in timestamps], dtype='datetime64[s]').astype(np.int64)
+
+
+def occupied_seconds(starts: np.ndarray, ends: np.ndarray, boundaries: np.ndarray) -> np.ndarray:
+    """Занятые секунды между соседними границами для набора интервалов [start, end)
+
+    Один проход по отсортированным началам и концам: занятость до момента x
+    равна сумме (x - start) по начавшимся интервалам минус сумма (x - end)
+    по закончившимся; обе суммы берутся из префиксных сумм через searchsorted.
+    """
+    starts = np.sort(starts)
+    ends = np.sort(ends)
+    start_prefix = np.concatenate(([0], np.cumsum(starts)))
+    end_prefix = np.concatenate(([0], np.cumsum(ends)))
+    started = np.searchsorted(starts, boundaries, side='right')
+    ended = np.searchsorted(ends, boundaries, side='right')
+    covered = (started * boundaries - start_prefix[started]) - (ended * boundaries - end_prefix[ended])
+    return np.diff(covered)
+
+
+def _mixer_names() -> List[str]:
+    return [f"Миксер_{m}" for m in sorted({m for mixers in PRODUCT_MIXERS.values() for m in mixers})]
+
+
+def _fraction(occupied: float, elapsed: float) -> Optional[float]:
+    return round(float(occupied / elapsed), 3) if elapsed else None
+
+
+def utilization_report(tickets: Iterable[Dict[str, Any]], start: date, end: date,
+                       now: datetime) -> Dict[str, Any]:
+    """Доля времени, когда миксер занят тикетом, по часам суток и сменам
+
+    Период - дни [start, end). Тикет занимает миксер с created_at до
+    completed_at, активный - до now. Часы после now в расчет не входят.
+    """
+    period_start = np.datetime64(start, 's').astype(np.int64)
+    period_end = np.datetime64(end, 's').astype(np.int64)
+    now_epoch = np.datetime64(now.replace(tzinfo=None), 's').astype(np.int64)
+    boundaries = np.arange(period_start, period_end + 1, HOUR, dtype=np.int64)
+    hour_of_day = (boundaries[:-1] // HOUR) % 24
+    # Прошедшие секунды каждого часа периода (будущее не считается)
+    elapsed = np.clip(np.minimum(boundaries[1:], now_epoch) - boundaries[:-1], 0, HOUR)
+    day_shift = (hour_of_day >= DAY_SHIFT_START) & (hour_of_day < NIGHT_SHIFT_START)
+    elapsed_by_hour = np.bincount(hour_of_day, weights=elapsed, minlength=24)
+
+    mixers, created, finished = [], [], []
+    for ticket in tickets:
+        if not ticket.get('mixer') or not ticket.get('created_at'):
+            continue
+        if ticket.get('completed_at'):
+            finished.append(ticket['completed_at'])
+        elif ticket.get('status') in ('completed', 'cancelled'):
+            continue
+        else:
+            finished.append(now.isoformat())
+        mixers.append(ticket['mixer'])
+        created.append(ticket['created_at'])
+    mixer_labels, mixer_codes = np.unique(np.array(mixers, dtype=object), return_inverse=True)
+    mixer_code = {str(label): code for code, label in enumerate(mixer_labels)}
+    starts = _epoch_seconds(created)
+    ends = np.minimum(_epoch_seconds(finished), now_epoch)
+    overlaps = (starts < period_end) & (ends > period_start) & (ends > starts)
+
+    report: Dict[str, Any] = {
+        'generated_at': get_msk_time().isoformat(),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': (end - start).days,
+        'hours': list(range(24)),
+        'shifts': {'дневная': f"{DAY_SHIFT_START:02d}:00-{NIGHT_SHIFT_START:02d}:00",
+                   'ночная': f"{NIGHT_SHIFT_START:02d}:00-{DAY_SHIFT_START:02d}:00"},
+        'mixers': [],
+    }
+    total_by_hour = np.zeros(len(elapsed))
+    for mixer in _mixer_names():
+        selected = overlaps & (mixer_codes == mixer_code.get(mixer, -1))
+        occupied = np.minimum(occupied_seconds(starts[selected], ends[selected], boundaries), HOUR)
+        total_by_hour += occupied
+        report['mixers'].append(_utilization_row(mixer, occupied, hour_of_day, elapsed, elapsed_by_hour, day_shift))
+    report['total'] = _utilization_row('Все миксеры', total_by_hour / len(report['mixers']),
+                                       hour_of_day, elapsed, elapsed_by_hour, day_shift)
+    return report
+
+
+def _utilization_row(mixer: str, occupied: np.ndarray, hour_of_day: np.ndarray, elapsed: np.ndarray,
+                     elapsed_by_hour: np.ndarray, day_shift: np.ndarray) -> Dict[str, Any]:
+    occupied_by_hour = np.bincount(hour_of_day, weights=occupied, minlength=24)
+    return {
+        'mixer': mixer,
+        'by_hour': [_fraction(o, e) for o, e in zip(occupied_by_hour, elapsed_by_hour)],
+        'by_shift': {
+            'дневная': _fraction(occupied[day_shift].sum(), elapsed[day_shift].sum()),
+            'ночная': _fraction(occupied[~day_shift].sum(), elapsed[~day_shift].sum()),
+        },
+        'overall': _fraction(occupied.sum(), elapsed.sum()),
+    }
+
+
+class MixerUtilization:
+    """Загрузка миксеров с кэшем закрытых периодов
+
+    Период, который целиком в прошлом, уже не меняется при обычной работе:
+    новые тикеты создаются позже, а занятость активных тикетов обрезается
+    концом периода. Такие отчеты хранятся в LRU-кэше; текущий период
+    считается заново при каждом запросе.
+
+    Тикеты периода берутся по индексу created_at (get_tickets_between) с
+    запасом UTILIZATION_MAX_BATCH_HOURS до начала периода, плюс активные
+    тикеты, созданные раньше: весь архив не читается.
+    """
+
+    def __init__(self, db, cache_size: int = 64):
+        self.db = db
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[date, date], Dict[str, Any]]" = OrderedDict()
+
+    def report(self, start: date, end: date) -> Dict[str, Any]:
+        now = get_msk_time().replace(tzinfo=None)
+        key = (start, end)
+        closed = datetime.combine(end, time()) <= now
+        with self._lock:
+            if closed and key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        period_start = datetime.combine(start, time())
+        tickets = {t.get('ticket_id'): t for t in self.db.get_active_tickets()}
+        tickets.update((t.get('ticket_id'), t) for t in self.db.get_tickets_between(
+            period_start - timedelta(hours=UTILIZATION_MAX_BATCH_HOURS), datetime.combine(end, time())))
+        report = utilization_report(tickets.values(), start, end, now)
+        if closed:
+            with self._lock:
+                self._cache[key] = report
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return report
+
+    def clear(self) -> None:
+        """Сбросить кэш (после ручного изменения базы)"""
+        with self._lock:
+            self._cache.clear()
@@ -1,16 +1,64 @@
-from flask import Flask, render_template, jsonify, Response, request
+from flask import Flask, render_template, jsonify, Response, request, g, url_for
+import itertools
 import json
 import os
-from datetime import datetime, timedelta
-import pandas as pd
-import io
-from database import Database
+import time
+from datetime import date, datetime, timedelta
+import urllib.request
+import urllib.error
+from config import BOT_MODE, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, ADMIN_PASSWORD, LAB_TIMEOUT
+from cube import CUBE_DIMENSIONS
+from analytics import StageAnalytics, MixerUtilization
+from backup import BackupStore
+from database import Database, ACTION_STATUS
+from forecast import ShiftCapacityForecast
+from excel import write_rows, EXPORT_COLUMN_WIDTHS
+from health import StorageHealth, storage_trends
+from lab_queue import LabQueue
+from metrics import REGISTRY, HTTP_REQUESTS, HTTP_SECONDS, CONTENT_TYPE
+from profiling import PROFILER, MODES
+from search import SearchIndex
 from utils import format_status_ru, format_step_ru, format_time_elapsed, get_current_shift, get_msk_time, format_msk_time
 
 app = Flask(__name__)
 
 # Инициализация базы данных
 db = Database()
+stage_analytics = StageAnalytics(db)
+mixer_utilization = MixerUtilization(db)
+search_index = SearchIndex(db)
+lab_queue = LabQueue(db)
+capacity_forecast = ShiftCapacityForecast(db)
+# Замеры файлов базы; обслуживание по порогам выполняет бот
+storage_health = StorageHealth(db, source="web")
+storage_health.start()
+backups = BackupStore(db)
+
+# Метрики запросов
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    HTTP_SECONDS.observe(time.perf_counter() - g.get('request_started', time.perf_counter()), endpoint=endpoint)
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+# Профилирование следующих N запросов к маршруту (включается в /debug/profile)
+@app.before_request
+def start_request_profile():
+    g.profile_session = PROFILER.start(f"route:{request.endpoint}")
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    PROFILER.finish(g.pop('profile_session', None))
+
+@app.route('/metrics')
+def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 # Обработчики ошибок
 @app.errorhandler(500)
@@ -35,23 +83,8 @@ def get_tickets_for_current_shift():
     if now.hour < shift_start_hour:
         shift_start = shift_start - timedelta(days=1)
 
-    all_tickets = db._load_tickets()
-    archive_tickets = db._load_archive()
-    all_tickets_combined = all_tickets + archive_tickets
-
-    shift_tickets = []
-    for ticket in all_tickets_combined:
-        created_at_str = ticket['created_at']
-        # ИСПРАВЛЕНИЕ: корректная обработка времени создания
-        if 'Z' in created_at_str:
-            created_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
-            created_at = created_at.replace(tzinfo=None)
-        else:
-            created_at_str = created_at_str.split('+')[0]
-            created_at = datetime.fromisoformat(created_at_str)
-            
-        if created_at >= shift_start:
-            shift_tickets.append(ticket)
+    # Тикеты, созданные с начала смены (конец диапазона - с запасом на расхождение часов)
+    shift_tickets = db.get_tickets_between(shift_start, now + timedelta(days=1))
 
     return shift_tickets
 
@@ -156,26 +189,28 @@ def stats():
     """Страница со статистикой"""
     try:
         all_tickets = db._load_tickets()
-        archive_tickets = db._load_archive()
 
         # Собираем статистику
         stats_data = {
-            'total': len(all_tickets) + len(archive_tickets),
+            'total': 0,
             'active': len(db.get_active_tickets()),
-            'completed': len(archive_tickets),
+            'completed': 0,
             'correction_required': len([t for t in all_tickets if t.get('status') == 'correction_required']),
             'products': {},
             'technologies': {},
             'brands': {},
             'mixers': {},
-            'avg_production_time': 0
+            'avg_production_time': 0,
+            'status_durations': []
         }
 
-        # Статистика по всем тикетам (активные + архив)
-        all_tickets_combined = all_tickets + archive_tickets
+        # Один проход по активным тикетам и потоку архива: в памяти только счетчики и суммы
+        completed_minutes = completed_count = 0
+        status_minutes = {}
+        for archived, ticket in itertools.chain(((False, t) for t in all_tickets),
+                                                ((True, t) for t in db.iter_archive())):
+            stats_data['total'] += 1
 
-        # Статистика по продуктам, технологиям, брендам и миксерам
-        for ticket in all_tickets_combined:
             # Продукты
             product = ticket.get('product', 'Не указан')
             stats_data['products'][product] = stats_data['products'].get(product, 0) + 1
@@ -192,10 +227,29 @@ def stats():
             mixer = ticket.get('mixer', 'Не указан')
             stats_data['mixers'][mixer] = stats_data['mixers'].get(mixer, 0) + 1
 
+            if not archived:
+                continue
+            stats_data['completed'] += 1
+            # Время производства и время в статусах по сводке durations
+            if ticket.get('total_production_time_minutes'):
+                completed_minutes += ticket['total_production_time_minutes']
+                completed_count += 1
+            for status, minutes in ticket.get('durations', {}).get('statuses', {}).items():
+                total = status_minutes.setdefault(status, [0, 0])
+                total[0] += minutes
+                total[1] += 1
+
         # Среднее время производства для завершенных тикетов
-        completed_times = [t.get('total_production_time_minutes', 0) for t in archive_tickets if t.get('total_production_time_minutes')]
-        if completed_times:
-            stats_data['avg_production_time'] = format_time_elapsed(int(sum(completed_times) / len(completed_times)))
+        if completed_count:
+            stats_data['avg_production_time'] = format_time_elapsed(int(completed_minutes / completed_count))
+
+        # Среднее время в статусах
+        for status in ACTION_STATUS.values():
+            if status in status_minutes:
+                minutes, count = status_minutes[status]
+                stats_data['status_durations'].append(
+                    (format_status_ru(status), format_time_elapsed(int(minutes / count)))
+                )
 
         return render_template('stats.html', stats=stats_data)
 
@@ -203,112 +257,333 @@ def stats():
         print(f"Ошибка в stats: {e}")
         return f"Ошибка: {str(e)}", 500
 
+@app.route('/stats/stages')
+def stage_stats():
+    """Перцентили длительностей этапов по продуктам, технологиям и миксерам"""
+    try:
+        by = request.args.get('by', 'product')
+        report = stage_analytics.report()
+        if by not in report['dimensions']:
+            by = 'product'
+        return render_template('stage_stats.html', report=report, by=by)
+
+    except Exception as e:
+        print(f"Ошибка в stage_stats: {e}")
+        return f"Ошибка: {str(e)}", 500
+
+@app.route('/api/stats/stages')
+def stage_stats_api():
+    """Перцентили длительностей этапов (минуты) в JSON"""
+    return jsonify(stage_analytics.report())
+
+# Самый длинный период отчета о загрузке миксеров, дней
+UTILIZATION_MAX_DAYS = 366
+
+def utilization_period():
+    """Период из ?start=&end= (ГГГГ-ММ-ДД, оба дня включительно), по умолчанию последние 7 дней"""
+    today = get_msk_time().date()
+    start = date.fromisoformat(request.args['start']) if request.args.get('start') else today - timedelta(days=6)
+    end = date.fromisoformat(request.args['end']) if request.args.get('end') else today
+    if end < start:
+        raise ValueError("Конец периода раньше начала")
+    if (end - start).days >= UTILIZATION_MAX_DAYS:
+        raise ValueError(f"Период больше {UTILIZATION_MAX_DAYS} дней")
+    return start, end + timedelta(days=1)
+
+@app.route('/stats/utilization')
+def utilization_stats():
+    """Тепловая карта загрузки миксеров по часам суток и сменам"""
+    try:
+        start, end = utilization_period()
+    except ValueError as e:
+        return f"Неверный период: {str(e)}", 400
+    try:
+        report = mixer_utilization.report(start, end)
+        return render_template('utilization.html', report=report,
+                             start=start.isoformat(), end=(end - timedelta(days=1)).isoformat())
+
+    except Exception as e:
+        print(f"Ошибка в utilization_stats: {e}")
+        return f"Ошибка: {str(e)}", 500
+
+@app.route('/api/stats/utilization')
+def utilization_stats_api():
+    """Доли занятости миксеров (0..1) по часам суток и сменам в JSON"""
+    try:
+        start, end = utilization_period()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(mixer_utilization.report(start, end))
+
+def cube_query():
+    """Фильтры, группировка и период среза куба из параметров запроса
+
+    Значения измерения - повторяющимся параметром или через запятую
+    (?mixer=Миксер_9,Миксер_10&shift=ночная), группировка - ?by=product,mixer,
+    период - ?start=&end= (ГГГГ-ММ-ДД, оба дня включительно).
+    """
+    def values(name):
+        return [v.strip() for arg in request.args.getlist(name) for v in arg.split(',') if v.strip()]
+
+    filters = {dim: values(dim) for dim in CUBE_DIMENSIONS if dim != 'day'}
+    by = [dim for dim in values('by') if dim in CUBE_DIMENSIONS][:2] or ['product']
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    for day in (start, end):
+        if day:
+            date.fromisoformat(day)
+    return filters, by, start, end
+
+@app.route('/stats/cube')
+def cube_stats():
+    """Срезы куба статистики: фильтры по измерениям и переход вглубь по строке"""
+    try:
+        filters, by, start, end = cube_query()
+    except ValueError as e:
+        return f"Неверный период: {str(e)}", 400
+    try:
+        report = db.get_cube_slice(filters, by, start, end)
+
+        def drill_url(row):
+            """Строка среза становится фильтром, группировка - следующее измерение"""
+            args = {dim: ','.join(values) for dim, values in filters.items() if values}
+            args.update({name: day for name, day in (('start', start), ('end', end)) if day})
+            for dim in report['by']:
+                if dim == 'day':
+                    args['start'] = args['end'] = row['day']
+                else:
+                    args[dim] = row[dim]
+            dims = list(CUBE_DIMENSIONS)
+            following = [dim for dim in dims[dims.index(report['by'][-1]) + 1:] if not filters.get(dim)]
+            if not following:
+                return None
+            return url_for('cube_stats', by=following[0], **args)
+
+        statuses = [(status, format_status_ru(status)) for status in ACTION_STATUS.values()]
+        return render_template('cube.html', report=report, dimensions=CUBE_DIMENSIONS, statuses=statuses,
+                             filters=filters, start=start or '', end=end or '', drill_url=drill_url)
+
+    except Exception as e:
+        print(f"Ошибка в cube_stats: {e}")
+        return f"Ошибка: {str(e)}", 500
+
+@app.route('/api/stats/cube')
+def cube_stats_api():
+    """Срез куба в JSON: итог и строки по группам (минуты, доля тикетов с корректировками)"""
+    try:
+        filters, by, start, end = cube_query()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    report = db.get_cube_slice(filters, by, start, end)
+    report.pop('values')
+    report.update({'filters': {dim: v for dim, v in filters.items() if v}, 'start': start, 'end': end})
+    return jsonify(report)
+
+@app.route('/search')
+def search():
+    """Поиск тикетов по тексту корректировок и показателей анализов"""
+    try:
+        query = request.args.get('q', '').strip()
+        results, total = search_index.search(query) if query else ([], 0)
+        return render_template('search.html', query=query, results=results, total=total)
+
+    except Exception as e:
+        print(f"Ошибка в search: {e}")
+        return f"Ошибка: {str(e)}", 500
+
+@app.route('/api/search')
+def search_api():
+    """Найденные тикеты по убыванию релевантности в JSON"""
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    results, total = search_index.search(query, limit) if query else ([], 0)
+    return jsonify({'query': query, 'total': total, 'results': results})
+
+def board_moment():
+    """Момент для доски миксеров из ?at= (ГГГГ-ММ-ДДTЧЧ:ММ, МСК); None - сейчас"""
+    value = request.args.get('at', '').strip()
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError('Неверный формат at, ожидается ГГГГ-ММ-ДДTЧЧ:ММ')
+
+@app.route('/mixers')
+def mixer_board():
+    """Доска миксеров на выбранный момент (восстанавливается из журнала событий)"""
+    try:
+        at = board_moment()
+    except ValueError as e:
+        return str(e), 400
+    mixer_status = db.get_mixer_status(at=at)
+    for info in mixer_status.values():
+        info['status_ru'] = format_status_ru(info.get('status', 'free'))
+        info['step_ru'] = format_step_ru(info.get('current_step', ''))
+        info['total_time'] = format_time_elapsed(info['total_time_minutes']) if info.get('total_time_minutes') else "N/A"
+    shifts = db.get_shift_counters(at=at)
+    moment = at or get_msk_time().replace(tzinfo=None)
+    return render_template(
+        'mixer_board.html',
+        mixer_status=mixer_status,
+        at=at.strftime('%Y-%m-%dT%H:%M') if at else '',
+        moment=moment.strftime('%d.%m.%Y %H:%M'),
+        shifts=sorted(shifts.items(), reverse=True)[:6],
+    )
+
+@app.route('/api/mixer_status')
+def mixer_board_api():
+    try:
+        at = board_moment()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'at': at.isoformat() if at else None,
+        'mixers': db.get_mixer_status(at=at),
+        'shifts': db.get_shift_counters(at=at),
+    })
+
+@app.route('/api/capacity_forecast')
+def capacity_forecast_api():
+    """Прогноз завершенных замесов до конца смены (кэшируется на CAPACITY_CACHE_SECONDS)"""
+    try:
+        return jsonify(capacity_forecast.forecast())
+    except Exception as e:
+        print(f"Ошибка в capacity_forecast_api: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def lab_queue_items():
+    """Пробы лаборатории от самой срочной: остаток времени до LAB_TIMEOUT в минутах"""
+    items = []
+    for ticket, minutes_left in lab_queue.tickets():
+        items.append({
+            'ticket_id': ticket.get('ticket_id'),
+            'mixer': ticket.get('mixer'),
+            'product': ticket.get('product'),
+            'brand': ticket.get('brand'),
+            'status': ticket.get('status'),
+            'status_ru': format_status_ru(ticket.get('status', '')),
+            'minutes_left': minutes_left,
+        })
+    return items
+
+@app.route('/lab')
+def lab_board():
+    """Очередь лаборатории по срочности (обновляется автоматически)"""
+    try:
+        return render_template('lab_board.html', items=lab_queue_items(), lab_timeout=LAB_TIMEOUT,
+                             moment=format_msk_time())
+
+    except Exception as e:
+        print(f"Ошибка в lab_board: {e}")
+        return f"Ошибка: {str(e)}", 500
+
+@app.route('/api/lab_queue')
+def lab_queue_api():
+    return jsonify({'lab_timeout': LAB_TIMEOUT, 'tickets': lab_queue_items()})
+
 @app.route('/admin')
 def admin_panel():
     """Панель администратора"""
     try:
         all_tickets = db._load_tickets()
-        archive_tickets = db._load_archive()
+        # Записи архива считаются по строкам файлов, без разбора тикетов
+        archive_count = db.archive_count()
         active_tickets = db.get_active_tickets()
 
         return render_template('admin.html',
-                             total_tickets=len(all_tickets) + len(archive_tickets),
+                             total_tickets=len(all_tickets) + archive_count,
                              active_tickets=active_tickets,
-                             archive_count=len(archive_tickets))
+                             archive_count=archive_count)
 
     except Exception as e:
         print(f"Ошибка в admin_panel: {e}")
         return f"Ошибка: {str(e)}", 500
 
+@app.route('/admin/storage')
+def storage_page():
+    """Состояние файлов базы: последние замеры бота и сайта и тренд за период"""
+    try:
+        days = min(max(int(request.args.get('days', 7)), 1), 30)
+    except ValueError:
+        return "Неверное число дней", 400
+    samples = storage_health.history(days=days)
+    latest = {}
+    for sample in samples:
+        latest[sample['source']] = sample
+    # Для таблицы - не больше 100 замеров, равномерно по периоду
+    step = max(len(samples) // 100, 1)
+    return render_template(
+        'storage.html',
+        days=days,
+        latest=latest,
+        trends=storage_trends(samples),
+        samples=list(reversed(samples[::step])),
+        actions=[(s['at'], action) for s in reversed(samples) for action in s.get('actions', [])],
+    )
+
 @app.route('/export/excel')
 def export_excel():
     """Экспорт данных в Excel с историей корректировок и временем МСК"""
     try:
         tickets = db._load_tickets()
-        archive = db._load_archive()
-        all_tickets = tickets + archive
-
-        if not all_tickets:
-            return "Нет данных для экспорта", 404
+        # Архив читается потоково, по файлу за раз (сжатые сегменты - построчно)
+        all_tickets = itertools.chain(tickets, db.iter_archive())
 
         # Преобразуем данные для Excel
-        data = []
-        for ticket in all_tickets:
-            corrections_count = len(ticket.get('corrections_history', []))
-            analyses_count = len(ticket.get('analyses_history', []))
-
-            # Форматируем историю корректировок в текстовый вид
-            corrections_text = ""
-            if ticket.get('corrections_history'):
-                for i, correction in enumerate(ticket['corrections_history'], 1):
-                    corrections_text += f"{i}. {correction.get('timestamp', '')[:16]} - {correction.get('user', '')}: {correction.get('note', '')}\n"
-
-            # Форматируем историю анализов в текстовый вид
-            analyses_text = ""
-            if ticket.get('analyses_history'):
-                for i, analysis in enumerate(ticket['analyses_history'], 1):
-                    result = "Допущен" if analysis.get('result') == 'approved' else "Отклонен"
-                    analyses_text += f"{i}. {analysis.get('timestamp', '')[:16]} - {analysis.get('user', '')}: {result} - {analysis.get('details', '')}\n"
-
-            # Конвертируем время в МСК
-            created_at_msk = ""
-            if ticket.get('created_at'):
-                created_dt = datetime.fromisoformat(ticket['created_at'])
-                created_at_msk = format_msk_time(created_dt)
-
-            completed_at_msk = ""
-            if ticket.get('completed_at'):
-                completed_dt = datetime.fromisoformat(ticket['completed_at'])
-                completed_at_msk = format_msk_time(completed_dt)
-
-            row = {
-                'ID_тикета': ticket.get('ticket_id', ''),
-                'Дата_создания_МСК': created_at_msk,
-                'Дата_завершения_МСК': completed_at_msk,
-                'Продукт': ticket.get('product', ''),
-                'Бренд': ticket.get('brand', ''),
-                'Технология': ticket.get('technology', ''),
-                'Миксер': ticket.get('mixer', ''),
-                'Статус': format_status_ru(ticket.get('status', '')),
-                'Текущий_шаг': format_step_ru(ticket.get('current_step', '')),
-                'Пользователь': ticket.get('username', ''),
-                'Количество_корректировок': corrections_count,
-                'История_корректировок': corrections_text,
-                'Количество_анализов': analyses_count,
-                'История_анализов': analyses_text,
-                'Время_производства_мин': ticket.get('total_production_time_minutes', ''),
-                'Общее_время_производства': format_time_elapsed(ticket.get('total_production_time_minutes', 0)) if ticket.get('total_production_time_minutes') else ''
-            }
-            data.append(row)
-
-        # Создаем DataFrame
-        df = pd.DataFrame(data)
-
-        # Создаем Excel файл с временем МСК в названии
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Тикеты', index=False)
-
-            # Настраиваем ширину колонок для лучшего отображения
-            worksheet = writer.sheets['Тикеты']
-            worksheet.column_dimensions['A'].width = 15  # ID_тикета
-            worksheet.column_dimensions['B'].width = 20  # Дата_создания_МСК
-            worksheet.column_dimensions['C'].width = 20  # Дата_завершения_МСК
-            worksheet.column_dimensions['D'].width = 15  # Продукт
-            worksheet.column_dimensions['E'].width = 15  # Бренд
-            worksheet.column_dimensions['F'].width = 20  # Технология
-            worksheet.column_dimensions['G'].width = 15  # Миксер
-            worksheet.column_dimensions['H'].width = 20  # Статус
-            worksheet.column_dimensions['I'].width = 20  # Текущий_шаг
-            worksheet.column_dimensions['J'].width = 15  # Пользователь
-            worksheet.column_dimensions['K'].width = 10  # Количество_корректировок
-            worksheet.column_dimensions['L'].width = 50  # История_корректировок
-            worksheet.column_dimensions['M'].width = 10  # Количество_анализов
-            worksheet.column_dimensions['N'].width = 50  # История_анализов
-            worksheet.column_dimensions['O'].width = 15  # Время_производства_мин
-            worksheet.column_dimensions['P'].width = 20  # Общее_время_производства
-
-        output.seek(0)
+        def rows():
+            for ticket in all_tickets:
+                corrections_count = len(ticket.get('corrections_history', []))
+                analyses_count = len(ticket.get('analyses_history', []))
+
+                # Форматируем историю корректировок в текстовый вид
+                corrections_text = ""
+                if ticket.get('corrections_history'):
+                    for i, correction in enumerate(ticket['corrections_history'], 1):
+                        corrections_text += f"{i}. {correction.get('timestamp', '')[:16]} - {correction.get('user', '')}: {correction.get('note', '')}\n"
+
+                # Форматируем историю анализов в текстовый вид
+                analyses_text = ""
+                if ticket.get('analyses_history'):
+                    for i, analysis in enumerate(ticket['analyses_history'], 1):
+                        result = "Допущен" if analysis.get('result') == 'approved' else "Отклонен"
+                        analyses_text += f"{i}. {analysis.get('timestamp', '')[:16]} - {analysis.get('user', '')}: {result} - {analysis.get('details', '')}\n"
+
+                # Конвертируем время в МСК
+                created_at_msk = ""
+                if ticket.get('created_at'):
+                    created_dt = datetime.fromisoformat(ticket['created_at'])
+                    created_at_msk = format_msk_time(created_dt)
+
+                completed_at_msk = ""
+                if ticket.get('completed_at'):
+                    completed_dt = datetime.fromisoformat(ticket['completed_at'])
+                    completed_at_msk = format_msk_time(completed_dt)
+
+                row = {
+                    'ID_тикета': ticket.get('ticket_id', ''),
+                    'Дата_создания_МСК': created_at_msk,
+                    'Дата_завершения_МСК': completed_at_msk,
+                    'Продукт': ticket.get('product', ''),
+                    'Бренд': ticket.get('brand', ''),
+                    'Технология': ticket.get('technology', ''),
+                    'Миксер': ticket.get('mixer', ''),
+                    'Статус': format_status_ru(ticket.get('status', '')),
+                    'Текущий_шаг': format_step_ru(ticket.get('current_step', '')),
+                    'Пользователь': ticket.get('username', ''),
+                    'Количество_корректировок': corrections_count,
+                    'История_корректировок': corrections_text,
+                    'Количество_анализов': analyses_count,
+                    'История_анализов': analyses_text,
+                    'Время_производства_мин': ticket.get('total_production_time_minutes', ''),
+                    'Общее_время_производства': format_time_elapsed(ticket.get('total_production_time_minutes', 0)) if ticket.get('total_production_time_minutes') else ''
+                }
+                yield row
+
+        # Строки пишутся в файл по мере чтения архива
+        output, _ = write_rows(rows(), EXPORT_COLUMN_WIDTHS)
+        if output is None:
+            return "Нет данных для экспорта", 404
 
         # Используем время МСК для названия файла
         msk_now = get_msk_time()
@@ -331,11 +606,12 @@ def clear_tickets():
     try:
         password = request.form.get('password', '')
 
-        if password != '654321':
+        if password != ADMIN_PASSWORD:
             return jsonify({'success': False, 'message': 'Неверный пароль'})
 
         # Очищаем базу
-        db._save_tickets([])
+        db.clear_tickets()
+        mixer_utilization.clear()
 
         print("База тикетов очищена через веб-интерфейс")
         return jsonify({'success': True, 'message': 'Все тикеты успешно удалены'})
@@ -344,31 +620,75 @@ def clear_tickets():
         print(f"Ошибка при очистке тикетов: {e}")
         return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
 
-@app.route('/admin/backup', methods=['POST'])
-def backup_tickets():
-    """Создание резервной копии"""
+@app.route('/debug/profile', methods=['GET', 'POST'])
+def debug_profile():
+    """Профили маршрутов и обработчиков бота (по паролю, как и включение профилирования)"""
     try:
-        tickets = db._load_tickets()
-        archive = db._load_archive()
-        backup_data = {
-            'backup_time': datetime.now().isoformat(),
-            'active_records': len(tickets),
-            'archive_records': len(archive),
-            'active_data': tickets,
-            'archive_data': archive
-        }
+        target = request.values.get('target') or None
+        password = request.form.get('password', '')
+        if password != ADMIN_PASSWORD:
+            return render_template('profile.html', authorized=False, target=target,
+                                   wrong_password=request.method == 'POST')
+        routes = sorted(
+            f"route:{rule.endpoint}" for rule in app.url_map.iter_rules()
+            if rule.endpoint not in ('static', 'debug_profile', 'arm_profile')
+        )
+        return render_template('profile.html',
+                             authorized=True,
+                             password=password,
+                             target=target,
+                             routes=routes,
+                             modes=MODES,
+                             armed=PROFILER.armed(),
+                             profiles=PROFILER.list_profiles(target)[:50],
+                             top=PROFILER.top_functions(target))
+
+    except Exception as e:
+        print(f"Ошибка в debug_profile: {e}")
+        return f"Ошибка: {str(e)}", 500
 
-        backup_filename = f'backup_tickets_{datetime.now().strftime("%Y-%m-%d_%H-%M")}.json'
-        backup_path = os.path.join(os.path.dirname(__file__), backup_filename)
+@app.route('/debug/profile/arm', methods=['POST'])
+def arm_profile():
+    """Включение профилирования следующих N запросов или вызовов обработчика"""
+    try:
+        if request.form.get('password', '') != ADMIN_PASSWORD:
+            return jsonify({'success': False, 'message': 'Неверный пароль'})
 
-        with open(backup_path, 'w', encoding='utf-8') as f:
-            json.dump(backup_data, f, ensure_ascii=False, indent=2)
+        target = request.form.get('target', '').strip()
+        if not target.startswith(('route:', 'handler:')):
+            return jsonify({'success': False, 'message': 'Цель должна начинаться с route: или handler:'})
+        count = int(request.form.get('count', 1))
+        mode = request.form.get('mode', 'cprofile')
+        PROFILER.arm(target, count, mode)
 
-        return jsonify({'success': True, 'message': f'Резервная копия создана: {backup_filename}'})
+        if count > 0:
+            return jsonify({'success': True, 'message': f'Профилирование {target} включено на {count} вызов(ов)'})
+        return jsonify({'success': True, 'message': f'Профилирование {target} выключено'})
 
-    except Exception as e:
+    except ValueError as e:
         return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
 
+@app.route('/admin/backup', methods=['POST'])
+def backup_tickets():
+    """Запуск резервного копирования в фоне (новые данные дописываются к прошлым копиям)"""
+    if backups.create_async():
+        return jsonify({'success': True, 'message': 'Резервное копирование запущено'})
+    return jsonify({'success': True, 'message': 'Резервное копирование уже выполняется'})
+
+@app.route('/admin/backup/status')
+def backup_status():
+    result = backups.last_result
+    if backups.running or result is None:
+        return jsonify({'running': backups.running})
+    if not result['success']:
+        return jsonify({'running': False, 'success': False, 'message': f"Ошибка: {result['error']}"})
+    return jsonify({
+        'running': False,
+        'success': True,
+        'message': (f"Резервная копия создана: {result['id']}, новых данных {result['new_bytes'] / 1024:.1f} КБ "
+                    f"из {result['total_bytes'] / 1024:.1f} КБ, удалено старых копий: {result['pruned']}"),
+    })
+
 @app.route('/admin/close_ticket/<ticket_id>', methods=['POST'])
 def close_ticket(ticket_id):
     """Принудительное закрытие тикета"""
@@ -388,6 +708,29 @@ def close_ticket(ticket_id):
     except Exception as e:
         return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'})
 
+def telegram_webhook():
+    """Пересылает апдейты Telegram локальному webhook-приемнику бота"""
+    forward = urllib.request.Request(
+        f"http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}",
+        data=request.get_data(),
+        headers={
+            'Content-Type': 'application/json',
+            'X-Telegram-Bot-Api-Secret-Token': request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        },
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(forward, timeout=5) as response:
+            return Response(response.read(), status=response.status)
+    except urllib.error.HTTPError as e:
+        return Response(e.read(), status=e.code)
+    except urllib.error.URLError:
+        return Response("Бот недоступен", status=503)
+
+# Пересылка апдейтов нужна (и открыта снаружи) только в режиме webhook
+if BOT_MODE == "webhook":
+    app.add_url_rule(WEBHOOK_PATH, view_func=telegram_webhook, methods=['POST'])
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,247 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import BACKUP_DIR, BACKUP_KEEP_LAST, BACKUP_KEEP_DAYS
+from utils import get_msk_time, parse_msk_time
+
+logger = logging.getLogger(__name__)
+
+# Границы блоков: после строки, у которой младшие биты crc32 нулевые (в среднем блок ~2048 строк)
+CHUNK_MASK = 0x7FF
+CHUNK_MIN_BYTES = 16 * 1024
+CHUNK_MAX_BYTES = 1024 * 1024
+
+
+def read_lines(f: BinaryIO, size: int) -> Iterator[bytes]:
+    """Строки открытого файла, не дальше первых size байт"""
+    while size > 0:
+        line = f.readline(min(size, CHUNK_MAX_BYTES))
+        if not line:
+            return
+        size -= len(line)
+        yield line
+
+
+def chunks(lines: Iterable[bytes]) -> Iterator[bytes]:
+    """Делит файл (поток строк) на блоки по строкам, границы определяются содержимым
+
+    Граница ставится после строки с нужным crc32, поэтому дописанные в
+    конец файла тикеты меняют только последний блок, а вставка в середину
+    - только соседние блоки: остальные блоки совпадают с прошлой копией и
+    повторно не сохраняются. В памяти держится только текущий блок.
+    """
+    block: List[bytes] = []
+    size = 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= CHUNK_MAX_BYTES or (size >= CHUNK_MIN_BYTES and zlib.crc32(line) & CHUNK_MASK == 0):
+            yield b"".join(block)
+            block, size = [], 0
+    if block:
+        yield b"".join(block)
+
+
+class BackupStore:
+    """Инкрементальные резервные копии файлов базы
+
+    Каталог BACKUP_DIR рядом с базой:
+      objects/<sha256>.gz - блоки файлов, сжатые gzip; адрес - хэш
+        содержимого, поэтому неизменные сегменты архива и неизменные
+        части растущих файлов хранятся один раз;
+      manifests/<время>.json - копия: для каждого файла список блоков,
+        размер и sha256 целого файла для проверки при восстановлении.
+
+    Копия пишет только новые блоки. prune() оставляет BACKUP_KEEP_LAST
+    последних копий и последнюю копию каждого дня за BACKUP_KEEP_DAYS
+    суток и удаляет блоки, на которые больше не ссылается ни одна копия.
+    """
+
+    def __init__(self, db, path: Optional[str] = None):
+        self.db = db
+        self.path = path or os.path.join(os.path.dirname(os.path.abspath(db.db_path)), BACKUP_DIR)
+        self.objects_dir = os.path.join(self.path, "objects")
+        self.manifests_dir = os.path.join(self.path, "manifests")
+        self._running = threading.Lock()
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    # Создание копии
+    def _put(self, chunk: bytes) -> Tuple[str, bool]:
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = os.path.join(self.objects_dir, f"{digest}.gz")
+        if os.path.exists(path):
+            return digest, False
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(chunk, compresslevel=6))
+        os.replace(tmp_path, path)
+        return digest, True
+
+    def create(self) -> Dict[str, Any]:
+        """Создает копию текущих файлов базы; возвращает ее манифест"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        # Файлы открываются и их размеры запоминаются под блокировкой базы: файлы
+        # перезаписываются только заменой (os.replace), а дописываются в конец,
+        # поэтому открытый файл до запомненного размера - согласованная копия,
+        # и читать ее можно уже без блокировки
+        opened: Dict[str, Tuple[BinaryIO, int]] = {}
+        with self.db._lock:
+            for path in self.db.storage_files():
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    continue
+                opened[os.path.basename(path)] = (f, os.fstat(f.fileno()).st_size)
+
+        now = get_msk_time()
+        manifest = {'id': self._new_id(now), 'created_at': now.isoformat(), 'files': {}}
+        written = written_bytes = 0
+        try:
+            for name, (f, size) in opened.items():
+                digests = []
+                file_digest = hashlib.sha256()
+                for chunk in chunks(read_lines(f, size)):
+                    file_digest.update(chunk)
+                    digest, new = self._put(chunk)
+                    digests.append(digest)
+                    if new:
+                        written += 1
+                        written_bytes += os.path.getsize(os.path.join(self.objects_dir, f"{digest}.gz"))
+                manifest['files'][name] = {
+                    'size': size,
+                    'sha256': file_digest.hexdigest(),
+                    'chunks': digests,
+                }
+        finally:
+            for f, _ in opened.values():
+                f.close()
+        manifest['new_chunks'] = written
+        manifest['new_bytes'] = written_bytes
+        manifest['total_bytes'] = sum(info['size'] for info in manifest['files'].values())
+
+        tmp_path = os.path.join(self.manifests_dir, f"{manifest['id']}.json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.manifests_dir, f"{manifest['id']}.json"))
+        return manifest
+
+    def _new_id(self, now: datetime) -> str:
+        """Id копии: время с микросекундами (порядок имен - порядок копий), при совпадении - суффикс"""
+        base = now.strftime('%Y-%m-%d_%H-%M-%S_%f')
+        backup_id, n = base, 1
+        while os.path.exists(os.path.join(self.manifests_dir, f"{backup_id}.json")):
+            backup_id, n = f"{base}-{n}", n + 1
+        return backup_id
+
+    def create_async(self) -> bool:
+        """Создает копию и чистит старые в фоновом потоке; False - копия уже создается"""
+        if not self._running.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                manifest = self.create()
+                removed = self.prune()
+                self.last_result = {'success': True, 'id': manifest['id'], 'new_bytes': manifest['new_bytes'],
+                                    'total_bytes': manifest['total_bytes'], 'pruned': removed}
+                logger.info(f"Резервная копия {manifest['id']}: новых данных {manifest['new_bytes']} байт")
+            except Exception as e:
+                self.last_result = {'success': False, 'error': str(e)}
+                logger.error(f"Ошибка резервного копирования: {e}")
+            finally:
+                self._running.release()
+
+        self.last_result = None
+        threading.Thread(target=run, name="backup", daemon=True).start()
+        return True
+
+    @property
+    def running(self) -> bool:
+        return self._running.locked()
+
+    # Список, очистка
+    def manifests(self) -> List[Dict[str, Any]]:
+        """Манифесты копий от старых к новым"""
+        result = []
+        try:
+            names = sorted(n for n in os.listdir(self.manifests_dir) if n.endswith('.json'))
+        except FileNotFoundError:
+            return result
+        for name in names:
+            with open(os.path.join(self.manifests_dir, name), 'r', encoding='utf-8') as f:
+                result.append(json.load(f))
+        return result
+
+    def prune(self, keep_last: int = BACKUP_KEEP_LAST, keep_days: int = BACKUP_KEEP_DAYS,
+              now: Optional[datetime] = None) -> int:
+        """Удаляет копии вне политики хранения и ненужные блоки; возвращает число удаленных копий"""
+        manifests = self.manifests()
+        now = now or get_msk_time().replace(tzinfo=None)
+        keep = {m['id'] for m in manifests[-keep_last:]} if keep_last else set()
+        daily = {}
+        for manifest in manifests:
+            created = parse_msk_time(manifest['created_at'])
+            if now - created <= timedelta(days=keep_days):
+                daily[created.date()] = manifest['id']
+        keep.update(daily.values())
+
+        removed = 0
+        for manifest in manifests:
+            if manifest['id'] not in keep:
+                os.remove(os.path.join(self.manifests_dir, f"{manifest['id']}.json"))
+                removed += 1
+        if removed:
+            used = {digest for m in manifests if m['id'] in keep
+                    for info in m['files'].values() for digest in info['chunks']}
+            for name in os.listdir(self.objects_dir):
+                if name.endswith('.gz') and name[:-3] not in used:
+                    os.remove(os.path.join(self.objects_dir, name))
+        return removed
+
+    # Восстановление
+    def restore(self, backup_id: Optional[str] = None, out_dir: Optional[str] = None) -> Dict[str, Any]:
+        """Восстанавливает копию (по умолчанию последнюю)
+
+        out_dir - каталог для восстановленных файлов; без него файлы базы
+        заменяются на месте (бот и сайт должны быть остановлены), а лишние
+        сегменты архива, которых не было в копии, удаляются.
+        """
+        manifests = {m['id']: m for m in self.manifests()}
+        if not manifests:
+            raise ValueError("Резервных копий нет")
+        manifest = manifests[backup_id] if backup_id else manifests[max(manifests)]
+        target = out_dir or os.path.dirname(os.path.abspath(self.db.db_path))
+        os.makedirs(target, exist_ok=True)
+
+        for name, info in manifest['files'].items():
+            digest = hashlib.sha256()
+            tmp_path = os.path.join(target, f"{name}.restore")
+            with open(tmp_path, 'wb') as f:
+                for chunk_digest in info['chunks']:
+                    with open(os.path.join(self.objects_dir, f"{chunk_digest}.gz"), 'rb') as chunk_file:
+                        chunk = gzip.decompress(chunk_file.read())
+                    digest.update(chunk)
+                    f.write(chunk)
+            if digest.hexdigest() != info['sha256']:
+                os.remove(tmp_path)
+                raise ValueError(f"Копия {manifest['id']} повреждена: {name}")
+            os.replace(tmp_path, os.path.join(target, name))
+
+        if out_dir is None:
+            for path in self.db.storage_files():
+                if os.path.basename(path) not in manifest['files'] and path != self.db.db_path \
+                        and path != self.db.archive_path and os.path.exists(path):
+                    os.remove(path)
+            # Производные файлы строятся заново при следующем запуске
+            for path in self.db.derived_files():
+                if os.path.exists(path):
+                    os.remove(path)
+        return manifest
@@ -0,0 +1,13 @@
+"""Нагрузочные тесты и бенчмарки производственной системы
+
+Запуск из корня репозитория, например:
+    python -m benchmarks.bot_concurrency
+"""
+from typing import List
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
@@ -0,0 +1,147 @@
+"""Задержка обработки апдейтов при одновременной работе операторов
+
+Сравнивает последовательную обработку апдейтов (поведение по умолчанию)
+с ChatOrderedUpdateProcessor. Каждый оператор в каждом раунде меняет
+статус своего тикета через transition_ticket и "отвечает" в чат;
+сетевые задержки Telegram и медленный диск имитируются паузами.
+
+    python -m benchmarks.bot_concurrency --operators 30 --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from telegram import Chat, Message, Update
+
+import bot
+from benchmarks import percentile
+from concurrency import ChatOrderedUpdateProcessor
+from database import Database, TicketVersionConflict
+
+STATUSES = ['sample_sent', 'sample_received', 'correction_required', 'awaiting_sample']
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(id=chat_id, type=Chat.PRIVATE),
+        text="benchmark"
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def make_database(workdir: str, operators: int, write_delay: float) -> Database:
+    """Создает базу с тикетом на каждого оператора и медленной записью"""
+    db = Database(os.path.join(workdir, "tickets.json"), os.path.join(workdir, "archive_tickets.json"))
+    for i in range(operators):
+        db.create_ticket({
+            'username': f'operator{i}',
+            'product': 'Гель',
+            'brand': 'AOS',
+            'technology': 'Новая технология',
+            'mixer': f'Миксер_{i + 1}'
+        })
+
+    save_tickets = db._save_tickets
+
+    def slow_save(tickets):
+        time.sleep(write_delay)
+        save_tickets(tickets)
+
+    db._save_tickets = slow_save
+    return db
+
+
+async def operator_step(chat_id: int, round_no: int, send_delay: float, stats: dict) -> None:
+    """Один шаг оператора: чтение тикета, переход состояния, ответ в чат"""
+    ticket_id = f"TK{chat_id + 1:04d}"
+    ticket = await asyncio.to_thread(bot.db.get_ticket, ticket_id)
+    try:
+        await bot.transition_ticket(ticket, {
+            'status': STATUSES[round_no % len(STATUSES)],
+            'action': 'benchmark_step',
+            'username': f'operator{chat_id}'
+        })
+    except TicketVersionConflict:
+        stats['conflicts'] += 1
+
+    # Первый оператор в первом раунде выгружает Excel - самая тяжелая команда
+    if chat_id == 0 and round_no == 0:
+        await asyncio.to_thread(bot.build_excel_export)
+
+    await asyncio.sleep(send_delay)
+
+
+async def run_mode(concurrent: bool, args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        bot.db = make_database(workdir, args.operators, args.write_ms / 1000)
+        processor = ChatOrderedUpdateProcessor(args.max_concurrent if concurrent else 1)
+        stats = {'conflicts': 0}
+        latencies = []
+        update_id = 0
+
+        started = time.perf_counter()
+        for round_no in range(args.rounds):
+            submitted = time.perf_counter()
+
+            async def one(chat_id: int, update: Update) -> float:
+                step = operator_step(chat_id, round_no, args.send_ms / 1000, stats)
+                await processor.process_update(update, step)
+                return time.perf_counter() - submitted
+
+            updates = []
+            for chat_id in range(args.operators):
+                update_id += 1
+                updates.append((chat_id, make_update(update_id, chat_id)))
+
+            if concurrent:
+                latencies += await asyncio.gather(*(one(c, u) for c, u in updates))
+            else:
+                for chat_id, update in updates:
+                    latencies.append(await one(chat_id, update))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'mode': 'concurrent' if concurrent else 'sequential',
+        'updates': len(latencies),
+        'conflicts': stats['conflicts'],
+        'throughput_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(max(latencies) * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operators", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--send-ms", type=float, default=80, help="имитация ответа Telegram API")
+    parser.add_argument("--write-ms", type=float, default=5, help="имитация медленной записи на диск")
+    parser.add_argument("--max-concurrent", type=int, default=64)
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run_mode(False, args)), asyncio.run(run_mode(True, args))]
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Операторов: {args.operators}, раундов: {args.rounds}")
+    for r in results:
+        print(
+            f"{r['mode']:>10}: p50 {r['p50_ms']} мс | p95 {r['p95_ms']} мс | "
+            f"p99 {r['p99_ms']} мс | max {r['max_ms']} мс | "
+            f"{r['throughput_per_s']} апд/с | конфликтов {r['conflicts']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
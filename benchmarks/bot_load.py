@@ -0,0 +1,280 @@
+"""Сквозная нагрузка на бота: операторы проходят весь цикл замеса
+
+Поднимает локальный Bot API (benchmarks.fake_telegram) и бота из bot.py
+с рабочими файлами во временном каталоге. Каждый оператор в своем чате
+проходит разговор целиком: новый замес на своем миксере -> проба в
+лабораторию -> прием пробы -> (корректировка и повторная проба) ->
+допуск с показателями -> откачка. Операторы работают одновременно.
+
+Замеряются задержка "апдейт -> ответ бота" по шагам разговора и
+поток сообщений в группу (GROUP_ID).
+
+    python -m benchmarks.bot_load --operators 14 --cycles 3 --correction-rate 0.3
+
+С уже запущенным ботом (BOT_API_BASE_URL = "http://127.0.0.1:8081" в config.py):
+    python -m benchmarks.bot_load --external-bot --port 8081
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from benchmarks import percentile
+from benchmarks.fake_telegram import FakeTelegramServer, keyboard_buttons
+from config import BRANDS, GROUP_ID, PRODUCT_MIXERS
+
+FIRST_CHAT_ID = 10_000
+CORRECTION_NOTES = ["Добавить загуститель 2 кг", "pH выше нормы, добавить лимонную кислоту"]
+
+
+class StepFailed(Exception):
+    pass
+
+
+def mixer_plans() -> List[Tuple[str, str, str]]:
+    """(миксер, продукт, технология) для каждого миксера, доступного в боте"""
+    plans = []
+    for mixer in sorted({m for mixers in PRODUCT_MIXERS.values() for m in mixers}):
+        technology = "Старая технология" if mixer <= 8 else "Новая технология"
+        for product, mixers in PRODUCT_MIXERS.items():
+            if mixer not in mixers:
+                continue
+            if (product, technology) in (("Посуда", "Новая технология"), ("АШ", "Старая технология")):
+                continue
+            plans.append((f"Миксер_{mixer}", product, technology))
+            break
+    return plans
+
+
+class Operator:
+    """Один оператор: свой чат, свой миксер"""
+
+    def __init__(self, server: FakeTelegramServer, chat_id: int, plan: Tuple[str, str, str],
+                 args, latencies: Dict[str, List[float]], rng: random.Random):
+        self.server = server
+        self.chat_id = chat_id
+        self.mixer, self.product, self.technology = plan
+        self.args = args
+        self.latencies = latencies
+        self.rng = rng
+        self.username = f"operator{chat_id}"
+
+    async def say(self, text: str, expect: str, step: str) -> dict:
+        """Отправляет сообщение и ждет ответ, содержащий expect"""
+        if self.args.think_ms:
+            await asyncio.sleep(self.rng.uniform(0, self.args.think_ms / 1000))
+        reply = self.server.wait_message(self.chat_id, expect)
+        started = time.perf_counter()
+        await self.server.push_text(self.chat_id, text, self.username)
+        try:
+            entry = await asyncio.wait_for(reply, self.args.timeout)
+        except asyncio.TimeoutError:
+            last = self.server.messages_to(self.chat_id)[-1:]
+            last_text = last[0]['message'].get('text', '')[:80] if last else ''
+            raise StepFailed(f"{self.username}: нет ответа '{expect}' на '{text}' (последний ответ: {last_text!r})")
+        self.latencies[step].append(entry['at'] - started)
+        return entry
+
+    async def pick_ticket(self, entry: dict, ticket_id: str, expect: str, step: str) -> dict:
+        button = next((b for b in keyboard_buttons(entry) if ticket_id in b), None)
+        if button is None:
+            raise StepFailed(f"{self.username}: тикета {ticket_id} нет в списке")
+        return await self.say(button, expect, step)
+
+    async def production_action(self, ticket_id: str, action: str, step: str, in_menu: bool = False) -> None:
+        if not in_menu:
+            await self.say("🏭 Производство", "Раздел Производства", "menu")
+        entry = await self.say("🔧 Выполнить действия", "Выберите тикет", "ticket_list")
+        await self.pick_ticket(entry, ticket_id, "Выберите действие", "ticket_select")
+        await self.say(action, "Выберите раздел", step)
+
+    async def lab_open(self, ticket_id: str, expect: str) -> None:
+        await self.say("🔬 Лаборатория", "Раздел Лаборатории", "menu")
+        entry = await self.say("🔧 Выполнить действия", "Выберите тикет", "ticket_list")
+        await self.pick_ticket(entry, ticket_id, expect, "ticket_select")
+
+    async def cycle(self) -> None:
+        """Полный цикл одного замеса"""
+        await self.say("/start", "Выберите раздел", "start")
+        await self.say("🏭 Производство", "Раздел Производства", "menu")
+        await self.say("🆕 Новый замес", "Выберите продукт", "new_batch")
+        await self.say(self.product, "Выберите бренд", "new_batch")
+        await self.say(self.rng.choice(BRANDS), "Выберите технологию", "new_batch")
+        await self.say(self.technology, "Выберите миксер", "new_batch")
+        await self.say(self.mixer, "Подтвердите создание", "new_batch")
+        entry = await self.say("✅ Старт", "создан!", "create_ticket")
+        ticket_id = re.search(r"(TK\d+)", entry['message']['text']).group(1)
+
+        corrections = 1 if self.rng.random() < self.args.correction_rate else 0
+        for loop in range(corrections + 1):
+            # После создания тикета оператор остается в разделе Производства
+            await self.production_action(ticket_id, "📤 Проба передана в лабораторию", "sample_sent", in_menu=loop == 0)
+            await self.lab_open(ticket_id, "Подтвердите прием")
+            await self.say("✅ Принято в анализ", "Выберите раздел", "sample_received")
+            await self.lab_open(ticket_id, "Выберите результат")
+            if loop < corrections:
+                await self.say("⚠️ Корректировка", "Укажите необходимую корректировку", "correction")
+                await self.say(self.rng.choice(CORRECTION_NOTES), "Выберите раздел", "correction")
+
+        await self.say("✅ Допущен", "введите показатели", "approval")
+        await self.say("pH 6.8, вязкость в норме", "Выберите раздел", "approval")
+        await self.production_action(ticket_id, "✅ Миксер откачан", "discharge")
+
+    async def run(self, cycles: int, errors: List[str]) -> int:
+        done = 0
+        for _ in range(cycles):
+            try:
+                await self.cycle()
+                done += 1
+            except StepFailed as e:
+                errors.append(str(e))
+                break
+        return done
+
+
+async def run_exports(server: FakeTelegramServer, count: int, args,
+                      latencies: Dict[str, List[float]], errors: List[str]) -> None:
+    """Отдельный чат руководителя: /export раз в 2 секунды во время работы операторов"""
+    chat_id = FIRST_CHAT_ID - 1
+    for _ in range(count):
+        # Первая выгрузка - когда операторы уже создали тикеты
+        await asyncio.sleep(2)
+        reply = server.wait_message(chat_id, matches=lambda m: 'document' in m or m.get('text', '').startswith('❌'))
+        started = time.perf_counter()
+        await server.push_text(chat_id, "/export", "manager")
+        try:
+            entry = await asyncio.wait_for(reply, args.timeout)
+        except asyncio.TimeoutError:
+            errors.append("manager: нет ответа на /export")
+            break
+        if 'document' not in entry['message']:
+            errors.append(f"manager: {entry['message'].get('text', '')}")
+            break
+        latencies['export'].append(entry['at'] - started)
+
+
+async def drive(server: FakeTelegramServer, args) -> dict:
+    plans = mixer_plans()
+    operators_count = min(args.operators, len(plans))
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: List[str] = []
+    operators = [
+        Operator(server, FIRST_CHAT_ID + i, plans[i], args, latencies, random.Random(args.seed + i))
+        for i in range(operators_count)
+    ]
+
+    group_before = len(server.messages_to(GROUP_ID))
+    started = time.perf_counter()
+    tasks = [operator.run(args.cycles, errors) for operator in operators]
+    if args.exports:
+        tasks.append(run_exports(server, args.exports, args, latencies, errors))
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    group_messages = server.messages_to(GROUP_ID)[group_before:]
+    all_latencies = [value for step, values in latencies.items() if step != 'export' for value in values]
+    report = {
+        'operators': operators_count,
+        'cycles_completed': sum(results[:operators_count]),
+        'cycles_requested': operators_count * args.cycles,
+        'elapsed_s': round(elapsed, 2),
+        'updates': len(all_latencies),
+        'updates_per_s': round(len(all_latencies) / elapsed, 1) if elapsed else None,
+        'group_messages': len(group_messages),
+        'group_messages_per_s': round(len(group_messages) / elapsed, 2) if elapsed else None,
+        'latency_ms': {},
+        'api_calls': dict(server.calls),
+        'errors': errors,
+    }
+    for step, values in [('all', all_latencies)] + sorted(latencies.items()):
+        if values:
+            report['latency_ms'][step] = {
+                'count': len(values),
+                'p50': round(percentile(values, 50) * 1000, 1),
+                'p95': round(percentile(values, 95) * 1000, 1),
+                'p99': round(percentile(values, 99) * 1000, 1),
+                'max': round(max(values) * 1000, 1),
+            }
+    return report
+
+
+async def run_in_process(args) -> dict:
+    """Бот в этом же процессе, рабочие файлы во временном каталоге"""
+    server = FakeTelegramServer()
+    await server.start("127.0.0.1", args.port)
+    workdir = tempfile.mkdtemp(prefix="gms_bot_load_")
+    # bot.py создает базу и файл состояния в текущем каталоге при импорте
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(workdir)
+    import bot
+
+    application = bot.build_application("123456:LOCAL-LOAD-TEST", base_url=server.base_url)
+    try:
+        async with application:
+            await application.post_init(application)
+            await application.start()
+            await application.updater.start_polling(poll_interval=0.0, timeout=10)
+            try:
+                report = await drive(server, args)
+            finally:
+                await application.updater.stop()
+                await application.stop()
+    finally:
+        await server.stop()
+    report['workdir'] = workdir
+    return report
+
+
+async def run_external(args) -> dict:
+    """Бот запущен отдельно и ходит в этот сервер (BOT_API_BASE_URL)"""
+    server = FakeTelegramServer()
+    await server.start("127.0.0.1", args.port)
+    print(f"Ожидание бота на {server.base_url} ...")
+    try:
+        while not server.calls.get('getUpdates'):
+            await asyncio.sleep(0.2)
+        return await drive(server, args)
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operators", type=int, default=14, help="не больше числа миксеров")
+    parser.add_argument("--cycles", type=int, default=2, help="замесов на оператора")
+    parser.add_argument("--correction-rate", type=float, default=0.25)
+    parser.add_argument("--think-ms", type=float, default=0, help="пауза оператора перед сообщением (0..N мс)")
+    parser.add_argument("--exports", type=int, default=0, help="сколько раз выгрузить Excel во время теста")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=0, help="порт тестового Bot API (0 - любой)")
+    parser.add_argument("--external-bot", action="store_true", help="не запускать бота, ждать внешний")
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_external(args) if args.external_bot else run_in_process(args))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Операторов: {report['operators']}, замесов: {report['cycles_completed']}/{report['cycles_requested']}, "
+          f"время {report['elapsed_s']} с")
+    print(f"Апдейтов: {report['updates']} ({report['updates_per_s']}/с), "
+          f"сообщений в группу: {report['group_messages']} ({report['group_messages_per_s']}/с)")
+    for step, stats in report['latency_ms'].items():
+        print(f"  {step:<16} n={stats['count']:<5} p50 {stats['p50']} мс | p95 {stats['p95']} мс | "
+              f"p99 {stats['p99']} мс | max {stats['max']} мс")
+    for error in report['errors']:
+        print(f"Ошибка: {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""Локальный сервер Bot API для нагрузочных тестов бота
+
+Реализует методы, которые использует bot.py: getMe, deleteWebhook,
+getUpdates (long polling), sendMessage, sendDocument, setMyCommands,
+setChatMenuButton, а также answerCallbackQuery и editMessageText для
+постраничных списков. Токен не проверяется. Сообщения в чаты сохраняются
+в памяти, чтобы драйвер (benchmarks.bot_load) мог ждать ответы бота.
+"""
+import asyncio
+import email.parser
+import email.policy
+import itertools
+import json
+import logging
+import time
+import urllib.parse
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+BOT_USER = {'id': 100500, 'is_bot': True, 'first_name': 'GMS Bot', 'username': 'gms_local_bot'}
+
+
+class ApiError(Exception):
+    def __init__(self, code: int, description: str):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+
+def _parse_form(headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+    """Параметры запроса PTB: JSON, form-urlencoded (значения в JSON) или multipart"""
+    content_type = headers.get('content-type', '')
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+
+    fields: Dict[str, Any] = {}
+    if content_type.startswith('multipart/form-data'):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            filename = part.get_filename()
+            payload = part.get_payload(decode=True) or b''
+            if filename:
+                fields[name] = {'filename': filename, 'size': len(payload)}
+            else:
+                fields[name] = payload.decode('utf-8')
+    else:
+        fields = dict(urllib.parse.parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+
+    # PTB передает составные значения (клавиатуры, списки) JSON-строками
+    for name, value in fields.items():
+        if isinstance(value, str) and value[:1] in ('{', '['):
+            try:
+                fields[name] = json.loads(value)
+            except ValueError:
+                pass
+    return fields
+
+
+class FakeTelegramServer:
+    """Сервер Bot API в памяти
+
+    push_text() кладет сообщение пользователя в очередь getUpdates;
+    wait_message() ждет сообщение бота в чат (с фильтром по тексту).
+    Все отправленные ботом сообщения хранятся в sent с временем отправки
+    и клавиатурой: {'chat_id', 'at', 'message', 'reply_markup'}.
+    """
+
+    def __init__(self, poll_timeout_cap: float = 10.0):
+        self.poll_timeout_cap = poll_timeout_cap
+        self.sent: List[Dict[str, Any]] = []
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.commands: List[Dict[str, Any]] = []
+        self._updates: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._updates_changed = asyncio.Condition()
+        self._chat_waiters: Dict[int, List[Tuple[Callable[[Dict[str, Any]], bool], asyncio.Future]]] = defaultdict(list)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.methods = {
+            'getMe': self._get_me,
+            'deleteWebhook': self._true,
+            'getUpdates': self._get_updates,
+            'sendMessage': self._send_message,
+            'sendDocument': self._send_document,
+            'setMyCommands': self._set_my_commands,
+            'setChatMenuButton': self._true,
+            'answerCallbackQuery': self._true,
+            'editMessageText': self._edit_message_text,
+        }
+
+    # Сервер
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"Тестовый Bot API слушает {self.base_url}")
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    @property
+    def base_url(self) -> str:
+        host = self._server.sockets[0].getsockname()[0]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """HTTP/1.1 с keep-alive: httpx держит пул соединений"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                lines = head.decode('latin-1').split("\r\n")
+                _, target, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', '0'))
+                if length > MAX_BODY_SIZE:
+                    return
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self._dispatch(target, headers, body)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    return
+        except asyncio.CancelledError:
+            # Остановка сервера во время long polling
+            return
+        finally:
+            writer.close()
+
+    async def _dispatch(self, target: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, Any]]:
+        # /bot<token>/<method>
+        path = target.split("?", 1)[0].strip("/").split("/")
+        if len(path) != 2 or not path[0].startswith("bot"):
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+        method = path[1]
+        self.calls[method] += 1
+        handler = self.methods.get(method)
+        if handler is None:
+            return 404, {'ok': False, 'error_code': 404, 'description': f'Not Found: method {method} not found'}
+        try:
+            result = await handler(_parse_form(headers, body))
+        except ApiError as e:
+            return e.code, {'ok': False, 'error_code': e.code, 'description': e.description}
+        except (KeyError, ValueError, TypeError) as e:
+            return 400, {'ok': False, 'error_code': 400, 'description': f'Bad Request: {e}'}
+        return 200, {'ok': True, 'result': result}
+
+    # Методы Bot API
+    async def _true(self, params: Dict[str, Any]) -> bool:
+        return True
+
+    async def _get_me(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(BOT_USER, can_join_groups=True, can_read_all_group_messages=False,
+                    supports_inline_queries=False)
+
+    async def _set_my_commands(self, params: Dict[str, Any]) -> bool:
+        self.commands = params.get('commands', [])
+        return True
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = min(float(params.get('timeout') or 0), self.poll_timeout_cap)
+
+        async with self._updates_changed:
+            # Подтвержденные (update_id < offset) апдейты больше не нужны
+            if offset:
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            if not self._updates and timeout > 0:
+                try:
+                    await asyncio.wait_for(self._updates_changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self._updates[:limit]
+
+    def _record(self, chat_id: int, message: Dict[str, Any], reply_markup: Any = None) -> Dict[str, Any]:
+        entry = {'chat_id': chat_id, 'at': time.perf_counter(), 'message': message, 'reply_markup': reply_markup}
+        self.sent.append(entry)
+        waiters = self._chat_waiters.get(chat_id, [])
+        for waiter in list(waiters):
+            matches, future = waiter
+            if not future.done() and matches(message):
+                future.set_result(entry)
+                waiters.remove(waiter)
+        return message
+
+    def _message(self, chat_id: int, **fields) -> Dict[str, Any]:
+        chat_type = 'private' if chat_id > 0 else 'group'
+        return dict({
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': chat_type, 'title': 'Производство'} if chat_type == 'group'
+                    else {'id': chat_id, 'type': chat_type, 'first_name': f'user{chat_id}'},
+            'from': BOT_USER,
+        }, **fields)
+
+    async def _send_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params['chat_id'])
+        text = params['text']
+        if not text or len(text) > 4096:
+            raise ApiError(400, 'Bad Request: message is too long' if text else 'Bad Request: message text is empty')
+        fields = {'text': text}
+        if isinstance(params.get('reply_markup'), dict) and 'inline_keyboard' in params['reply_markup']:
+            fields['reply_markup'] = params['reply_markup']
+        return self._record(chat_id, self._message(chat_id, **fields), params.get('reply_markup'))
+
+    async def _send_document(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params['chat_id'])
+        document = params.get('document') or {}
+        file_id = f"file{next(self._message_ids)}"
+        message = self._message(chat_id, document={
+            'file_id': file_id,
+            'file_unique_id': file_id,
+            'file_name': document.get('filename', 'document'),
+            'file_size': document.get('size', 0),
+        }, caption=params.get('caption', ''))
+        return self._record(chat_id, message)
+
+    async def _edit_message_text(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params['chat_id'])
+        return self._record(chat_id, self._message(chat_id, text=params['text'],
+                                                   message_id=int(params['message_id'])))
+
+    # Для драйвера
+    async def push_text(self, chat_id: int, text: str, username: str = None) -> int:
+        """Сообщение пользователя боту; возвращает update_id"""
+        update_id = next(self._update_ids)
+        message = {
+            'message_id': 1_000_000 + update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': username or f'user{chat_id}'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': username or f'user{chat_id}',
+                     'username': username or f'user{chat_id}'},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        async with self._updates_changed:
+            self._updates.append({'update_id': update_id, 'message': message})
+            self._updates_changed.notify_all()
+        return update_id
+
+    def wait_message(self, chat_id: int, contains: str = None,
+                     matches: Callable[[Dict[str, Any]], bool] = None) -> asyncio.Future:
+        """Future с записью о следующем сообщении бота в чат
+
+        contains - подстрока текста, matches - произвольная проверка сообщения.
+        """
+        def check(message: Dict[str, Any]) -> bool:
+            if contains is not None and contains not in message.get('text', ''):
+                return False
+            return matches is None or matches(message)
+        future = asyncio.get_running_loop().create_future()
+        self._chat_waiters[chat_id].append((check, future))
+        return future
+
+    def messages_to(self, chat_id: int) -> List[Dict[str, Any]]:
+        return [entry for entry in self.sent if entry['chat_id'] == chat_id]
+
+
+def keyboard_buttons(entry: Dict[str, Any]) -> List[str]:
+    """Тексты кнопок ReplyKeyboardMarkup из записи об отправленном сообщении"""
+    markup = entry.get('reply_markup') or {}
+    return [
+        button if isinstance(button, str) else button.get('text', '')
+        for row in markup.get('keyboard', [])
+        for button in row
+    ]
+
@@ -0,0 +1,256 @@
+"""Методы Database и страницы Flask на синтетических данных разного объема
+
+Для каждого размера данных генерирует tickets.json и archive_tickets.json
+(benchmarks.synthetic), затем замеряет каждый метод Database и маршруты
+/, /stats, /admin, /export/excel через тестовый клиент Flask. Каждый
+замер идет в отдельном процессе, чтобы пиковая память (RSS) относилась
+только к нему. Методы, меняющие данные, перед каждым повтором получают
+исходные файлы заново.
+
+    python -m benchmarks.storage_scaling --sizes 1000 10000 100000 --json results.json
+    python -m benchmarks.storage_scaling --sizes 1000000 --repeat 3 --only get_ticket /stats
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks import percentile
+from benchmarks.synthetic import write_dataset
+
+# Методы Database: имя -> меняет ли метод файлы
+DATABASE_METHODS = {
+    '_load_tickets': False,
+    '_load_archive': False,
+    '_save_tickets': True,
+    '_save_archive': True,
+    'create_ticket': True,
+    'create_tickets': True,
+    '_generate_ticket_id': False,
+    'is_mixer_busy': False,
+    'get_ticket': False,
+    'update_ticket': True,
+    'update_tickets': True,
+    '_move_to_archive': True,
+    'get_active_tickets': False,
+    'get_tickets_by_status': False,
+    'get_production_tickets': False,
+    'get_lab_tickets': False,
+    'get_mixer_status': False,
+    'get_tickets_between': False,
+}
+ROUTES = ['/', '/stats', '/admin', '/export/excel']
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _free_mixer(tickets: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """Свободный миксер и подходящий продукт"""
+    from config import PRODUCT_MIXERS
+    busy = {t['mixer'] for t in tickets}
+    for product, mixers in PRODUCT_MIXERS.items():
+        for mixer in mixers:
+            if f"Миксер_{mixer}" not in busy:
+                return product, f"Миксер_{mixer}"
+    raise RuntimeError("Нет свободных миксеров: уменьшите --active")
+
+
+def _new_ticket_data(product: str, mixer: str) -> Dict[str, Any]:
+    return {'username': 'benchmark', 'product': product, 'brand': 'AOS',
+            'technology': 'Новая технология', 'mixer': mixer}
+
+
+def _database_call(db, name: str) -> Callable[[], Any]:
+    """Готовит вызов метода с реалистичными аргументами (вне замера)"""
+    tickets = db._load_tickets()
+
+    if name == '_save_tickets':
+        return lambda: db._save_tickets(tickets)
+    if name == '_save_archive':
+        archive = db._load_archive()
+        return lambda: db._save_archive(archive)
+    if name == 'create_ticket':
+        product, mixer = _free_mixer(tickets)
+        return lambda: db.create_ticket(_new_ticket_data(product, mixer))
+    if name == 'create_tickets':
+        product, mixer = _free_mixer(tickets)
+        return lambda: db.create_tickets([_new_ticket_data(product, mixer)])
+    if name == 'is_mixer_busy':
+        return lambda: db.is_mixer_busy(tickets[0]['mixer'] if tickets else 'Миксер_1')
+    if name == 'get_ticket':
+        # Худший реалистичный случай: тикет из середины архива
+        archive = db._load_archive()
+        ticket_id = archive[len(archive) // 2]['ticket_id'] if archive else 'TK0001'
+        return lambda: db.get_ticket(ticket_id)
+    if name == 'get_tickets_between':
+        # Окно смены: последние 12 часов
+        from utils import get_msk_time
+        now = get_msk_time().replace(tzinfo=None)
+        db.get_tickets_between(now, now)  # индекс строится до замера
+        return lambda: db.get_tickets_between(now - timedelta(hours=12), now)
+    if name == 'get_tickets_by_status':
+        return lambda: db.get_tickets_by_status('sample_sent')
+    if name in ('update_ticket', 'update_tickets'):
+        ticket = tickets[0]
+        updates = {'status': 'sample_sent', 'current_step': 'awaiting_lab_reception',
+                   'action': 'sample_sent_to_lab', 'username': 'benchmark'}
+        if name == 'update_ticket':
+            return lambda: db.update_ticket(ticket['ticket_id'], updates, expected_version=ticket['version'])
+        return lambda: db.update_tickets({ticket['ticket_id']: updates})
+    if name == '_move_to_archive':
+        # Через откачку, как это делает бот
+        ticket = next(t for t in tickets if t['status'] == 'awaiting_discharge')
+        return lambda: db.update_ticket(ticket['ticket_id'], {
+            'status': 'completed', 'current_step': 'completed',
+            'action': 'mixer_discharged', 'username': 'benchmark'
+        })
+    return getattr(db, name)
+
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Один замер в отдельном процессе"""
+    workdir = tempfile.mkdtemp(prefix="gms_bench_")
+    try:
+        # app.py создает Database() в текущем каталоге при импорте
+        os.chdir(workdir)
+        sys.path.insert(0, case['repo'])
+        from database import Database
+
+        db_path = os.path.join(workdir, "tickets.json")
+        archive_path = os.path.join(workdir, "archive_tickets.json")
+
+        def restore() -> None:
+            shutil.copyfile(case['db_path'], db_path)
+            shutil.copyfile(case['archive_path'], archive_path)
+
+        restore()
+        db = Database(db_path, archive_path)
+
+        if case['kind'] == 'route':
+            import app as web
+            web.db = db
+            client = web.app.test_client()
+
+            def call():
+                response = client.get(case['target'])
+                if response.status_code != 200:
+                    raise RuntimeError(f"{case['target']}: HTTP {response.status_code}")
+        else:
+            call = _database_call(db, case['target'])
+
+        rss_before = _peak_rss_mb()
+        timings = []
+        for _ in range(case['repeat']):
+            if case['mutates']:
+                restore()
+                db = Database(db_path, archive_path)
+                call = _database_call(db, case['target'])
+            started = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started)
+
+        total = sum(timings)
+        return {
+            'size': case['size'],
+            'kind': case['kind'],
+            'target': case['target'],
+            'repeat': case['repeat'],
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'mean_ms': round(total / len(timings) * 1000, 2),
+            'ops_per_s': round(len(timings) / total, 2) if total else None,
+            'tickets_per_s': round(case['size'] * len(timings) / total) if total else None,
+            'rss_before_mb': rss_before,
+            'peak_rss_mb': _peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _git_commit(repo: str) -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo,
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="количество тикетов (до 1000000)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--active", type=int, default=7, help="активных тикетов в tickets.json")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", help="только указанные методы и маршруты")
+    parser.add_argument("--json", metavar="PATH", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    targets = [('database', name) for name in DATABASE_METHODS] + [('route', path) for path in ROUTES]
+    if args.only:
+        targets = [(kind, target) for kind, target in targets if target in args.only]
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(repo),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'datasets': [],
+        'results': [],
+    }
+
+    # Каждый замер - новый процесс (spawn), чтобы пиковый RSS не копился
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix="gms_data_") as datadir:
+        for size in args.sizes:
+            started = time.perf_counter()
+            dataset = write_dataset(os.path.join(datadir, str(size)), size, args.active, args.seed)
+            dataset.update(size=size, generate_s=round(time.perf_counter() - started, 1))
+            report['datasets'].append(dataset)
+            print(f"\n== {size} тикетов: tickets.json {dataset['tickets_bytes'] / 1024:.0f} КБ, "
+                  f"archive_tickets.json {dataset['archive_bytes'] / 1024 / 1024:.1f} МБ")
+            print(f"{'цель':<24}{'p50, мс':>12}{'p95, мс':>12}{'оп/с':>10}{'тикетов/с':>14}{'RSS, МБ':>10}")
+
+            for kind, target in targets:
+                case = {
+                    'repo': repo, 'size': size, 'kind': kind, 'target': target, 'repeat': args.repeat,
+                    'mutates': DATABASE_METHODS.get(target, False),
+                    'db_path': dataset['db_path'], 'archive_path': dataset['archive_path'],
+                }
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    try:
+                        result = pool.submit(run_case, case).result()
+                    except Exception as e:
+                        result = {'size': size, 'kind': kind, 'target': target, 'error': str(e)}
+                report['results'].append(result)
+
+                if 'error' in result:
+                    print(f"{target:<24}ошибка: {result['error']}")
+                else:
+                    print(f"{target:<24}{result['p50_ms']:>12}{result['p95_ms']:>12}{result['ops_per_s']:>10}"
+                          f"{result['tickets_per_s']:>14}{result['peak_rss_mb']:>10}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""Генератор реалистичных тикетов для бенчмарков
+
+Тикеты повторяют то, что пишет бот: продукты и миксеры из PRODUCT_MIXERS,
+бренды из BRANDS, история действий, корректировки и анализы. Архивные
+тикеты проходят весь цикл (проба -> лаборатория -> корректировки ->
+допуск -> откачка) и сохраняются так же, как их сохраняет Database:
+статус до завершения, completed_at и total_production_time_minutes,
+архив - JSON Lines (по тикету в строке), tickets.json - JSON-список.
+
+Файлы пишутся потоково, поэтому можно сгенерировать миллион тикетов
+без загрузки их в память:
+    python -m benchmarks.synthetic --tickets 100000 --out /tmp/gms_data
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+from config import BRANDS, PRODUCT_MIXERS
+from database import archive_line
+from utils import format_msk_time, get_msk_time
+
+TECHNOLOGIES = ["Старая технология", "Новая технология"]
+OPERATORS = [f"operator_{i}" for i in range(1, 13)]
+LAB_USERS = ["lab_ivanova", "lab_petrova", "lab_sidorova", "lab_smirnova"]
+CORRECTION_NOTES = [
+    "Добавить загуститель 2 кг",
+    "pH выше нормы, добавить лимонную кислоту",
+    "Вязкость ниже нормы, добавить соль 1,5 кг",
+    "Отдушка слабая, добавить 300 г",
+    "Цвет светлее эталона, добавить краситель",
+    "Пена нестабильная, перемешать 15 минут",
+    "Мутность, проверить температуру и перемешать",
+    "Плотность выше нормы, добавить воды 20 л",
+]
+ANALYSIS_DETAILS = [
+    "Продукт допущен в производство",
+    "Все показатели в норме",
+    "pH 6.8, вязкость в норме",
+]
+
+
+def _minutes(rng: random.Random, low: int, high: int) -> timedelta:
+    return timedelta(minutes=rng.randint(low, high), seconds=rng.randint(0, 59))
+
+
+def _event(action: str, at: datetime, user: str) -> Dict[str, Any]:
+    return {'action': action, 'timestamp': at.isoformat(), 'user': user, 'details': ''}
+
+
+def make_ticket(rng: random.Random, number: int, created_at: datetime, mixer: str = None,
+                product: str = None, stage: str = 'completed') -> Dict[str, Any]:
+    """Один тикет, доведенный до стадии stage
+
+    stage: 'production_started', 'sample_sent', 'sample_received',
+    'correction_required', 'awaiting_discharge' или 'completed' (архив).
+    """
+    product = product or rng.choice(list(PRODUCT_MIXERS))
+    mixer = mixer or f"Миксер_{rng.choice(PRODUCT_MIXERS[product])}"
+    operator = rng.choice(OPERATORS)
+    ticket = {
+        'product': product,
+        'brand': rng.choice(BRANDS),
+        'technology': rng.choice(TECHNOLOGIES),
+        'mixer': mixer,
+        'username': operator,
+        'ticket_id': f"TK{number:04d}",
+        'created_at': created_at.isoformat(),
+        'status': 'production_started',
+        'current_step': 'awaiting_sample',
+        'version': 1,
+        'analyses_history': [],
+        'corrections_history': [],
+        'history': [{'action': 'ticket_created', 'timestamp': created_at.isoformat(), 'user': operator}],
+    }
+
+    def apply(updates: Dict[str, Any], at: datetime) -> None:
+        ticket['history'].append(_event(updates['action'], at, updates['username']))
+        ticket['version'] += 1
+        ticket.update(updates)
+
+    if stage == 'production_started':
+        return ticket
+
+    at = created_at + _minutes(rng, 30, 80)
+    # Количество корректировок: чаще 0, иногда 1-3
+    corrections = min(3, int(rng.expovariate(1.6)))
+    if stage in ('sample_sent', 'sample_received'):
+        corrections = 0
+    elif stage == 'correction_required':
+        corrections = max(1, corrections)
+
+    for loop in range(corrections + 1):
+        apply({'status': 'sample_sent', 'current_step': 'awaiting_lab_reception',
+               'action': 'sample_sent_to_lab', 'username': operator}, at)
+        if stage == 'sample_sent':
+            return ticket
+
+        at += _minutes(rng, 2, 15)
+        lab_user = rng.choice(LAB_USERS)
+        apply({'status': 'sample_received', 'current_step': 'analysis_in_progress',
+               'action': 'sample_received_by_lab', 'username': lab_user}, at)
+        if stage == 'sample_received':
+            return ticket
+
+        at += _minutes(rng, 10, 40)
+        if loop < corrections:
+            note = rng.choice(CORRECTION_NOTES)
+            ticket['corrections_history'].append({
+                'timestamp': format_msk_time(at),
+                'user': lab_user,
+                'note': note,
+                'analysis_number': len(ticket['analyses_history']) + 1
+            })
+            apply({'status': 'correction_required', 'current_step': 'awaiting_correction',
+                   'action': 'correction_required', 'username': lab_user, 'correction_note': note}, at)
+            if stage == 'correction_required' and loop == corrections - 1:
+                return ticket
+            at += _minutes(rng, 10, 30)
+
+    details = rng.choice(ANALYSIS_DETAILS)
+    ticket['analyses_history'].append({
+        'timestamp': format_msk_time(at),
+        'user': lab_user,
+        'result': 'approved',
+        'details': details,
+        'analysis_number': len(ticket['analyses_history']) + 1
+    })
+    apply({'status': 'awaiting_discharge', 'current_step': 'awaiting_discharge',
+           'action': 'analysis_approved', 'username': lab_user, 'analysis_details': details}, at)
+    if stage == 'awaiting_discharge':
+        return ticket
+
+    # Откачка: тикет уходит в архив в прежнем статусе (как в Database._move_to_archive)
+    at += _minutes(rng, 10, 60)
+    ticket['history'].append(_event('mixer_discharged', at, operator))
+    ticket['version'] += 1
+    ticket['completed_at'] = at.isoformat()
+    ticket['total_production_time_minutes'] = int((at - created_at).total_seconds() / 60)
+    return ticket
+
+
+ACTIVE_STAGES = ['production_started', 'sample_sent', 'sample_received',
+                 'correction_required', 'awaiting_discharge']
+
+
+def generate(total: int, active: int = 7, seed: int = 42,
+             now: datetime = None) -> Tuple[List[Dict[str, Any]], Iterator[Dict[str, Any]]]:
+    """Возвращает (активные тикеты, генератор архивных тикетов)
+
+    Активных тикетов не больше, чем миксеров: на миксере один тикет.
+    Архивные тикеты идут по возрастанию created_at, последние - в
+    текущей смене, поэтому главная страница и статистика смены не пусты.
+    """
+    rng = random.Random(seed)
+    now = now or get_msk_time()
+    all_mixers = sorted({m for mixers in PRODUCT_MIXERS.values() for m in mixers})
+    active = min(active, len(all_mixers), total)
+    archived = total - active
+    # Новый замес каждые 6 минут; последний архивный создан около 4 часов назад
+    last = now - timedelta(hours=4)
+
+    def archive_iter() -> Iterator[Dict[str, Any]]:
+        for number in range(1, archived + 1):
+            created_at = last - timedelta(minutes=6 * (archived - number)) + _minutes(rng, 0, 4)
+            yield make_ticket(rng, number, created_at)
+
+    active_mixers = rng.sample(all_mixers, active)
+    active_tickets = []
+    for offset, mixer_number in enumerate(active_mixers):
+        product = rng.choice([p for p, mixers in PRODUCT_MIXERS.items() if mixer_number in mixers])
+        created_at = now - _minutes(rng, 20, 180)
+        active_tickets.append(make_ticket(
+            rng, archived + offset + 1, created_at, f"Миксер_{mixer_number}", product,
+            stage=ACTIVE_STAGES[offset % len(ACTIVE_STAGES)]
+        ))
+    return active_tickets, archive_iter()
+
+
+def write_json_list(path: str, items) -> int:
+    """Пишет список так же, как json.dump(..., indent=2), но по одному элементу
+
+    Возвращает количество записанных элементов.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for item in items:
+            text = json.dumps(item, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            f.write(('\n  ' if count == 0 else ',\n  ') + text)
+            count += 1
+        f.write('\n]' if count else ']')
+    return count
+
+
+def write_archive(path: str, items) -> int:
+    """Пишет архив построчно (JSON Lines, как Database); возвращает количество тикетов"""
+    count = 0
+    with open(path, 'wb') as f:
+        for item in items:
+            f.write(archive_line(item))
+            count += 1
+    return count
+
+
+def write_dataset(directory: str, total: int, active: int = 7, seed: int = 42) -> Dict[str, Any]:
+    """Создает tickets.json и archive_tickets.json в directory"""
+    os.makedirs(directory, exist_ok=True)
+    active_tickets, archive = generate(total, active, seed)
+    db_path = os.path.join(directory, "tickets.json")
+    archive_path = os.path.join(directory, "archive_tickets.json")
+    archived = write_archive(archive_path, archive)
+    write_json_list(db_path, active_tickets)
+    return {
+        'db_path': db_path,
+        'archive_path': archive_path,
+        'active': len(active_tickets),
+        'archived': archived,
+        'tickets_bytes': os.path.getsize(db_path),
+        'archive_bytes': os.path.getsize(archive_path),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=10000, help="всего тикетов (активные + архив)")
+    parser.add_argument("--active", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True, help="каталог для tickets.json и archive_tickets.json")
+    args = parser.parse_args()
+
+    info = write_dataset(args.out, args.tickets, args.active, args.seed)
+    print(json.dumps(info, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Локальный отправитель апдейтов в webhook бота (вместо Telegram)
+
+Без --url поднимает WebhookServer на случайном порту с собственной
+очередью и проверяет приемник целиком без сети: доставку апдейтов,
+отказ при неверном секрете и ответ 503 при переполнении очереди.
+
+С --url отправляет апдейты в уже запущенного бота (BOT_MODE = "webhook"):
+    python -m benchmarks.webhook_sender --url http://127.0.0.1:8443/telegram/webhook --secret s3cret
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.request
+from typing import List, Tuple
+
+from telegram import Bot
+
+from webhook import WebhookServer
+
+
+def make_update(update_id: int, chat_id: int, text: str = "/status") -> dict:
+    """Апдейт в формате Bot API с текстовым сообщением"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'operator{chat_id}'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}] if text.startswith('/') else []
+        }
+    }
+
+
+def post(url: str, secret: str, payload: dict) -> Tuple[int, float]:
+    """Отправляет один апдейт, возвращает (HTTP статус, время в секундах)"""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret},
+        method='POST'
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - started
+
+
+async def send_many(url: str, secret: str, count: int, chats: int) -> List[Tuple[int, float]]:
+    return await asyncio.gather(*(
+        asyncio.to_thread(post, url, secret, make_update(i + 1, 1000 + i % chats))
+        for i in range(count)
+    ))
+
+
+def summarize(results: List[Tuple[int, float]]) -> str:
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    timings = sorted(t for _, t in results)
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    return f"статусы {statuses}, p95 {p95 * 1000:.1f} мс"
+
+
+async def self_test(args) -> None:
+    queue: asyncio.Queue = asyncio.Queue()
+    server = WebhookServer(Bot("123:local"), queue, "/telegram/webhook", secret="local-secret", max_queue=args.count)
+    await server.start("127.0.0.1", 0)
+    url = f"http://127.0.0.1:{server.port}/telegram/webhook"
+    try:
+        results = await send_many(url, "local-secret", args.count, args.chats)
+        print(f"Доставка: {summarize(results)}, в очереди {queue.qsize()}")
+        assert queue.qsize() == args.count
+
+        results = await send_many(url, "wrong-secret", 5, 1)
+        print(f"Неверный секрет: {summarize(results)}")
+        assert all(status == 403 for status, _ in results)
+
+        results = await send_many(url, "local-secret", 5, 1)
+        print(f"Переполненная очередь: {summarize(results)}")
+        assert all(status == 503 for status, _ in results)
+    finally:
+        await server.stop()
+    print("OK")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="адрес webhook запущенного бота")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.url:
+        results = asyncio.run(send_many(args.url, args.secret, args.count, args.chats))
+        print(summarize(results))
+    else:
+        asyncio.run(self_test(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,37 @@
+import asyncio
+import itertools
 import logging
-import io
-import pandas as pd
+import re
+from contextlib import AsyncExitStack
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, MenuButtonCommands, BotCommand, InputFile
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, ConversationHandler,
+    Application, CommandHandler, MessageHandler, ConversationHandler, CallbackQueryHandler,
     ContextTypes, filters
 )
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 from datetime import datetime, timedelta
 
-from config import BOT_TOKEN, GROUP_ID, MSK_TIMEZONE_OFFSET
-from database import Database
+from config import (
+    BOT_TOKEN, GROUP_ID, MSK_TIMEZONE_OFFSET, BOT_MAX_CONCURRENT_UPDATES, BOT_STATE_PATH, BOT_STATE_FLUSH_INTERVAL,
+    BOT_MODE, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_MAX_QUEUE,
+    BOT_METRICS_LISTEN, BOT_METRICS_PORT, BOT_API_BASE_URL
+)
+from concurrency import ChatOrderedUpdateProcessor, KeyedLocks
+from persistence import SQLitePersistence
+from webhook import run_webhook
+from metrics import InstrumentedRequest, instrument_application_handlers, start_metrics_server, wrap_application_handlers
+from profiling import PROFILER
+from rendering import (
+    render_page, page_bounds, page_keyboard, format_active_item, format_lab_item, format_lab_deadline, format_mixer_item,
+    format_search_item, PAGE_SIZE, MIXER_STEP_LABELS, LAB_ACTION_STEP_LABELS, LAB_ANALYSIS_STEP_LABELS,
+)
+from search import SearchIndex
+from excel import write_rows, EXPORT_COLUMN_WIDTHS
+from database import Database, TicketVersionConflict, board_mixers
+from forecast import MixerForecast, ShiftCapacityForecast
+from health import StorageHealth
+from lab_queue import LabQueue
 from utils import format_ticket_message, get_current_shift, get_msk_time, format_msk_time, get_available_mixers, format_status_ru, format_step_ru, format_time_elapsed
 
 # Настройка логирования
@@ -36,10 +57,26 @@ logger = logging.getLogger(__name__)
     ANALYSIS_RESULT,
     CORRECTION_NOTE,
     CONFIRM_DISCHARGE,
-    FINAL_APPROVAL
-) = range(15)
+    FINAL_APPROVAL,
+    LAB_BATCH_SELECT,
+    BATCH_MIXER_SELECT
+) = range(17)
 
 db = Database()
+# Прогноз освобождения миксеров для порядка кнопок при выборе миксера
+mixer_forecast = MixerForecast(db)
+# Прогноз завершенных замесов до конца смены (/capacity)
+capacity_forecast = ShiftCapacityForecast(db)
+# Поиск по корректировкам и показателям анализов (/find)
+search_index = SearchIndex(db)
+# Очередь лаборатории: пробы по остатку времени до LAB_TIMEOUT
+lab_queue = LabQueue(db)
+# Замеры файлов базы; бот же выполняет их обслуживание (сжатие старых сегментов архива)
+storage_health = StorageHealth(db, source="bot", maintain=True)
+
+# Блокировки переходов состояний: по тикету и по миксеру при создании замеса
+ticket_locks = KeyedLocks()
+mixer_locks = KeyedLocks()
 
 async def post_init(application: Application) -> None:
     """Установка меню бота после инициализации"""
@@ -49,12 +86,21 @@ async def post_init(application: Application) -> None:
         BotCommand("active", "Активные тикеты"),
         BotCommand("lab", "Тикеты в лаборатории"),
         BotCommand("shift", "Статистика смены"),
+        BotCommand("capacity", "Прогноз до конца смены"),
         BotCommand("export", "Выгрузить Excel"),
+        BotCommand("find", "Поиск по корректировкам"),
         BotCommand("help", "Помощь")
     ]
     await application.bot.set_my_commands(commands)
     menu_button = MenuButtonCommands()
     await application.bot.set_chat_menu_button(menu_button=menu_button)
+    # Журнал событий для базы, которая велась до его появления (без него доска на прошлый момент пуста)
+    bootstrapped = await asyncio.to_thread(db.bootstrap_events)
+    if bootstrapped:
+        logger.info(f"Журнал событий создан по текущим данным: {bootstrapped} событий")
+    # Модель прогноза миксеров строится по архиву в фоне
+    mixer_forecast.refresh_async()
+    storage_health.start()
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начало работы с системой"""
@@ -77,13 +123,13 @@ async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
 
     if "🏭 Производство" in text:
-        keyboard = [["🆕 Новый замес", "🔧 Выполнить действия", "📊 Текущий статус"], ["🔙 Назад"]]
+        keyboard = [["🆕 Новый замес", "🔧 Выполнить действия", "📊 Текущий статус"], ["🆕 Несколько замесов"], ["🔙 Назад"]]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         await update.message.reply_text("🏭 Раздел Производства:", reply_markup=reply_markup)
         return PRODUCTION_MENU
 
     elif "🔬 Лаборатория" in text:
-        keyboard = [["🔧 Выполнить действия", "📈 Текущие анализы"], ["🔙 Назад"]]
+        keyboard = [["🔧 Выполнить действия", "📈 Текущие анализы"], ["📥 Принять несколько проб"], ["🔙 Назад"]]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         await update.message.reply_text("🔬 Раздел Лаборатории:", reply_markup=reply_markup)
         return LAB_MENU
@@ -101,10 +147,12 @@ async def production_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if "🔙 Назад" in text:
         return await start(update, context)
 
-    elif "🆕 Новый замес" in text:
+    elif "🆕 Новый замес" in text or "🆕 Несколько замесов" in text:
         # Очищаем данные о предыдущем создании тикета
         if 'ticket_created' in context.user_data:
             del context.user_data['ticket_created']
+        # Несколько замесов: после технологии выбирается сразу несколько миксеров
+        context.user_data['multi_batch'] = "🆕 Несколько замесов" in text
         
         keyboard = [["Гель", "Посуда", "АШ", "Кондиционер"], ["🔙 Назад"]]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
@@ -112,37 +160,57 @@ async def production_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return NEW_BATCH_PRODUCT
 
     elif "🔧 Выполнить действия" in text:
-        tickets = db.get_production_tickets()
-        if not tickets:
-            await update.message.reply_text("✅ Нет активных заданий для производства.")
-            return PRODUCTION_MENU
-        
-        # Показываем список тикетов для действий с русскими статусами
-        keyboard = []
-        step_map = {
-            'awaiting_sample': 'Ожид. пробу',
-            'awaiting_lab_reception': 'Ожид. лаб', 
-            'analysis_in_progress': 'Анализ',
-            'awaiting_discharge': 'Ожид. откачки',
-            'awaiting_correction': 'Ожид. исправления'
-        }
-        
-        for ticket in tickets:
-            step_text = step_map.get(ticket.get('current_step', ''), ticket.get('current_step', 'Новый'))
-            btn_text = f"🎫 {ticket['ticket_id']} - {ticket['mixer']} - {step_text}"
-            keyboard.append([btn_text])
-        keyboard.append(["🔙 Назад"])
-        
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        await update.message.reply_text("Выберите тикет для действия:", reply_markup=reply_markup)
-        context.user_data['action_tickets'] = {t['ticket_id']: t for t in tickets}
-        return ACTION_MENU
+        return await show_production_actions(update, context)
 
     elif "📊 Текущий статус" in text:
         return await show_mixer_status(update, context)
 
     return PRODUCTION_MENU
 
+async def show_production_actions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Показывает свежий список тикетов производства для выбора действия"""
+    tickets = db.get_production_tickets()
+    if not tickets:
+        await update.message.reply_text("✅ Нет активных заданий для производства.")
+        return PRODUCTION_MENU
+    
+    # Показываем список тикетов для действий с русскими статусами
+    keyboard = []
+    for ticket in tickets:
+        step_text = MIXER_STEP_LABELS.get(ticket.get('current_step', ''), ticket.get('current_step', 'Новый'))
+        btn_text = f"🎫 {ticket['ticket_id']} - {ticket['mixer']} - {step_text}"
+        keyboard.append([btn_text])
+    keyboard.append(["🔙 Назад"])
+    
+    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    await update.message.reply_text("Выберите тикет для действия:", reply_markup=reply_markup)
+    context.user_data['action_tickets'] = {t['ticket_id']: t for t in tickets}
+    return ACTION_MENU
+
+async def transition_ticket(ticket: dict, updates: dict) -> dict:
+    """Применяет переход состояния тикета под блокировкой этого тикета
+
+    Запись выполняется в отдельном потоке, чтобы медленный диск не задерживал
+    апдейты других пользователей. Возвращает обновленный тикет.
+    """
+    async with ticket_locks.hold(ticket['ticket_id']):
+        await asyncio.to_thread(
+            db.update_ticket, ticket['ticket_id'], updates,
+            expected_version=ticket.get('version', 0)
+        )
+        return await asyncio.to_thread(db.get_ticket, ticket['ticket_id'])
+
+async def report_version_conflict(update: Update, context: ContextTypes.DEFAULT_TYPE, error: TicketVersionConflict) -> None:
+    """Сообщает, что тикет успели изменить, и сбрасывает устаревшие копии"""
+    logger.info(f"Конфликт версий: {error}")
+    for key in ['current_ticket', 'action_tickets', 'lab_tickets', 'awaiting_final_approval']:
+        if key in context.user_data:
+            del context.user_data[key]
+    await update.message.reply_text(
+        f"⚠️ Тикет {error.ticket_id} уже изменен другим пользователем.\n"
+        f"Список обновлен, выберите тикет заново."
+    )
+
 # Процесс создания нового тикета
 async def new_batch_product(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Выбор продукта"""
@@ -195,10 +263,26 @@ async def new_batch_technology(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("❌ Для выбранного продукта и технологии нет доступных миксеров. Выберите другую технологию:")
         return NEW_BATCH_TECHNOLOGY
 
+    if context.user_data.get('multi_batch'):
+        return await show_batch_mixer_selection(update, context)
+
+    return await show_mixer_selection(update, context)
+
+async def show_mixer_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Клавиатура миксеров: сначала свободные, затем занятые по прогнозу освобождения"""
+    available_mixers = get_available_mixers(context.user_data['product'], context.user_data['technology'])
+    active_tickets = await asyncio.to_thread(db.get_active_tickets)
+    now = get_msk_time().replace(tzinfo=None)
+    ranked = await asyncio.to_thread(mixer_forecast.rank_mixers, available_mixers, active_tickets, now)
+    # Модель обновляется в фоне и будет готова к следующему выбору
+    mixer_forecast.refresh_async()
+
     # Создаем клавиатуру с миксерами
     keyboard = []
     row = []
-    for i, mixer in enumerate(available_mixers):
+    for i, (mixer, minutes, busy) in enumerate(ranked):
+        if busy:
+            mixer = f"{mixer} ⏳ ~{format_time_elapsed(minutes)}" if minutes is not None else f"{mixer} ⏳"
         row.append(mixer)
         if (i + 1) % 3 == 0:  # 3 кнопки в строке
             keyboard.append(row)
@@ -208,7 +292,8 @@ async def new_batch_technology(update: Update, context: ContextTypes.DEFAULT_TYP
     keyboard.append(["🔙 Назад"])
 
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    await update.message.reply_text("Выберите миксер:", reply_markup=reply_markup)
+    await update.message.reply_text("Выберите миксер (⏳ - занят, примерное время до освобождения):",
+                                    reply_markup=reply_markup)
 
     return NEW_BATCH_MIXER
 
@@ -219,7 +304,15 @@ async def new_batch_mixer(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if "🔙 Назад" in text:
         return await new_batch_technology(update, context)
 
-    context.user_data['mixer'] = text
+    # На кнопке занятого миксера есть прогноз: "Миксер_10 ⏳ ~35 мин"
+    match = re.search(r"Миксер_\d+", text)
+    if not match:
+        return await show_mixer_selection(update, context)
+    if db.is_mixer_busy(match.group()):
+        await update.message.reply_text(f"❌ Миксер {match.group()} сейчас занят! Выберите другой миксер.")
+        return await show_mixer_selection(update, context)
+
+    context.user_data['mixer'] = match.group()
 
     # Подтверждение создания тикета
     product = context.user_data['product']
@@ -253,23 +346,24 @@ async def confirm_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         try:
             print(f"DEBUG: Создание тикета с данными: {context.user_data}")
 
-            # Проверяем занятость миксера
             mixer = context.user_data['mixer']
-            if db.is_mixer_busy(mixer):
-                await update.message.reply_text(f"❌ Миксер {mixer} сейчас занят! Выберите другой миксер.")
-                return await new_batch_mixer(update, context)
-
-            # Создаем тикет
-            ticket_data = {
-                'username': context.user_data['username'],
-                'product': context.user_data['product'],
-                'brand': context.user_data['brand'],
-                'technology': context.user_data['technology'],
-                'mixer': context.user_data['mixer']
-            }
+            async with mixer_locks.hold(mixer):
+                # Проверяем занятость миксера
+                if db.is_mixer_busy(mixer):
+                    await update.message.reply_text(f"❌ Миксер {mixer} сейчас занят! Выберите другой миксер.")
+                    return await new_batch_mixer(update, context)
+
+                # Создаем тикет
+                ticket_data = {
+                    'username': context.user_data['username'],
+                    'product': context.user_data['product'],
+                    'brand': context.user_data['brand'],
+                    'technology': context.user_data['technology'],
+                    'mixer': context.user_data['mixer']
+                }
 
-            ticket_id = db.create_ticket(ticket_data)
-            print(f"DEBUG: Тикет создан: {ticket_id}")
+                ticket_id = await asyncio.to_thread(db.create_ticket, ticket_data)
+                print(f"DEBUG: Тикет создан: {ticket_id}")
 
             # Отправляем уведомление в группу
             ticket = db.get_ticket(ticket_id)
@@ -299,6 +393,203 @@ async def confirm_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
     return CONFIRM_START
 
+# Групповые операции: выбор нескольких элементов кнопками-переключателями
+def selection_keyboard(options: dict, selected: list, confirm_text: str) -> ReplyKeyboardMarkup:
+    """Клавиатура с отметками выбранных элементов и кнопкой подтверждения"""
+    keyboard = [[f"{'☑️' if key in selected else '⬜'} {label}"] for label, key in options.items()]
+    keyboard.append([f"{confirm_text} ({len(selected)})"])
+    keyboard.append(["🔙 Назад"])
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+def toggle_selection(context: ContextTypes.DEFAULT_TYPE, text: str) -> bool:
+    """Переключает отметку элемента по тексту нажатой кнопки"""
+    label = text.split(" ", 1)[1] if " " in text else text
+    key = context.user_data.get('batch_options', {}).get(label)
+    if key is None:
+        return False
+    selected = context.user_data.setdefault('batch_selected', [])
+    if key in selected:
+        selected.remove(key)
+    else:
+        selected.append(key)
+    return True
+
+def clear_batch_selection(context: ContextTypes.DEFAULT_TYPE) -> None:
+    for key in ['batch_options', 'batch_selected', 'batch_tickets', 'multi_batch']:
+        if key in context.user_data:
+            del context.user_data[key]
+
+async def transition_tickets(tickets: list, updates: dict) -> list:
+    """Применяет один переход к нескольким тикетам одной записью в файл
+
+    Возвращает ID обновленных тикетов: тикеты, которых уже нет среди
+    активных, пропускаются.
+    """
+    async with AsyncExitStack() as stack:
+        # Блокировки берутся в одном порядке, чтобы два оператора не ждали друг друга
+        for ticket in sorted(tickets, key=lambda t: t['ticket_id']):
+            await stack.enter_async_context(ticket_locks.hold(ticket['ticket_id']))
+        return await asyncio.to_thread(
+            db.update_tickets,
+            {t['ticket_id']: dict(updates) for t in tickets},
+            {t['ticket_id']: t.get('version', 0) for t in tickets}
+        )
+
+async def show_batch_mixer_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Выбор нескольких свободных миксеров для запуска замесов"""
+    available_mixers = get_available_mixers(context.user_data['product'], context.user_data['technology'])
+    mixer_status = db.get_mixer_status()
+    free_mixers = [m for m in available_mixers if mixer_status.get(m, {}).get('status') == 'free']
+
+    if not free_mixers:
+        await update.message.reply_text("❌ Все подходящие миксеры заняты.")
+        clear_batch_selection(context)
+        return await start(update, context)
+
+    context.user_data['batch_options'] = {mixer: mixer for mixer in free_mixers}
+    context.user_data['batch_selected'] = [
+        m for m in context.user_data.get('batch_selected', []) if m in free_mixers
+    ]
+    await update.message.reply_text(
+        "Отметьте миксеры для запуска замесов:",
+        reply_markup=selection_keyboard(
+            context.user_data['batch_options'], context.user_data['batch_selected'], "✅ Запустить выбранные"
+        )
+    )
+    return BATCH_MIXER_SELECT
+
+async def batch_mixer_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Запуск замесов сразу на нескольких миксерах"""
+    text = update.message.text
+
+    if "🔙 Назад" in text:
+        clear_batch_selection(context)
+        return await start(update, context)
+
+    if toggle_selection(context, text):
+        return await show_batch_mixer_selection(update, context)
+
+    if text.startswith("✅ Запустить выбранные"):
+        selected = context.user_data.get('batch_selected', [])
+        mixers = [m for m in context.user_data.get('batch_options', {}).values() if m in selected]
+        if not mixers:
+            await update.message.reply_text("Отметьте хотя бы один миксер.")
+            return BATCH_MIXER_SELECT
+
+        tickets_data = [{
+            'username': context.user_data['username'],
+            'product': context.user_data['product'],
+            'brand': context.user_data['brand'],
+            'technology': context.user_data['technology'],
+            'mixer': mixer
+        } for mixer in mixers]
+
+        try:
+            async with AsyncExitStack() as stack:
+                for mixer in mixers:
+                    await stack.enter_async_context(mixer_locks.hold(mixer))
+                ticket_ids = await asyncio.to_thread(db.create_tickets, tickets_data)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ Ошибка: {e}")
+            return await show_batch_mixer_selection(update, context)
+
+        # Одно сводное уведомление в группу на все замесы
+        message = f"🏭 Запущено замесов: {len(ticket_ids)}\n"
+        message += f"🏷️ Продукт: {context.user_data['product']} | {context.user_data['brand']}\n"
+        message += f"🔧 Технология: {context.user_data['technology']}\n"
+        message += f"👤 Ответственный: {context.user_data['username']}\n\n"
+        for ticket_id, mixer in zip(ticket_ids, mixers):
+            message += f"🎫 {ticket_id} - {mixer}\n"
+        await context.bot.send_message(GROUP_ID, text=message)
+
+        await update.message.reply_text(
+            f"✅ Создано тикетов: {len(ticket_ids)} ({', '.join(ticket_ids)})\n\n"
+            f"Следующий шаг: отобрать пробы и передать в лабораторию в течение 70 минут."
+        )
+        for key in ['product', 'brand', 'technology', 'mixer']:
+            if key in context.user_data:
+                del context.user_data[key]
+        clear_batch_selection(context)
+        return await start(update, context)
+
+    return BATCH_MIXER_SELECT
+
+async def show_lab_batch_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Выбор нескольких проб для приема в анализ"""
+    if 'batch_tickets' not in context.user_data:
+        # Первыми - пробы, у которых меньше всего времени до LAB_TIMEOUT
+        tickets = [t for t, _ in lab_queue.tickets() if t.get('status') == 'sample_sent']
+        if not tickets:
+            await update.message.reply_text("✅ Нет проб, ожидающих приема.")
+            return LAB_MENU
+        context.user_data['batch_tickets'] = {t['ticket_id']: t for t in tickets}
+        context.user_data['batch_options'] = {
+            f"{t['ticket_id']} - {t['mixer']} - {t['product']}": t['ticket_id'] for t in tickets
+        }
+        context.user_data['batch_selected'] = []
+
+    await update.message.reply_text(
+        "Отметьте пробы для приема в анализ:",
+        reply_markup=selection_keyboard(
+            context.user_data['batch_options'], context.user_data['batch_selected'], "✅ Принять выбранные"
+        )
+    )
+    return LAB_BATCH_SELECT
+
+async def lab_batch_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Прием нескольких проб в анализ одной операцией"""
+    text = update.message.text
+
+    if "🔙 Назад" in text:
+        clear_batch_selection(context)
+        return await start(update, context)
+
+    if toggle_selection(context, text):
+        return await show_lab_batch_selection(update, context)
+
+    if text.startswith("✅ Принять выбранные"):
+        selected = context.user_data.get('batch_selected', [])
+        if not selected:
+            await update.message.reply_text("Отметьте хотя бы одну пробу.")
+            return LAB_BATCH_SELECT
+
+        tickets = [context.user_data['batch_tickets'][ticket_id] for ticket_id in selected]
+        try:
+            updated = await transition_tickets(tickets, {
+                'status': 'sample_received',
+                'current_step': 'analysis_in_progress',
+                'action': 'sample_received_by_lab',
+                'username': context.user_data['username']
+            })
+        except TicketVersionConflict as e:
+            clear_batch_selection(context)
+            await report_version_conflict(update, context, e)
+            return await show_lab_batch_selection(update, context)
+
+        # Тикеты, закрытые или удаленные после показа списка, не обновлены
+        tickets = [t for t in tickets if t['ticket_id'] in updated]
+        if not tickets:
+            clear_batch_selection(context)
+            await update.message.reply_text("❌ Выбранных проб уже нет в лаборатории.")
+            return await start(update, context)
+
+        # Одно сводное уведомление в группу на все пробы
+        message = f"🔬 Принято в анализ проб: {len(tickets)}\n"
+        message += f"👤 Ответственный: {context.user_data['username']}\n\n"
+        for ticket in tickets:
+            message += f"🎫 {ticket['ticket_id']} - {ticket['mixer']} | {ticket['product']}\n"
+        await context.bot.send_message(GROUP_ID, text=message)
+
+        await update.message.reply_text(
+            f"✅ Принято в анализ: {len(tickets)}. Продолжайте работу.\n\n"
+            "Когда анализы будут готовы, вернитесь в раздел Лаборатория → "
+            "Выполнить действия для ввода результатов."
+        )
+        clear_batch_selection(context)
+        return await start(update, context)
+
+    return LAB_BATCH_SELECT
+
 # Действия с тикетами
 async def action_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Меню действий с тикетом"""
@@ -359,15 +650,18 @@ async def sample_sent(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
     if "📤 Проба передана в лабораторию" in text and ticket:
         # Обновляем статус тикета - теперь он переходит в лабораторию
-        db.update_ticket(ticket['ticket_id'], {
-            'status': 'sample_sent',
-            'current_step': 'awaiting_lab_reception',
-            'action': 'sample_sent_to_lab',
-            'username': context.user_data['username']
-        })
+        try:
+            updated_ticket = await transition_ticket(ticket, {
+                'status': 'sample_sent',
+                'current_step': 'awaiting_lab_reception',
+                'action': 'sample_sent_to_lab',
+                'username': context.user_data['username']
+            })
+        except TicketVersionConflict as e:
+            await report_version_conflict(update, context, e)
+            return await show_production_actions(update, context)
 
         # Уведомление в группу
-        updated_ticket = db.get_ticket(ticket['ticket_id'])
         message = format_ticket_message(updated_ticket)
         await context.bot.send_message(GROUP_ID, text=message)
 
@@ -375,14 +669,17 @@ async def sample_sent(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
     elif "✅ Миксер откачан" in text and ticket:
         # Завершаем тикет - миксер освобождается
-        db.update_ticket(ticket['ticket_id'], {
-            'status': 'completed',
-            'current_step': 'completed',
-            'action': 'mixer_discharged',
-            'username': context.user_data['username']
-        })
-
-        updated_ticket = db.get_ticket(ticket['ticket_id'])
+        try:
+            updated_ticket = await transition_ticket(ticket, {
+                'status': 'completed',
+                'current_step': 'completed',
+                'action': 'mixer_discharged',
+                'username': context.user_data['username']
+            })
+        except TicketVersionConflict as e:
+            await report_version_conflict(update, context, e)
+            return await show_production_actions(update, context)
+
         message = format_ticket_message(updated_ticket)
         await context.bot.send_message(GROUP_ID, text=message)
 
@@ -405,51 +702,52 @@ async def lab_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return await start(update, context)
 
     elif "🔧 Выполнить действия" in text:
-        tickets = db.get_lab_tickets()
-        if not tickets:
-            await update.message.reply_text("✅ Нет активных анализов для выполнения.")
-            return LAB_MENU
+        return await show_lab_actions(update, context)
 
-        # Показываем список тикетов для лаборатории с русскими статусами
-        keyboard = []
-        step_map = {
-            'awaiting_lab_reception': 'Ожид. приема',
-            'analysis_in_progress': 'Анализ'
-        }
-        
-        for ticket in tickets:
-            step_text = step_map.get(ticket.get('current_step', ''), ticket.get('current_step', 'В работе'))
-            btn_text = f"🎫 {ticket['ticket_id']} - {ticket['mixer']} - {step_text}"
-            keyboard.append([btn_text])
-        keyboard.append(["🔙 Назад"])
-
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        await update.message.reply_text("Выберите тикет для действия:", reply_markup=reply_markup)
-        context.user_data['lab_tickets'] = {t['ticket_id']: t for t in tickets}
-        return SAMPLE_RECEIVED
+    elif "📥 Принять несколько проб" in text:
+        clear_batch_selection(context)
+        return await show_lab_batch_selection(update, context)
 
     elif "📈 Текущие анализы" in text:
-        tickets = db.get_lab_tickets()
-        if not tickets:
+        queue = lab_queue.tickets()
+        if not queue:
             await update.message.reply_text("📭 Нет активных анализов.")
             return LAB_MENU
 
-        message = "🔬 Текущие анализы:\n\n"
-        for ticket in tickets:
-            step_map = {
-                'awaiting_lab_reception': 'Ожидание приема',
-                'analysis_in_progress': 'Анализ в процессе'
-            }
-            step_text = step_map.get(ticket.get('current_step', ''), ticket.get('current_step', 'В процессе'))
+        message = "🔬 Текущие анализы (сначала срочные):\n\n"
+        for ticket, minutes_left in queue:
+            step_text = LAB_ANALYSIS_STEP_LABELS.get(ticket.get('current_step', ''), ticket.get('current_step', 'В процессе'))
             message += f"🎫 {ticket['ticket_id']} - {ticket['mixer']}\n"
             message += f"   🏷️ {ticket['product']} | {ticket['brand']}\n"
-            message += f"   ⏱️ Статус: {step_text}\n\n"
+            message += f"   ⏱️ Статус: {step_text}\n"
+            message += f"   {format_lab_deadline(minutes_left)}\n\n"
 
         await update.message.reply_text(message)
         return LAB_MENU
 
     return LAB_MENU
 
+async def show_lab_actions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Показывает свежий список тикетов лаборатории для выбора действия"""
+    queue = lab_queue.tickets()
+    tickets = [t for t, _ in queue]
+    if not tickets:
+        await update.message.reply_text("✅ Нет активных анализов для выполнения.")
+        return LAB_MENU
+
+    # Показываем список тикетов для лаборатории с русскими статусами
+    keyboard = []
+    for ticket, minutes_left in queue:
+        step_text = LAB_ACTION_STEP_LABELS.get(ticket.get('current_step', ''), ticket.get('current_step', 'В работе'))
+        btn_text = f"🎫 {ticket['ticket_id']} - {ticket['mixer']} - {step_text} - {format_lab_deadline(minutes_left)}"
+        keyboard.append([btn_text])
+    keyboard.append(["🔙 Назад"])
+
+    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    await update.message.reply_text("Выберите тикет для действия:", reply_markup=reply_markup)
+    context.user_data['lab_tickets'] = {t['ticket_id']: t for t in tickets}
+    return SAMPLE_RECEIVED
+
 async def sample_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Действия лаборатории"""
     text = update.message.text
@@ -498,12 +796,16 @@ async def analysis_result(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if "✅ Принято в анализ" in text and ticket:
         # Обновляем статус - проба принята в лаборатории
-        db.update_ticket(ticket['ticket_id'], {
-            'status': 'sample_received',
-            'current_step': 'analysis_in_progress',
-            'action': 'sample_received_by_lab',
-            'username': context.user_data['username']
-        })
+        try:
+            await transition_ticket(ticket, {
+                'status': 'sample_received',
+                'current_step': 'analysis_in_progress',
+                'action': 'sample_received_by_lab',
+                'username': context.user_data['username']
+            })
+        except TicketVersionConflict as e:
+            await report_version_conflict(update, context, e)
+            return await show_lab_actions(update, context)
 
         # Отправляем сообщение в группу
         message = f"🎫 Тикет {ticket['ticket_id']}\n"
@@ -562,15 +864,18 @@ async def correction_note(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if ticket and text:
         # Возвращаем тикет в производство для корректировки
-        db.update_ticket(ticket['ticket_id'], {
-            'status': 'correction_required',
-            'current_step': 'awaiting_correction',
-            'action': 'correction_required',
-            'username': context.user_data['username'],
-            'correction_note': text
-        })
+        try:
+            updated_ticket = await transition_ticket(ticket, {
+                'status': 'correction_required',
+                'current_step': 'awaiting_correction',
+                'action': 'correction_required',
+                'username': context.user_data['username'],
+                'correction_note': text
+            })
+        except TicketVersionConflict as e:
+            await report_version_conflict(update, context, e)
+            return await show_lab_actions(update, context)
 
-        updated_ticket = db.get_ticket(ticket['ticket_id'])
         message = format_ticket_message(updated_ticket)
         message += f"\n📝 Корректировка: {text}"
 
@@ -603,34 +908,18 @@ async def final_approval(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # Сохраняем показатели в историю анализов
         analysis_details = f"Показатели: {text}"
         
-        # Обновляем тикет - продукт допущен
-        db.update_ticket(ticket['ticket_id'], {
-            'status': 'awaiting_discharge',
-            'current_step': 'awaiting_discharge', 
-            'action': 'analysis_approved',
-            'username': context.user_data['username']
-        })
-
-        # Добавляем показатели в историю анализов
-        updated_ticket = db.get_ticket(ticket['ticket_id'])
-        if 'analyses_history' not in updated_ticket:
-            updated_ticket['analyses_history'] = []
-            
-        updated_ticket['analyses_history'].append({
-            'timestamp': format_msk_time(get_msk_time()),
-            'user': context.user_data['username'],
-            'result': 'approved',
-            'details': analysis_details,
-            'analysis_number': len(updated_ticket.get('analyses_history', [])) + 1
-        })
-        
-        # Сохраняем обновленный тикет
-        tickets = db._load_tickets()
-        for i, t in enumerate(tickets):
-            if t['ticket_id'] == ticket['ticket_id']:
-                tickets[i] = updated_ticket
-                break
-        db._save_tickets(tickets)
+        # Обновляем тикет - продукт допущен, показатели попадают в историю анализов
+        try:
+            await transition_ticket(ticket, {
+                'status': 'awaiting_discharge',
+                'current_step': 'awaiting_discharge', 
+                'action': 'analysis_approved',
+                'username': context.user_data['username'],
+                'analysis_details': analysis_details
+            })
+        except TicketVersionConflict as e:
+            await report_version_conflict(update, context, e)
+            return await show_lab_actions(update, context)
 
         # Отправляем сообщение в группу
         message = f"🎫 Тикет {ticket['ticket_id']}\n"
@@ -660,39 +949,65 @@ async def final_approval(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return FINAL_APPROVAL
 
 # НОВЫЕ КОМАНДЫ МЕНЮ
+def mixer_status_page(offset: int, limit: int):
+    """Страница доски миксеров: статус считается только для миксеров страницы"""
+    mixers = board_mixers()
+    return list(db.get_mixer_status(mixers=mixers[offset:offset + limit]).items()), len(mixers)
+
+# Постраничные списки: заголовок, загрузка страницы (смещение, размер) -> (элементы, всего),
+# форматирование элемента, текст пустого списка
+LIST_VIEWS = {
+    'status': ("📊 Статус миксеров", mixer_status_page, format_mixer_item, None),
+    'active': ("🎫 Активные тикеты", db.slice_active_tickets, format_active_item, "✅ Нет активных тикетов"),
+    'lab': ("🔬 Тикеты в лаборатории", lab_queue.page, format_lab_item, "🔬 Нет тикетов в лаборатории"),
+}
+
+def load_list_page(view: str, page: int):
+    """(элементы страницы, номер страницы, всего элементов) из источника списка"""
+    load_page = LIST_VIEWS[view][1]
+    items, total = load_page(page * PAGE_SIZE, PAGE_SIZE)
+    if not items and total:
+        # Список сократился с прошлого показа - последняя существующая страница
+        page, offset = page_bounds(page, total)
+        items, total = load_page(offset, PAGE_SIZE)
+    return items, page, total
+
+async def send_list_view(update: Update, view: str) -> None:
+    """Отправляет первую страницу списка с кнопками листания"""
+    title, _, format_item, empty_text = LIST_VIEWS[view]
+    items, page, total = load_list_page(view, 0)
+    if not total and empty_text:
+        await update.message.reply_text(empty_text)
+        return
+    text, page, pages = render_page(title, items, page, total, format_item)
+    await update.message.reply_text(text, reply_markup=page_keyboard(view, page, pages))
+
+async def list_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Листание списков кнопками 'назад/вперед'"""
+    query = update.callback_query
+    await query.answer()
+
+    _, view, page = query.data.split(":")
+    if view not in LIST_VIEWS:
+        return
+    title, _, format_item, empty_text = LIST_VIEWS[view]
+    items, page, total = load_list_page(view, max(int(page), 0))
+    if not total and empty_text:
+        text, keyboard = empty_text, None
+    else:
+        text, page, pages = render_page(title, items, page, total, format_item)
+        keyboard = page_keyboard(view, page, pages)
+
+    try:
+        await query.edit_message_text(text, reply_markup=keyboard)
+    except BadRequest:
+        # Страница не изменилась с прошлого показа
+        pass
+
 async def show_mixer_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает статус миксеров (для команды /status и кнопки)"""
     try:
-        status = db.get_mixer_status()
-        message = "📊 Статус миксеров:\n\n"
-
-        for mixer, info in status.items():
-            if info.get('status') == 'free':
-                message += f"✅ {mixer}: Свободен\n"
-            else:
-                step_map = {
-                    'awaiting_sample': 'Ожид. пробу',
-                    'awaiting_lab_reception': 'Ожид. лаб',
-                    'analysis_in_progress': 'Анализ',
-                    'awaiting_discharge': 'Ожид. откачки',
-                    'awaiting_correction': 'Ожид. исправления'
-                }
-                step_text = step_map.get(info.get('current_step', ''), info.get('current_step', 'В работе'))
-                
-                # Форматируем время
-                total_minutes = info.get('total_time_minutes', 0)
-                if total_minutes < 60:
-                    time_text = f"{total_minutes} мин"
-                else:
-                    hours = total_minutes // 60
-                    mins = total_minutes % 60
-                    time_text = f"{hours}ч {mins}мин"
-                
-                message += f"🔄 {mixer}: {info.get('product', 'N/A')} ({info.get('ticket_id', 'N/A')})\n"
-                message += f"   Шаг: {step_text}\n"
-                message += f"   Время: {time_text}\n\n"
-
-        await update.message.reply_text(message)
+        await send_list_view(update, 'status')
         
     except Exception as e:
         logger.error(f"Ошибка при показе статуса: {e}")
@@ -701,30 +1016,7 @@ async def show_mixer_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_active_tickets(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает активные тикеты"""
     try:
-        active_tickets = db.get_active_tickets()
-        
-        if not active_tickets:
-            await update.message.reply_text("✅ Нет активных тикетов")
-            return
-        
-        message = "🎫 Активные тикеты:\n\n"
-        for ticket in active_tickets:
-            status_map = {
-                'production_started': '🏭 Производство',
-                'awaiting_sample': '⏳ Ожидание пробы',
-                'sample_sent': '📤 Проба отправлена',
-                'sample_received': '🔬 В лаборатории',
-                'analysis_in_progress': '⚗️ Анализ',
-                'correction_required': '⚠️ Корректировка',
-                'awaiting_discharge': '🔄 Ожидание откачки'
-            }
-            
-            status_text = status_map.get(ticket['status'], ticket['status'])
-            message += f"• {ticket['ticket_id']} - {ticket['mixer']}\n"
-            message += f"  {ticket['product']} | {ticket['brand']}\n"
-            message += f"  {status_text}\n\n"
-        
-        await update.message.reply_text(message)
+        await send_list_view(update, 'active')
         
     except Exception as e:
         await update.message.reply_text("❌ Ошибка при получении тикетов")
@@ -732,46 +1024,7 @@ async def show_active_tickets(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def show_lab_tickets(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает тикеты в лаборатории"""
     try:
-        lab_tickets = db.get_lab_tickets()
-        
-        if not lab_tickets:
-            await update.message.reply_text("🔬 Нет тикетов в лаборатории")
-            return
-        
-        message = "🔬 Тикеты в лаборатории:\n\n"
-        for ticket in lab_tickets:
-            step_map = {
-                'sample_sent': '📤 Ожидание приема',
-                'sample_received': '🔬 Принята',
-                'analysis_in_progress': '⚗️ Анализ'
-            }
-            
-            step_text = step_map.get(ticket['status'], ticket['status'])
-            message += f"• {ticket['ticket_id']} - {ticket['mixer']}\n"
-            message += f"  {ticket['product']} | {step_text}\n"
-            
-            # Показываем время с создания
-            created_at_str = ticket['created_at']
-            if 'Z' in created_at_str:
-                created_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
-                created_at = created_at + timedelta(hours=MSK_TIMEZONE_OFFSET)
-                created_at = created_at.replace(tzinfo=None)
-            else:
-                created_at_str = created_at_str.split('+')[0]
-                created_at = datetime.fromisoformat(created_at_str)
-            
-            now = datetime.now()
-            elapsed = now - created_at
-            minutes = int(elapsed.total_seconds() / 60)
-            
-            if minutes < 60:
-                message += f"  Время: {minutes} мин\n\n"
-            else:
-                hours = minutes // 60
-                mins = minutes % 60
-                message += f"  Время: {hours}ч {mins}мин\n\n"
-        
-        await update.message.reply_text(message)
+        await send_list_view(update, 'lab')
         
     except Exception as e:
         await update.message.reply_text("❌ Ошибка при получении лабораторных тикетов")
@@ -788,22 +1041,8 @@ async def show_shift_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if now.hour < shift_start_hour:
             shift_start = shift_start - timedelta(days=1)
 
-        all_tickets = db._load_tickets()
-        archive_tickets = db._load_archive()
-        all_tickets_combined = all_tickets + archive_tickets
-
-        shift_tickets = []
-        for ticket in all_tickets_combined:
-            created_at_str = ticket['created_at']
-            if 'Z' in created_at_str:
-                created_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
-                created_at = created_at.replace(tzinfo=None)
-            else:
-                created_at_str = created_at_str.split('+')[0]
-                created_at = datetime.fromisoformat(created_at_str)
-                
-            if created_at >= shift_start:
-                shift_tickets.append(ticket)
+        # Тикеты, созданные с начала смены (конец диапазона - с запасом на расхождение часов)
+        shift_tickets = await asyncio.to_thread(db.get_tickets_between, shift_start, now + timedelta(days=1))
         
         stats = {
             'total': len(shift_tickets),
@@ -827,22 +1066,42 @@ async def show_shift_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text("❌ Ошибка при получении статистики смены")
 
-async def export_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Выгружает данные в Excel файл с московским временем"""
+async def show_capacity_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Прогноз завершенных замесов до конца смены (Монте-Карло)"""
     try:
-        await update.message.reply_text("📊 Формирую Excel файл...")
-        
-        # Используем существующую логику из app.py
-        tickets = db._load_tickets()
-        archive = db._load_archive()
-        all_tickets = tickets + archive
-
-        if not all_tickets:
-            await update.message.reply_text("❌ Нет данных для экспорта")
+        report = await asyncio.to_thread(capacity_forecast.forecast)
+        if not report['history']:
+            await update.message.reply_text("📭 В архиве еще нет завершенных замесов для прогноза")
             return
 
-        # Преобразуем данные для Excel
-        data = []
+        shift_end = datetime.fromisoformat(report['shift_end'])
+        message = f"🔮 Прогноз до {shift_end.strftime('%H:%M')} (осталось {format_time_elapsed(report['minutes_left'])}):\n\n"
+        message += f"✅ Ожидается замесов: {report['expected']}\n"
+        message += f"📊 В 80% прогонов: от {report['p10']} до {report['p90']} (медиана {report['p50']})\n"
+        if report['tickets']:
+            message += "\n🎫 Текущие замесы, вероятность успеть:\n"
+            for ticket in report['tickets']:
+                message += f"   {ticket['ticket_id']} - {ticket['mixer']}: {ticket['probability'] * 100:.0f}%\n"
+        message += f"\n{report['trials']} прогонов по {report['history']} последним замесам архива"
+
+        await update.message.reply_text(message)
+
+    except Exception as e:
+        logger.error(f"Ошибка прогноза смены: {e}")
+        await update.message.reply_text("❌ Ошибка при расчете прогноза")
+
+def build_excel_export():
+    """Формирует Excel файл со всеми тикетами (блокирующая операция)
+
+    Возвращает (файл в памяти, количество записей) или (None, 0), если данных нет.
+    """
+    # Используем существующую логику из app.py
+    tickets = db._load_tickets()
+    # Архив читается потоково, по файлу за раз (сжатые сегменты - построчно)
+    all_tickets = itertools.chain(tickets, db.iter_archive())
+
+    # Преобразуем данные для Excel
+    def rows():
         for ticket in all_tickets:
             corrections_count = len(ticket.get('corrections_history', []))
             analyses_count = len(ticket.get('analyses_history', []))
@@ -862,7 +1121,7 @@ async def export_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
                             else:
                                 timestamp_str = timestamp_str.split('+')[0]
                                 dt = datetime.fromisoformat(timestamp_str)
-                            
+                        
                             # Форматируем в читаемый вид
                             msk_time = dt.strftime("%d.%m.%Y %H:%M:%S")
                             corrections_text += f"{i}. {msk_time} - {correction.get('user', '')}: {correction.get('note', '')}\n"
@@ -877,7 +1136,7 @@ async def export_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 for i, analysis in enumerate(ticket['analyses_history'], 1):
                     result = "Допущен" if analysis.get('result') == 'approved' else "Отклонен"
                     timestamp_str = analysis.get('timestamp', '')
-                    
+                
                     # Конвертируем в МСК время
                     if 'T' in timestamp_str:
                         try:
@@ -887,7 +1146,7 @@ async def export_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
                             else:
                                 timestamp_str = timestamp_str.split('+')[0]
                                 dt = datetime.fromisoformat(timestamp_str)
-                            
+                        
                             msk_time = dt.strftime("%d.%m.%Y %H:%M:%S")
                             analyses_text += f"{i}. {msk_time} - {analysis.get('user', '')}: {result} - {analysis.get('details', '')}\n"
                         except:
@@ -954,35 +1213,21 @@ async def export_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 'Время_производства_мин': production_time_minutes,
                 'Время_производства': production_time_formatted,  # НОВЫЙ СТОЛБЕЦ
             }
-            data.append(row)
+            yield row
+
+    # Строки пишутся в файл по мере чтения архива
+    return write_rows(rows(), EXPORT_COLUMN_WIDTHS)
 
-        # Создаем Excel файл в памяти
-        df = pd.DataFrame(data)
+async def export_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгружает данные в Excel файл с московским временем"""
+    try:
+        await update.message.reply_text("📊 Формирую Excel файл...")
         
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Тикеты', index=False)
-            
-            # Настраиваем ширину колонок
-            worksheet = writer.sheets['Тикеты']
-            worksheet.column_dimensions['A'].width = 15
-            worksheet.column_dimensions['B'].width = 20
-            worksheet.column_dimensions['C'].width = 20
-            worksheet.column_dimensions['D'].width = 15
-            worksheet.column_dimensions['E'].width = 15
-            worksheet.column_dimensions['F'].width = 20
-            worksheet.column_dimensions['G'].width = 15
-            worksheet.column_dimensions['H'].width = 20
-            worksheet.column_dimensions['I'].width = 20
-            worksheet.column_dimensions['J'].width = 15
-            worksheet.column_dimensions['K'].width = 10
-            worksheet.column_dimensions['L'].width = 50
-            worksheet.column_dimensions['M'].width = 10
-            worksheet.column_dimensions['N'].width = 50
-            worksheet.column_dimensions['O'].width = 15
-            worksheet.column_dimensions['P'].width = 20  # НОВАЯ КОЛОНКА
-
-        output.seek(0)
+        # Формирование файла не блокирует обработку апдейтов других пользователей
+        output, records_count = await asyncio.to_thread(build_excel_export)
+        if output is None:
+            await update.message.reply_text("❌ Нет данных для экспорта")
+            return
         
         # Создаем имя файла с текущей МСК датой
         msk_now = get_msk_time()
@@ -992,13 +1237,32 @@ async def export_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_document(
             document=InputFile(output, filename=filename),
             caption=f"📊 Выгрузка данных на {msk_now.strftime('%d.%m.%Y %H:%M')} МСК\n"
-                   f"Всего записей: {len(all_tickets)}"
+                   f"Всего записей: {records_count}"
         )
         
     except Exception as e:
         logger.error(f"Ошибка при экспорте: {e}")
         await update.message.reply_text("❌ Ошибка при создании Excel файла")
 
+async def find_tickets(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск тикетов по тексту корректировок и анализов: /find загуститель"""
+    query = " ".join(context.args or []).strip()
+    if not query:
+        await update.message.reply_text("Укажите, что искать: /find загуститель")
+        return
+    try:
+        results, total = await asyncio.to_thread(search_index.search, query, PAGE_SIZE)
+        if not results:
+            await update.message.reply_text(f"🔍 По запросу «{query}» ничего не найдено")
+            return
+        # Первые PAGE_SIZE самых релевантных
+        text, _, _ = render_page(f"🔍 «{query}»: найдено {total}", results, 0, len(results), format_search_item)
+        await update.message.reply_text(text)
+
+    except Exception as e:
+        logger.error(f"Ошибка поиска: {e}")
+        await update.message.reply_text("❌ Ошибка при поиске")
+
 async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Расширенная помощь"""
     help_text = """
@@ -1010,7 +1274,9 @@ async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /active - Активные тикеты
 /lab - Тикеты в лаборатории  
 /shift - Статистика смены
+/capacity - Сколько замесов успеем до конца смены
 /export - Выгрузить Excel
+/find - Поиск по корректировкам и анализам
 /help - Эта справка
 
 *Быстрые действия через меню:*
@@ -1034,9 +1300,22 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     )
     return await start(update, context)
 
-def main() -> None:
-    """Запуск бота"""
-    application = Application.builder().token(BOT_TOKEN).build()
+def build_application(token: str = BOT_TOKEN, base_url: str = BOT_API_BASE_URL) -> Application:
+    """Создает приложение бота со всеми обработчиками
+
+    base_url - адрес Bot API (например, локального тестового сервера);
+    пустая строка - официальный api.telegram.org.
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .concurrent_updates(ChatOrderedUpdateProcessor(BOT_MAX_CONCURRENT_UPDATES))
+        .persistence(SQLitePersistence(BOT_STATE_PATH, update_interval=BOT_STATE_FLUSH_INTERVAL))
+    )
+    if base_url:
+        builder = builder.base_url(f"{base_url.rstrip('/')}/bot").base_file_url(f"{base_url.rstrip('/')}/file/bot")
+    application = builder.build()
     application.post_init = post_init
 
     # Обработчик разговора
@@ -1044,12 +1323,12 @@ def main() -> None:
         entry_points=[CommandHandler('start', start)],
         states={
             MAIN_MENU: [MessageHandler(filters.Regex(r"^(🏭 Производство|🔬 Лаборатория|🔙 Назад)$"), main_menu)],
-            PRODUCTION_MENU: [MessageHandler(filters.Regex(r"^(🆕 Новый замес|🔧 Выполнить действия|📊 Текущий статус|🔙 Назад)$"), production_menu)],
-            LAB_MENU: [MessageHandler(filters.Regex(r"^(🔧 Выполнить действия|📈 Текущие анализы|🔙 Назад)$"), lab_menu)],
+            PRODUCTION_MENU: [MessageHandler(filters.Regex(r"^(🆕 Новый замес|🆕 Несколько замесов|🔧 Выполнить действия|📊 Текущий статус|🔙 Назад)$"), production_menu)],
+            LAB_MENU: [MessageHandler(filters.Regex(r"^(🔧 Выполнить действия|📈 Текущие анализы|📥 Принять несколько проб|🔙 Назад)$"), lab_menu)],
             NEW_BATCH_PRODUCT: [MessageHandler(filters.Regex(r"^(Гель|Посуда|АШ|Кондиционер|🔙 Назад)$"), new_batch_product)],
             NEW_BATCH_BRAND: [MessageHandler(filters.Regex(r"^(AOS|Sorti|Биолан|Фритайм|Без названия|🔙 Назад)$"), new_batch_brand)],
             NEW_BATCH_TECHNOLOGY: [MessageHandler(filters.Regex(r"^(Старая технология|Новая технология|🔙 Назад)$"), new_batch_technology)],
-            NEW_BATCH_MIXER: [MessageHandler(filters.Regex(r"^(Миксер_\d+|🔙 Назад)$"), new_batch_mixer)],
+            NEW_BATCH_MIXER: [MessageHandler(filters.Regex(r"^(Миксер_\d+|🔙 Назад)"), new_batch_mixer)],
             CONFIRM_START: [MessageHandler(filters.Regex(r"^(✅ Старт|🔙 Назад)$"), confirm_start)],
             ACTION_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, action_menu)],
             SAMPLE_SENT: [MessageHandler(filters.Regex(r"^(📤 Проба передана в лабораторию|✅ Миксер откачан|🔙 Назад)$"), sample_sent)],
@@ -1057,8 +1336,13 @@ def main() -> None:
             ANALYSIS_RESULT: [MessageHandler(filters.Regex(r"^(✅ Принято в анализ|✅ Допущен|⚠️ Корректировка|🔙 Назад)$"), analysis_result)],
             CORRECTION_NOTE: [MessageHandler(filters.TEXT & ~filters.COMMAND, correction_note)],
             FINAL_APPROVAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, final_approval)],
+            LAB_BATCH_SELECT: [MessageHandler(filters.TEXT & ~filters.COMMAND, lab_batch_select)],
+            BATCH_MIXER_SELECT: [MessageHandler(filters.TEXT & ~filters.COMMAND, batch_mixer_select)],
         },
-        fallbacks=[CommandHandler('cancel', cancel), CommandHandler('start', start)]
+        fallbacks=[CommandHandler('cancel', cancel), CommandHandler('start', start)],
+        # Состояние разговора переживает рестарт бота
+        name="main_conversation",
+        persistent=True
     )
 
     application.add_handler(conv_handler)
@@ -1068,11 +1352,38 @@ def main() -> None:
     application.add_handler(CommandHandler('active', show_active_tickets))
     application.add_handler(CommandHandler('lab', show_lab_tickets))
     application.add_handler(CommandHandler('shift', show_shift_stats))
+    application.add_handler(CommandHandler('capacity', show_capacity_forecast))
     application.add_handler(CommandHandler('export', export_to_excel))
+    application.add_handler(CommandHandler('find', find_tickets))
     application.add_handler(CommandHandler('help', show_help))
+    application.add_handler(CallbackQueryHandler(list_page_callback, pattern=r"^page:"))
+
+    wrap_application_handlers(application, PROFILER.wrap_handler)
+    instrument_application_handlers(application)
+    return application
+
+def main() -> None:
+    """Запуск бота"""
+    application = build_application()
+    if BOT_METRICS_PORT:
+        start_metrics_server(BOT_METRICS_LISTEN, BOT_METRICS_PORT)
 
     print("🏭 Производственная система запущена...")
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        try:
+            asyncio.run(run_webhook(
+                application,
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                secret=WEBHOOK_SECRET,
+                max_queue=WEBHOOK_MAX_QUEUE,
+                webhook_url=WEBHOOK_URL
+            ))
+        except KeyboardInterrupt:
+            pass
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,71 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict, Hashable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class KeyedLocks:
+    """Набор asyncio.Lock по ключу (тикет, миксер, чат)
+
+    Блокировки создаются при первом обращении и удаляются, когда ими
+    больше никто не пользуется, поэтому словарь не растет бесконечно.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._holders: Dict[Hashable, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        """Захватывает блокировку для ключа на время блока async with"""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._holders[key] = self._holders.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[key] -= 1
+            if self._holders[key] == 0:
+                del self._holders[key]
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с сохранением порядка внутри чата
+
+    Апдейты разных чатов обрабатываются одновременно, а апдейты одного чата
+    строго по очереди, поэтому ConversationHandler видит шаги пользователя
+    в том порядке, в котором они были отправлены.
+
+    Сначала захватывается блокировка чата и только потом общий слот
+    (семафор max_concurrent_updates): апдейты, ждущие свой чат, слотов не
+    занимают, и поток сообщений из одного чата не останавливает остальные.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.chat_locks = KeyedLocks()
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+        async with self.chat_locks.hold(chat.id):
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -21,4 +21,75 @@ PRODUCT_MIXERS = {
 }
 
 # Бренды
-BRANDS = ["AOS", "Sorti", "Биолан", "Фритайм", "Без названия"]
\ No newline at end of file
+BRANDS = ["AOS", "Sorti", "Биолан", "Фритайм", "Без названия"]
+
+# Параллельная обработка апдейтов бота (порядок внутри одного чата сохраняется)
+BOT_MAX_CONCURRENT_UPDATES = 64
+
+# Сохранение состояний разговоров и user_data между рестартами бота
+BOT_STATE_PATH = "bot_state.sqlite3"
+BOT_STATE_FLUSH_INTERVAL = 5  # секунд между пакетными записями
+
+# Режим получения апдейтов: "polling" или "webhook"
+BOT_MODE = "polling"
+
+# Webhook: локальный HTTP-приемник, на который проксирует nginx или Flask (app.py)
+WEBHOOK_LISTEN = "127.0.0.1"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_URL = ""  # Публичный адрес для setWebhook; пусто - webhook настроен снаружи
+WEBHOOK_SECRET = ""  # Значение заголовка X-Telegram-Bot-Api-Secret-Token; без него webhook не запускается
+WEBHOOK_MAX_QUEUE = 1000  # Сколько апдейтов может ждать обработки
+
+# Адрес Bot API; пусто - официальный api.telegram.org.
+# Для нагрузочных тестов: "http://127.0.0.1:8081" (python -m benchmarks.fake_telegram)
+BOT_API_BASE_URL = ""
+
+# Метрики бота: http://BOT_METRICS_LISTEN:BOT_METRICS_PORT/metrics (0 - выключено)
+BOT_METRICS_LISTEN = "127.0.0.1"
+BOT_METRICS_PORT = 9101
+
+# Пароль для действий в админ-панели
+ADMIN_PASSWORD = "654321"
+
+# Каталог профилей (/debug/profile); общий для бота и веб-приложения
+PROFILE_DIR = "profiles"
+
+# Файл поискового индекса по корректировкам и анализам (/search, /find)
+SEARCH_INDEX_PATH = "search_index.json"
+
+# Индекс тикетов по времени создания; хранится в каталоге tickets.json
+CREATED_INDEX_FILE = "created_index.json"
+
+# Куб статистики архива (продукт x бренд x технология x миксер x смена x день); в каталоге tickets.json
+STATS_CUBE_FILE = "stats_cube.json"
+
+# Журнал событий тикетов (дописывается после записи базы) и его снимки; хранятся в каталоге tickets.json
+EVENTS_FILE = "events.jsonl"
+
+# Монитор хранилища (бот и веб-приложение): замеры файлов базы для /admin/storage
+STORAGE_HEALTH_FILE = "storage_health.jsonl"  # журнал замеров; в каталоге tickets.json
+STORAGE_HEALTH_INTERVAL = 300  # секунд между замерами
+STORAGE_HEALTH_KEEP_DAYS = 30  # сколько суток хранить замеры
+# Пороги обслуживания (проверяет бот) - только напоминания: manage.py compact / archive-roll вручную
+TICKETS_MAX_CLOSED = 20  # закрытых тикетов в tickets.json - нужно сжатие базы
+TICKETS_MAX_BYTES = 2 * 1024 * 1024  # tickets.json больше и в нем есть закрытые тикеты - нужно сжатие базы
+ARCHIVE_SEGMENT_MAX_BYTES = 20 * 1024 * 1024  # текущий файл архива больше - пора закрыть его как сегмент
+
+# Резервные копии (/admin/backup, manage.py backup); каталог в каталоге tickets.json
+BACKUP_DIR = "backups"
+BACKUP_KEEP_LAST = 10  # последних копий хранится всегда
+BACKUP_KEEP_DAYS = 30  # и по одной копии за день за столько суток
+
+# Сегменты архива, все тикеты которых завершены раньше, сжимаются в gzip JSON Lines (суток)
+COLD_SEGMENT_AGE_DAYS = 90
+
+# Прогноз выполнения смены методом Монте-Карло (/capacity, виджет на главной странице)
+CAPACITY_TRIALS = 5000  # прогонов смены
+CAPACITY_CACHE_SECONDS = 180  # сколько секунд прогноз берется из кэша
+CAPACITY_HISTORY = 500  # последних завершенных тикетов на продукт и технологию (и на миксер) в выборке
+CAPACITY_MIXER_IDLE_DAYS = 7  # свободный миксер без замесов за столько суток в прогноз не входит
+
+# Загрузка миксеров: завершенные тикеты ищутся по индексу created_at начиная с этого
+# числа часов до начала периода (замес дольше - редкость, его начало в отчет не попадет)
+UTILIZATION_MAX_BATCH_HOURS = 24
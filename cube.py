@@ -0,0 +1,215 @@
+import json
+import os
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from indexes import file_signature
+from utils import parse_msk_time, shift_of
+
+# Версия формата файла куба: другой версии файл игнорируется и куб строится заново
+CUBE_VERSION = 1
+
+# Измерения куба в порядке ключа ячейки
+CUBE_DIMENSIONS = {
+    'product': 'Продукт',
+    'brand': 'Бренд',
+    'technology': 'Технология',
+    'mixer': 'Миксер',
+    'shift': 'Смена',
+    'day': 'День',
+}
+
+# Меры ячейки: тикетов, тикетов с корректировками, корректировок, минут производства
+TICKETS, CORRECTED, CORRECTIONS, PRODUCTION_MINUTES, STATUS_MINUTES = range(5)
+
+Key = Tuple[str, ...]
+
+
+def cube_key(ticket: Dict[str, Any]) -> Optional[Key]:
+    """Ячейка тикета; смена и день - по времени создания (ночь после полуночи - смена предыдущего дня)"""
+    if not ticket.get('created_at'):
+        return None
+    shift, day = shift_of(parse_msk_time(ticket['created_at']))
+    return (
+        ticket.get('product') or 'Не указан',
+        ticket.get('brand') or 'Не указан',
+        ticket.get('technology') or 'Не указана',
+        ticket.get('mixer') or 'Не указан',
+        shift,
+        day.isoformat(),
+    )
+
+
+def _sort_key(value: str) -> List[Any]:
+    """Миксер_9 раньше Миксер_10"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', value)]
+
+
+class StatsCube:
+    """Куб статистики завершенных тикетов
+
+    Ячейка - сочетание значений всех измерений CUBE_DIMENSIONS, в ней
+    суммы: тикетов, тикетов с корректировками, корректировок, минут
+    производства и минут по статусам (из сводки durations). Любой срез
+    (фильтры по измерениям, группировка по одному-двум измерениям)
+    считается сложением ячеек, без чтения тикетов.
+
+    Архив только дописывается, поэтому куб, как и CreatedAtIndex,
+    помнит, сколько тикетов архива в нем учтено: Database добавляет
+    архивируемые тикеты сразу (apply), а архив, дописанный другим
+    процессом, догоняется чтением хвоста в sync().
+    """
+
+    def __init__(self, path: str, archive_path: str):
+        self.path = path
+        self.archive_path = archive_path
+        self._reset()
+        self._load()
+
+    def _reset(self) -> None:
+        self.cells: Dict[Key, List[Any]] = {}
+        self.archive_count = 0
+        self.archive_signature: Optional[List[int]] = None
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if data.get('version') != CUBE_VERSION:
+            return
+        self.cells = {tuple(key.split('\t')): cell for key, cell in data['cells'].items()}
+        self.archive_count = data['archive_count']
+        self.archive_signature = data['archive_signature']
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': CUBE_VERSION,
+                'archive_count': self.archive_count,
+                'archive_signature': self.archive_signature,
+                'cells': {'\t'.join(key): cell for key, cell in self.cells.items()},
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    # Изменение куба
+    def _add(self, ticket: Dict[str, Any]) -> None:
+        key = cube_key(ticket)
+        if key is None:
+            return
+        cell = self.cells.setdefault(key, _empty_cell())
+        corrections = len(ticket.get('corrections_history') or [])
+        cell[TICKETS] += 1
+        cell[CORRECTED] += 1 if corrections else 0
+        cell[CORRECTIONS] += corrections
+        cell[PRODUCTION_MINUTES] += ticket.get('total_production_time_minutes') or 0
+        for status, minutes in (ticket.get('durations') or {}).get('statuses', {}).items():
+            cell[STATUS_MINUTES][status] = cell[STATUS_MINUTES].get(status, 0) + minutes
+
+    def in_sync(self) -> bool:
+        """Вызывается до записи архива: учтен ли в кубе весь архив"""
+        return file_signature(self.archive_path) == self.archive_signature
+
+    def apply(self, was_in_sync: bool, archived: Sequence[Dict[str, Any]], first_archive_pos: int) -> None:
+        """Тикеты, только что дописанные в архив этим процессом
+
+        Если куб отстал от архива (его дописал другой процесс), тикеты не
+        добавляются: sync() прочитает их вместе с чужими, без двойного счета.
+        """
+        if not archived or not was_in_sync or first_archive_pos != self.archive_count:
+            return
+        for ticket in archived:
+            self._add(ticket)
+        self.archive_count += len(archived)
+        self.archive_signature = file_signature(self.archive_path)
+        self.save()
+
+    def sync(self, archive_count: Callable[[], int],
+             iter_archive: Callable[[int], Iterable[Dict[str, Any]]]) -> bool:
+        """Догоняет архив чтением дописанного хвоста; True - куб изменился"""
+        archive_signature = file_signature(self.archive_path)
+        if archive_signature == self.archive_signature:
+            return False
+        if archive_count() < self.archive_count:
+            # Архив перезаписан (очистка, восстановление) - куб строится заново
+            self._reset()
+        consumed = self.archive_count
+        for ticket in iter_archive(consumed):
+            self._add(ticket)
+            self.archive_count += 1
+        self.archive_signature = archive_signature
+        self.save()
+        return self.archive_count != consumed
+
+    def rebuild(self, archive_count: Callable[[], int],
+                iter_archive: Callable[[int], Iterable[Dict[str, Any]]]) -> None:
+        """Строит куб заново (после перезаписи архива)"""
+        self._reset()
+        self.sync(archive_count, iter_archive)
+
+    # Запросы
+    def values(self) -> Dict[str, List[str]]:
+        """Встречающиеся значения каждого измерения (для фильтров)"""
+        found = [set() for _ in CUBE_DIMENSIONS]
+        for key in self.cells:
+            for values, value in zip(found, key):
+                values.add(value)
+        return {dim: sorted(values, key=_sort_key) for dim, values in zip(CUBE_DIMENSIONS, found)}
+
+    def slice(self, filters: Dict[str, Sequence[str]], by: Sequence[str] = (),
+              start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+        """Срез куба
+
+        filters - {измерение: допустимые значения} (пустой список - без
+        фильтра), by - измерения группировки (не больше двух), start/end -
+        дни ГГГГ-ММ-ДД включительно. Возвращает итог и строки по группам.
+        """
+        dims = list(CUBE_DIMENSIONS)
+        by = [dim for dim in by if dim in CUBE_DIMENSIONS][:2]
+        checks = [(dims.index(dim), set(values)) for dim, values in filters.items()
+                  if dim in CUBE_DIMENSIONS and values]
+        day = dims.index('day')
+        positions = [dims.index(dim) for dim in by]
+
+        groups: Dict[Key, List[Any]] = {}
+        for key, cell in self.cells.items():
+            if start and key[day] < start or end and key[day] > end:
+                continue
+            if any(key[i] not in allowed for i, allowed in checks):
+                continue
+            group = tuple(key[i] for i in positions)
+            _merge(groups.setdefault(group, _empty_cell()), cell)
+
+        overall = _empty_cell()
+        for total in groups.values():
+            _merge(overall, total)
+
+        rows = [dict(zip(by, group), **_measures(total))
+                for group, total in sorted(groups.items(), key=lambda item: [_sort_key(v) for v in item[0]])]
+        return {'by': by, 'total': _measures(overall), 'rows': rows}
+
+
+def _empty_cell() -> List[Any]:
+    return [0, 0, 0, 0, {}]
+
+
+def _merge(into: List[Any], cell: List[Any]) -> None:
+    for i in range(STATUS_MINUTES):
+        into[i] += cell[i]
+    for status, minutes in cell[STATUS_MINUTES].items():
+        into[STATUS_MINUTES][status] = into[STATUS_MINUTES].get(status, 0) + minutes
+
+
+def _measures(cell: List[Any]) -> Dict[str, Any]:
+    tickets = cell[TICKETS]
+    return {
+        'tickets': tickets,
+        'corrected': cell[CORRECTED],
+        'corrections': cell[CORRECTIONS],
+        'correction_rate': round(cell[CORRECTED] / tickets, 3) if tickets else None,
+        'production_minutes': cell[PRODUCTION_MINUTES],
+        'avg_production_minutes': round(cell[PRODUCTION_MINUTES] / tickets, 1) if tickets else None,
+        'status_minutes': dict(cell[STATUS_MINUTES]),
+    }
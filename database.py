@@ -1,15 +1,312 @@
+import copy
+import glob
+import gzip
+import itertools
 import json
 import os
-from typing import List, Dict, Any
-from datetime import datetime, timedelta
-from config import PRODUCT_MIXERS, MSK_TIMEZONE_OFFSET
-from utils import get_msk_time, format_msk_time
+import re
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+from datetime import datetime, timedelta, timezone
+from config import (
+    PRODUCT_MIXERS, MSK_TIMEZONE_OFFSET, CREATED_INDEX_FILE, EVENTS_FILE,
+    COLD_SEGMENT_AGE_DAYS, STATS_CUBE_FILE, SEARCH_INDEX_PATH,
+)
+from cube import StatsCube
+from events import EventLog
+from indexes import CreatedAtIndex
+from utils import get_msk_time, format_msk_time, parse_msk_time, shift_of
+from metrics import instrument_storage
+
+# Статус, в который переводит тикет действие из history
+ACTION_STATUS = {
+    'ticket_created': 'production_started',
+    'sample_sent_to_lab': 'sample_sent',
+    'sample_received_by_lab': 'sample_received',
+    'correction_required': 'correction_required',
+    'analysis_approved': 'awaiting_discharge',
+}
+
+def status_durations(ticket: Dict[str, Any]) -> Dict[str, Any]:
+    """Сводка по тикету для архива: минуты в каждом статусе, циклы корректировки, анализы
+
+    Статус меняется действиями из ACTION_STATUS, последний статус длится
+    до completed_at. Аналитике достаточно этих чисел вместо разбора history.
+    """
+    events = sorted(
+        (e for e in ticket.get('history') or [] if e.get('timestamp')),
+        key=lambda e: e['timestamp']
+    )
+    end = parse_msk_time(ticket['completed_at'])
+    seconds: Dict[str, float] = {}
+    status, since = None, None
+    correction_loops = analyses = 0
+    for event in events:
+        action = event.get('action')
+        if action in ('analysis_approved', 'correction_required'):
+            analyses += 1
+        if action == 'correction_required':
+            correction_loops += 1
+        if action not in ACTION_STATUS:
+            continue
+        at = parse_msk_time(event['timestamp'])
+        if status is not None:
+            seconds[status] = seconds.get(status, 0) + max((at - since).total_seconds(), 0)
+        status, since = ACTION_STATUS[action], at
+    if status is not None:
+        seconds[status] = seconds.get(status, 0) + max((end - since).total_seconds(), 0)
+
+    return {
+        'statuses': {name: int(value / 60) for name, value in seconds.items()},
+        'correction_loops': correction_loops,
+        'analyses': analyses,
+    }
+
+def apply_update(ticket: Dict[str, Any], updates: Dict[str, Any], now: datetime):
+    """Применяет изменения к тикету в памяти и повышает его версию
+
+    now - время изменения; при воспроизведении журнала событий передается
+    время события, поэтому тикет получается тем же, что и при записи.
+    """
+    # Сохраняем историю действий
+    if 'history' not in ticket:
+        ticket['history'] = []
+
+    ticket['history'].append({
+        'action': updates.get('action', 'status_changed'),
+        'timestamp': now.isoformat(),
+        'user': updates.get('username', 'unknown'),
+        'details': updates.get('details', '')
+    })
+
+    # Сохраняем анализ если есть результат
+    if updates.get('action') == 'analysis_approved':
+        if 'analyses_history' not in ticket:
+            ticket['analyses_history'] = []
+    
+        ticket['analyses_history'].append({
+            'timestamp': format_msk_time(now),
+            'user': updates.get('username', 'unknown'),
+            'result': 'approved',
+            'details': updates.get('analysis_details', 'Продукт допущен в производство'),
+            'analysis_number': len(ticket.get('analyses_history', [])) + 1
+        })
+
+    # Сохраняем корректировку если есть
+    if updates.get('action') == 'correction_required' and updates.get('correction_note'):
+        if 'corrections_history' not in ticket:
+            ticket['corrections_history'] = []
+    
+        ticket['corrections_history'].append({
+            'timestamp': format_msk_time(now),
+            'user': updates.get('username', 'unknown'),
+            'note': updates.get('correction_note'),
+            'analysis_number': len(ticket.get('analyses_history', [])) + 1
+        })
+
+    ticket['version'] = ticket.get('version', 0) + 1
+
+    # Завершенный тикет уходит в архив в прежнем виде, остальные обновляем;
+    # действие уже записано в history, в самом тикете оно не нужно
+    if updates.get('status') != 'completed':
+        ticket.update((key, value) for key, value in updates.items() if key != 'action')
+
+def finalize_ticket(ticket: Dict[str, Any], now: datetime):
+    """Поля завершенного тикета для архива: время завершения, общее время, время по статусам"""
+    ticket['completed_at'] = now.isoformat()
+
+    # Рассчитываем общее время производства
+    created_at = parse_msk_time(ticket['created_at'])
+    completed_at = parse_msk_time(ticket['completed_at'])
+    total_time = completed_at - created_at
+    ticket['total_production_time_minutes'] = int(total_time.total_seconds() / 60)
+    ticket['durations'] = status_durations(ticket)
+
+# Суффикс сжатых сегментов архива (gzip JSON Lines)
+COLD_SUFFIX = ".jsonl.gz"
+
+# Статусы тикетов, которым не место среди активных
+CLOSED_STATUSES = ('completed', 'cancelled')
+
+def normalize_timestamp(timestamp: str) -> str:
+    """Единый вид времени тикета - как у get_msk_time().isoformat(): МСК с пометкой +00:00"""
+    return parse_msk_time(timestamp).replace(tzinfo=timezone.utc).isoformat()
+
+def compact_ticket(ticket: Dict[str, Any]) -> bool:
+    """Приводит времена тикета к единому виду и убирает поле action; True - тикет изменился"""
+    before = json.dumps(ticket, ensure_ascii=False, sort_keys=True)
+    ticket.pop('action', None)
+    for key in ('created_at', 'completed_at'):
+        if ticket.get(key):
+            ticket[key] = normalize_timestamp(ticket[key])
+    for entry in ticket.get('history') or []:
+        if entry.get('timestamp'):
+            entry['timestamp'] = normalize_timestamp(entry['timestamp'])
+    return json.dumps(ticket, ensure_ascii=False, sort_keys=True) != before
+
+def archive_line(ticket: Dict[str, Any]) -> bytes:
+    """Строка файла архива (JSON Lines)"""
+    return (json.dumps(ticket, ensure_ascii=False) + "\n").encode('utf-8')
+
+def parse_archive(data: bytes) -> List[Dict[str, Any]]:
+    """Тикеты из содержимого файла архива: JSON Lines или прежний JSON-массив"""
+    if data.lstrip()[:1] == b'[':
+        return json.loads(data)
+    return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+def parse_seconds(data: bytes, parse=json.loads, repeat: int = 3) -> float:
+    """Лучшее время разбора из repeat попыток"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(data)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+# Шаг тикета после действия (как его выставляет бот)
+ACTION_STEP = {
+    'sample_sent_to_lab': 'awaiting_lab_reception',
+    'sample_received_by_lab': 'analysis_in_progress',
+    'correction_required': 'awaiting_correction',
+    'analysis_approved': 'awaiting_discharge',
+}
+
+def shift_key(moment: datetime) -> str:
+    """Смена момента времени: 'ГГГГ-ММ-ДД дневная|ночная' (см. utils.shift_of)"""
+    shift, day = shift_of(moment)
+    return f"{day.isoformat()} {shift}"
+
+def empty_projection() -> Dict[str, Any]:
+    return {'tickets': {}, 'shifts': {}}
+
+def project_event(state: Dict[str, Any], event: Dict[str, Any]):
+    """Проекция журнала событий: активные тикеты и счетчики смен
+
+    Тикеты получаются теми же функциями (apply_update), что и при записи,
+    поэтому проекция совпадает с tickets.json.
+    """
+    ticket_id = event['ticket_id']
+    counters = state['shifts'].setdefault(
+        shift_key(parse_msk_time(event['at'])), {'created': 0, 'completed': 0, 'corrections': 0}
+    )
+    if event['type'] == 'created':
+        state['tickets'][ticket_id] = copy.deepcopy(event['data'])
+        counters['created'] += 1
+    elif event['type'] == 'updated':
+        ticket = state['tickets'].get(ticket_id)
+        if ticket is not None:
+            apply_update(ticket, event['data'], datetime.fromisoformat(event['at']))
+            if event['data'].get('action') == 'correction_required':
+                counters['corrections'] += 1
+    elif event['type'] == 'archived':
+        if state['tickets'].pop(ticket_id, None) is not None:
+            counters['completed'] += 1
+    elif event['type'] == 'deleted':
+        state['tickets'].pop(ticket_id, None)
+
+def rebuild_from_events(events: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(активные тикеты, архив), восстановленные из журнала событий"""
+    active: Dict[str, Dict[str, Any]] = {}
+    archive: List[Dict[str, Any]] = []
+    for event in events:
+        ticket_id = event['ticket_id']
+        if event['type'] == 'created':
+            active[ticket_id] = copy.deepcopy(event['data'])
+        elif event['type'] == 'updated' and ticket_id in active:
+            apply_update(active[ticket_id], event['data'], datetime.fromisoformat(event['at']))
+        elif event['type'] == 'archived' and ticket_id in active:
+            ticket = active.pop(ticket_id)
+            finalize_ticket(ticket, datetime.fromisoformat(event['at']))
+            archive.append(ticket)
+        elif event['type'] == 'deleted':
+            active.pop(ticket_id, None)
+    return list(active.values()), archive
+
+def events_from_tickets(tickets: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Журнал событий для данных, записанных до его появления
+
+    Восстанавливается по history: создание, переходы статусов (с текстами
+    корректировок и показателей анализов по порядку) и архивация.
+    """
+    events = []
+    for ticket in tickets:
+        history = sorted(ticket.get('history') or [], key=lambda e: e.get('timestamp', ''))
+        if not ticket.get('ticket_id') or not ticket.get('created_at'):
+            continue
+        created = {k: v for k, v in ticket.items() if k not in (
+            'completed_at', 'total_production_time_minutes', 'durations', 'action', 'details',
+            'correction_note', 'analysis_details'
+        )}
+        first = history[0] if history and history[0].get('action') == 'ticket_created' else None
+        created.update({
+            'status': 'production_started',
+            'current_step': 'awaiting_sample',
+            'version': 1,
+            'analyses_history': [],
+            'corrections_history': [],
+            'history': [first] if first else [],
+            'username': first.get('user', ticket.get('username')) if first else ticket.get('username'),
+        })
+        events.append({'at': ticket['created_at'], 'type': 'created', 'ticket_id': ticket['ticket_id'], 'data': created})
+
+        corrections = iter(ticket.get('corrections_history') or [])
+        analyses = iter(ticket.get('analyses_history') or [])
+        for entry in history[1:] if first else history:
+            action = entry.get('action')
+            updates = {'action': action, 'username': entry.get('user', 'unknown'), 'details': entry.get('details', '')}
+            if action in ACTION_STATUS:
+                updates['status'] = ACTION_STATUS[action]
+                updates['current_step'] = ACTION_STEP.get(action, updates['status'])
+            if action == 'correction_required':
+                updates['correction_note'] = next(corrections, {}).get('note')
+            if action == 'analysis_approved':
+                updates['analysis_details'] = next(analyses, {}).get('details', 'Продукт допущен в производство')
+            if action in ('mixer_discharged', 'admin_forced_close') and ticket.get('completed_at'):
+                updates['status'] = 'completed'
+            events.append({'at': entry['timestamp'], 'type': 'updated', 'ticket_id': ticket['ticket_id'], 'data': updates})
+
+        if ticket.get('completed_at'):
+            events.append({'at': ticket['completed_at'], 'type': 'archived', 'ticket_id': ticket['ticket_id'], 'data': {}})
+
+    events.sort(key=lambda e: parse_msk_time(e['at']))
+    return events
+
+def board_mixers() -> List[int]:
+    """Номера всех миксеров из конфига по возрастанию (порядок доски миксеров)"""
+    all_mixers = set()
+    for mixers in PRODUCT_MIXERS.values():
+        all_mixers.update(mixers)
+    return sorted(all_mixers)
+
+class TicketVersionConflict(ValueError):
+    """Тикет был изменен другим пользователем после того, как его прочитали"""
+
+    def __init__(self, ticket_id: str, expected_version: int, actual_version: int):
+        self.ticket_id = ticket_id
+        self.expected_version = expected_version
+        self.actual_version = actual_version
+        super().__init__(
+            f"Тикет {ticket_id} уже изменен (ожидалась версия {expected_version}, текущая {actual_version})"
+        )
 
 class Database:
     def __init__(self, db_path: str = "tickets.json", archive_path: str = "archive_tickets.json"):
         self.db_path = db_path
         self.archive_path = archive_path
+        # Блокировка только на время чтения-изменения-записи файла
+        self._lock = threading.RLock()
+        self._segment_counts: Dict[Tuple[str, int, int], int] = {}
         self._ensure_db_exists()
+        # Индекс по времени создания для выборок за период (get_tickets_between)
+        self.created_index = CreatedAtIndex(
+            os.path.join(os.path.dirname(db_path), CREATED_INDEX_FILE), db_path, archive_path
+        )
+        # Куб статистики архива для срезов /stats/cube; дополняется при архивации
+        self.cube = StatsCube(os.path.join(os.path.dirname(db_path), STATS_CUBE_FILE), archive_path)
+        # Журнал событий - производный: дописывается после записи tickets.json и архива
+        # (данные - в них), по нему строятся состояния на прошлые моменты и счетчики смен
+        self.events = EventLog(os.path.join(os.path.dirname(db_path), EVENTS_FILE), project_event, empty_projection)
 
     def _ensure_db_exists(self):
         """Создает файлы базы данных если их нет"""
@@ -18,9 +315,10 @@ class Database:
                 json.dump([], f)
         
         if not os.path.exists(self.archive_path):
-            with open(self.archive_path, 'w', encoding='utf-8') as f:
-                json.dump([], f)
+            # Архив - JSON Lines, пустой файл - пустой архив
+            open(self.archive_path, 'wb').close()
 
+    @instrument_storage('load', 'tickets', 'db_path')
     def _load_tickets(self) -> List[Dict[str, Any]]:
         """Загружает все активные тикеты из файла"""
         try:
@@ -29,58 +327,285 @@ class Database:
         except (FileNotFoundError, json.JSONDecodeError):
             return []
 
-    def _load_archive(self) -> List[Dict[str, Any]]:
-        """Загружает архив завершенных тикетов"""
+    def archive_segments(self) -> List[str]:
+        """Закрытые сегменты архива по порядку: archive_tickets.0001.json, ...
+
+        Архив - закрытые сегменты и текущий файл archive_path, в который
+        дописываются новые тикеты. Сегменты не меняются, поэтому архивация
+        тикета перезаписывает только текущий файл. Старые сегменты хранятся
+        сжатыми (archive_tickets.0001.jsonl.gz, см. freeze_segments); если
+        на момент сжатия есть оба файла, берется сжатый.
+        """
+        base, _ = os.path.splitext(self.archive_path)
+        found = {}
+        for path in glob.glob(f"{glob.escape(base)}.*"):
+            number, cold = self._segment_info(path)
+            if number and (cold or number not in found):
+                found[number] = path
+        return [found[number] for number in sorted(found)]
+
+    def _segment_info(self, path: str) -> Tuple[int, bool]:
+        """(номер сегмента архива, сжат ли он) по имени файла; номер 0 - не сегмент"""
+        base, ext = os.path.splitext(self.archive_path)
+        match = re.fullmatch(re.escape(base) + r"\.(\d{4,})(" + re.escape(ext) + "|" + re.escape(COLD_SUFFIX) + ")", path)
+        if not match:
+            return 0, False
+        return int(match.group(1)), match.group(2) == COLD_SUFFIX
+    def storage_files(self) -> List[str]:
+        """Файлы с данными базы (для резервных копий): активные тикеты, архив, журнал событий"""
+        return [self.db_path] + self.archive_segments() + [self.archive_path, self.events.path]
+
+    def derived_files(self) -> List[str]:
+        """Файлы, которые строятся по данным базы заново: индексы, снимки журнала"""
+        return [self.created_index.path, self.cube.path, self.events.snapshot_path, SEARCH_INDEX_PATH]
+
+    def _read_json(self, path: str) -> List[Dict[str, Any]]:
         try:
-            with open(self.archive_path, 'r', encoding='utf-8') as f:
+            with open(path, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
             return []
 
+    def _iter_segment(self, path: str, skip: int = 0) -> Iterator[Dict[str, Any]]:
+        """Тикеты файла архива по одному, начиная с позиции skip
+
+        Файлы архива - JSON Lines (сжатые сегменты - gzip JSON Lines):
+        читается строка за строкой, пропущенные строки не разбираются.
+        Недописанная последняя строка (запись другого процесса) не
+        читается. Файл в прежнем формате (JSON-массив) разбирается целиком.
+        """
+        opener = gzip.open if path.endswith(COLD_SUFFIX) else open
+        try:
+            f = opener(path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            first = f.read(1)
+            while first.isspace():
+                first = f.read(1)
+            if first == b'[':
+                f.seek(0)
+                yield from json.loads(f.read())[skip:]
+                return
+            f.seek(0)
+            for line in f:
+                if not line.endswith(b"\n") or not line.strip():
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                yield json.loads(line)
+
+    def _write_segment(self, path: str, archive: Iterable[Dict[str, Any]]):
+        """Записывает файл архива атомарно (JSON Lines, для сжатого сегмента - с gzip)"""
+        tmp_path = f"{path}.tmp"
+        opener = gzip.open if path.endswith(COLD_SUFFIX) else open
+        with opener(tmp_path, 'wb') as f:
+            for ticket in archive:
+                f.write(archive_line(ticket))
+        os.replace(tmp_path, path)
+
+    def iter_archive(self, start: int = 0) -> Iterator[Dict[str, Any]]:
+        """Тикеты архива по порядку, начиная с позиции start, без загрузки архива в память
+
+        Файлы целиком до позиции start пропускаются по кэшированному числу
+        тикетов в них.
+        """
+        for path in self.archive_segments() + [self.archive_path]:
+            if start:
+                try:
+                    count = self._segment_count(path)
+                except FileNotFoundError:
+                    continue
+                if start >= count:
+                    start -= count
+                    continue
+            yield from self._iter_segment(path, skip=start)
+            start = 0
+
+    @instrument_storage('load', 'archive', 'archive_files')
+    def _load_archive(self) -> List[Dict[str, Any]]:
+        """Загружает архив завершенных тикетов (все сегменты по порядку)
+
+        Для обхода архива без списка в памяти - iter_archive().
+        """
+        return list(self.iter_archive())
+
+    def archive_files(self) -> List[str]:
+        """Все файлы архива: закрытые сегменты и текущий файл"""
+        return self.archive_segments() + [self.archive_path]
+
+    def archive_count(self) -> int:
+        """Число тикетов в архиве (без разбора тикетов)"""
+        return sum(self._segment_count(path) for path in self.archive_segments() + [self.archive_path])
+
+    def freeze_segments(self, min_age_days: int = COLD_SEGMENT_AGE_DAYS) -> List[str]:
+        """Сжимает сегменты архива, все тикеты которых завершены раньше min_age_days суток назад
+
+        Сегмент переписывается в gzip JSON Lines (времена и поля тикетов
+        при этом нормализуются, как в compact), затем несжатый файл
+        удаляется. Возвращает пути новых сжатых сегментов.
+        """
+        cutoff = get_msk_time().replace(tzinfo=None) - timedelta(days=min_age_days)
+        frozen = []
+        with self._lock:
+            for path in self.archive_segments():
+                number, cold = self._segment_info(path)
+                if cold:
+                    continue
+                archive = list(self._iter_segment(path))
+                completed = [parse_msk_time(t['completed_at']) for t in archive if t.get('completed_at')]
+                if not completed or max(completed) > cutoff:
+                    continue
+                for ticket in archive:
+                    compact_ticket(ticket)
+                cold_path = f"{os.path.splitext(self.archive_path)[0]}.{number:04d}{COLD_SUFFIX}"
+                self._write_segment(cold_path, archive)
+                os.remove(path)
+                frozen.append(cold_path)
+        return frozen
+
+    def _segment_count(self, path: str) -> int:
+        """Число тикетов в файле архива (кэшируется по подписи файла)
+
+        Для JSON Lines - число полных непустых строк, тикеты не разбираются.
+        """
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if key not in self._segment_counts:
+            if path.endswith(COLD_SUFFIX):
+                f = gzip.open(path, 'rb')
+            else:
+                f = open(path, 'rb')
+            with f:
+                head = f.read(1)
+                while head.isspace():
+                    head = f.read(1)
+                f.seek(0)
+                if head == b'[':
+                    count = len(json.loads(f.read()))
+                else:
+                    count = sum(1 for line in f if line.endswith(b"\n") and line.strip())
+            self._segment_counts[key] = count
+        return self._segment_counts[key]
+
+    def _sealed_count(self) -> int:
+        """Число тикетов в закрытых сегментах"""
+        return sum(self._segment_count(path) for path in self.archive_segments())
+
+    def roll_archive(self) -> str:
+        """Закрывает текущий файл архива как новый сегмент; возвращает путь сегмента или None
+
+        Между переименованием файла и созданием нового пустого тикет,
+        дописанный другим процессом, пропал бы, поэтому запускается при
+        остановленных боте и сайте (manage.py archive-roll).
+        """
+        with self._lock:
+            index_in_sync = self.created_index.in_sync()
+            if not self._segment_count(self.archive_path):
+                return None
+            segments = self.archive_segments()
+            number = self._segment_info(segments[-1])[0] + 1 if segments else 1
+            base, ext = os.path.splitext(self.archive_path)
+            segment = f"{base}.{number:04d}{ext}"
+            os.replace(self.archive_path, segment)
+            self._save_archive([])
+            self.created_index.apply(index_in_sync)
+            return segment
+
+    def _write_json(self, path: str, data: List[Dict[str, Any]]):
+        """Записывает файл атомарно: читатели видят либо старую, либо новую версию
+
+        Без этого параллельное чтение недописанного файла давало
+        JSONDecodeError, и списки тикетов на мгновение становились пустыми.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    @instrument_storage('save', 'tickets', 'db_path')
     def _save_tickets(self, tickets: List[Dict[str, Any]]):
         """Сохраняет активные тикеты в файл"""
-        with open(self.db_path, 'w', encoding='utf-8') as f:
-            json.dump(tickets, f, ensure_ascii=False, indent=2)
+        self._write_json(self.db_path, tickets)
 
+    @instrument_storage('save', 'archive', 'archive_path')
     def _save_archive(self, archive: List[Dict[str, Any]]):
-        """Сохраняет архив тикетов"""
-        with open(self.archive_path, 'w', encoding='utf-8') as f:
-            json.dump(archive, f, ensure_ascii=False, indent=2)
+        """Перезаписывает текущий файл архива"""
+        self._write_segment(self.archive_path, archive)
+
+    @instrument_storage('append', 'archive', 'archive_path')
+    def _append_archive(self, tickets: List[Dict[str, Any]]):
+        """Дописывает тикеты в конец текущего файла архива одной записью
+
+        Файл в прежнем формате (JSON-массив) сначала переводится в JSON Lines.
+        """
+        with open(self.archive_path, 'rb') as f:
+            head = f.read(64).lstrip()
+        if head.startswith(b'['):
+            self._write_segment(self.archive_path, self._read_json(self.archive_path))
+        with open(self.archive_path, 'ab') as f:
+            f.write(b"".join(archive_line(ticket) for ticket in tickets))
 
     def create_ticket(self, ticket_data: Dict[str, Any]) -> str:
         """Создает новый тикет"""
-        tickets = self._load_tickets()
-        
-        # Проверяем, свободен ли миксер
-        mixer = ticket_data['mixer']
-        if self.is_mixer_busy(mixer):
-            raise ValueError(f"Миксер {mixer} уже занят другим тикетом")
-        
-        # Генерируем ID тикета
-        ticket_id = self._generate_ticket_id()
-        
-        # Инициализируем историю анализов и корректировок
-        ticket_data['ticket_id'] = ticket_id
-        ticket_data['created_at'] = get_msk_time().isoformat()
-        ticket_data['status'] = 'production_started'
-        ticket_data['current_step'] = 'awaiting_sample'
-        ticket_data['analyses_history'] = []  # История анализов
-        ticket_data['corrections_history'] = []  # История корректировок
-        ticket_data['history'] = [{
-            'action': 'ticket_created',
-            'timestamp': get_msk_time().isoformat(),
-            'user': ticket_data.get('username', 'unknown')
-        }]
-        
-        tickets.append(ticket_data)
-        self._save_tickets(tickets)
-        return ticket_id
+        return self.create_tickets([ticket_data])[0]
+
+    def create_tickets(self, tickets_data: List[Dict[str, Any]]) -> List[str]:
+        """Создает несколько тикетов одной записью в файл
+
+        Если хотя бы один миксер занят (или повторяется в списке), не
+        создается ни один тикет.
+        """
+        with self._lock:
+            index_in_sync = self.created_index.in_sync()
+            tickets = self._load_tickets()
+            busy = {t['mixer'] for t in tickets if t.get('status') not in ['completed', 'cancelled']}
+
+            # Проверяем, свободны ли миксеры
+            for ticket_data in tickets_data:
+                mixer = ticket_data['mixer']
+                if mixer in busy:
+                    raise ValueError(f"Миксер {mixer} уже занят другим тикетом")
+                busy.add(mixer)
+
+            # Генерируем ID тикетов
+            next_number = len(tickets) + self.archive_count() + 1
+            ticket_ids = []
+            for offset, ticket_data in enumerate(tickets_data):
+                ticket_id = f"TK{next_number + offset:04d}"
+                now = get_msk_time().isoformat()
+
+                # Инициализируем историю анализов и корректировок
+                ticket_data['ticket_id'] = ticket_id
+                ticket_data['created_at'] = now
+                ticket_data['status'] = 'production_started'
+                ticket_data['current_step'] = 'awaiting_sample'
+                ticket_data['version'] = 1  # Версия для оптимистичной блокировки
+                ticket_data['analyses_history'] = []  # История анализов
+                ticket_data['corrections_history'] = []  # История корректировок
+                ticket_data['history'] = [{
+                    'action': 'ticket_created',
+                    'timestamp': now,
+                    'user': ticket_data.get('username', 'unknown')
+                }]
+
+                tickets.append(ticket_data)
+                ticket_ids.append(ticket_id)
+
+            self._save_tickets(tickets)
+            # Событие пишется только после записи: при ошибке в журнале не остается тикета, которого нет в базе
+            self.events.append([
+                {'at': t['created_at'], 'type': 'created', 'ticket_id': t['ticket_id'], 'data': t}
+                for t in tickets[-len(tickets_data):]
+            ])
+            self.created_index.apply(index_in_sync, created=tickets[-len(tickets_data):])
+            return ticket_ids
 
     def _generate_ticket_id(self) -> str:
         """Генерирует уникальный ID тикета"""
         tickets = self._load_tickets()
-        archive = self._load_archive()
-        return f"TK{len(tickets) + len(archive) + 1:04d}"
+        return f"TK{len(tickets) + self.archive_count() + 1:04d}"
 
     def is_mixer_busy(self, mixer: str) -> bool:
         """Проверяет, занят ли миксер"""
@@ -95,102 +620,253 @@ class Database:
             if ticket.get('ticket_id') == ticket_id:
                 return ticket
         
-        # Если не нашли в активных, ищем в архиве
-        archive = self._load_archive()
-        for ticket in archive:
-            if ticket.get('ticket_id') == ticket_id:
-                return ticket
+        # Если не нашли в активных, ищем в архиве: от новых файлов к старым,
+        # до первого совпадения (сжатые сегменты читаются потоково)
+        for path in reversed(self.archive_segments() + [self.archive_path]):
+            for ticket in self._iter_segment(path):
+                if ticket.get('ticket_id') == ticket_id:
+                    return ticket
         return None
 
-    def update_ticket(self, ticket_id: str, updates: Dict[str, Any]):
-        """Обновляет тикет"""
-        tickets = self._load_tickets()
-        for i, ticket in enumerate(tickets):
-            if ticket.get('ticket_id') == ticket_id:
-                # Сохраняем историю действий
-                if 'history' not in ticket:
-                    ticket['history'] = []
-                
-                ticket['history'].append({
-                    'action': updates.get('action', 'status_changed'),
-                    'timestamp': get_msk_time().isoformat(),
-                    'user': updates.get('username', 'unknown'),
-                    'details': updates.get('details', '')
-                })
-
-                # Сохраняем анализ если есть результат
-                if updates.get('action') == 'analysis_approved':
-                    if 'analyses_history' not in ticket:
-                        ticket['analyses_history'] = []
-                    
-                    ticket['analyses_history'].append({
-                        'timestamp': format_msk_time(get_msk_time()),
-                        'user': updates.get('username', 'unknown'),
-                        'result': 'approved',
-                        'details': 'Продукт допущен в производство',
-                        'analysis_number': len(ticket.get('analyses_history', [])) + 1
-                    })
-
-                # Сохраняем корректировку если есть
-                if updates.get('action') == 'correction_required' and updates.get('correction_note'):
-                    if 'corrections_history' not in ticket:
-                        ticket['corrections_history'] = []
-                    
-                    ticket['corrections_history'].append({
-                        'timestamp': format_msk_time(get_msk_time()),
-                        'user': updates.get('username', 'unknown'),
-                        'note': updates.get('correction_note'),
-                        'analysis_number': len(ticket.get('analyses_history', [])) + 1
-                    })
-                
-                # Если тикет завершен, перемещаем в архив
+    def update_ticket(self, ticket_id: str, updates: Dict[str, Any], expected_version: int = None):
+        """Обновляет тикет
+
+        Если передан expected_version, обновление применяется только когда
+        версия тикета совпадает с ожидаемой (compare-and-set), иначе
+        выбрасывается TicketVersionConflict. Тикеты без поля version
+        считаются версией 0.
+        """
+        expected_versions = {ticket_id: expected_version} if expected_version is not None else None
+        return bool(self.update_tickets({ticket_id: updates}, expected_versions))
+
+    def update_tickets(self, updates_by_id: Dict[str, Dict[str, Any]],
+                       expected_versions: Dict[str, int] = None) -> List[str]:
+        """Обновляет несколько тикетов одной записью в файл
+
+        Версии проверяются до изменений: при любом конфликте выбрасывается
+        TicketVersionConflict и не меняется ни один тикет. Возвращает ID
+        найденных и обновленных тикетов.
+        """
+        expected_versions = expected_versions or {}
+        with self._lock:
+            index_in_sync = self.created_index.in_sync()
+            cube_in_sync = self.cube.in_sync()
+            tickets = self._load_tickets()
+            by_id = {t.get('ticket_id'): t for t in tickets if t.get('ticket_id') in updates_by_id}
+
+            for ticket_id, expected_version in expected_versions.items():
+                ticket = by_id.get(ticket_id)
+                if ticket is not None and ticket.get('version', 0) != expected_version:
+                    raise TicketVersionConflict(ticket_id, expected_version, ticket.get('version', 0))
+
+            now = get_msk_time()
+            to_archive = []
+            events = []
+            for ticket_id, ticket in by_id.items():
+                updates = updates_by_id[ticket_id]
+                self._apply_update(ticket, updates, now)
+                events.append({'at': now.isoformat(), 'type': 'updated', 'ticket_id': ticket_id, 'data': updates})
                 if updates.get('status') == 'completed':
-                    self._move_to_archive(ticket)
-                    tickets.pop(i)
-                else:
-                    # Обновляем поля
-                    ticket.update(updates)
-                
+                    to_archive.append(ticket)
+            events += [{'at': now.isoformat(), 'type': 'archived', 'ticket_id': t['ticket_id'], 'data': {}}
+                       for t in to_archive]
+
+            first_archive_pos = 0
+            if to_archive:
+                first_archive_pos = self._move_to_archive(*to_archive, now=now)
+                archived_ids = {t['ticket_id'] for t in to_archive}
+                tickets = [t for t in tickets if t.get('ticket_id') not in archived_ids]
+
+            if by_id:
                 self._save_tickets(tickets)
-                return True
-        return False
+                # События - только после записи архива и tickets.json
+                self.events.append(events)
+                self.created_index.apply(index_in_sync, archived=to_archive, first_archive_pos=first_archive_pos)
+                self.cube.apply(cube_in_sync, to_archive, first_archive_pos)
+            return list(by_id)
 
-    def _move_to_archive(self, ticket: Dict[str, Any]):
-        """Перемещает тикет в архив"""
-        archive = self._load_archive()
-        ticket['completed_at'] = get_msk_time().isoformat()
-        
-        # Рассчитываем общее время производства
-        created_at_str = ticket['created_at']
-        completed_at_str = ticket['completed_at']
-        
-        # Обрабатываем время создания
-        if 'Z' in created_at_str:
-            created_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
-            created_at = created_at.replace(tzinfo=None)
-        else:
-            created_at_str = created_at_str.split('+')[0]
-            created_at = datetime.fromisoformat(created_at_str)
-            
-        # Обрабатываем время завершения
-        if 'Z' in completed_at_str:
-            completed_at = datetime.fromisoformat(completed_at_str.replace('Z', '+00:00'))
-            completed_at = completed_at.replace(tzinfo=None)
-        else:
-            completed_at_str = completed_at_str.split('+')[0]
-            completed_at = datetime.fromisoformat(completed_at_str)
-        
-        total_time = completed_at - created_at
-        ticket['total_production_time_minutes'] = int(total_time.total_seconds() / 60)
-        
-        archive.append(ticket)
-        self._save_archive(archive)
+    def _apply_update(self, ticket: Dict[str, Any], updates: Dict[str, Any], now: datetime = None):
+        """Применяет изменения к тикету в памяти и повышает его версию"""
+        apply_update(ticket, updates, now or get_msk_time())
+
+    def _move_to_archive(self, *tickets: Dict[str, Any], now: datetime = None) -> int:
+        """Перемещает тикеты в архив (одна запись архива на все тикеты)
+
+        Возвращает позицию первого из них в архиве.
+        """
+        first_pos = self.archive_count()
+        for ticket in tickets:
+            finalize_ticket(ticket, now or get_msk_time())
+        self._append_archive(list(tickets))
+        return first_pos
+
+    def backfill_durations(self, force: bool = False) -> int:
+        """Добавляет сводку durations тикетам архива, у которых ее нет
+
+        force - пересчитать у всех. Возвращает число измененных тикетов.
+        """
+        with self._lock:
+            index_in_sync = self.created_index.in_sync()
+            changed = 0
+            for path in self.archive_segments() + [self.archive_path]:
+                archive = list(self._iter_segment(path))
+                file_changed = 0
+                for ticket in archive:
+                    if not ticket.get('completed_at') or ('durations' in ticket and not force):
+                        continue
+                    ticket['durations'] = status_durations(ticket)
+                    file_changed += 1
+                if file_changed:
+                    self._write_segment(path, archive)
+                    changed += file_changed
+            if changed:
+                self.created_index.apply(index_in_sync)
+                # Минуты по статусам в кубе берутся из durations
+                self.cube.rebuild(self.archive_count, self.iter_archive)
+            return changed
+
+    def compact(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Сжатие базы
+
+        Закрытые тикеты (completed, cancelled) из tickets.json переносятся в
+        архив, времена приводятся к единому виду, поле action удаляется,
+        индекс по времени создания строится заново. Возвращает отчет:
+        сколько тикетов перенесено и изменено, размеры файлов и время их
+        разбора до и после. При dry_run файлы не меняются.
+
+        Запускается при остановленных боте и сайте (manage.py compact):
+        tickets.json сайт меняет без межпроцессной блокировки. Монитор
+        хранилища только напоминает о ней.
+        """
+        with self._lock:
+            with open(self.db_path, 'rb') as f:
+                tickets_before = f.read()
+            archive_files = {}
+            # Сжатые сегменты нормализованы при сжатии (freeze_segments) и не меняются
+            for path in [p for p in self.archive_segments() if not self._segment_info(p)[1]] + [self.archive_path]:
+                with open(path, 'rb') as f:
+                    archive_files[path] = f.read()
+            tickets = json.loads(tickets_before)
+            archives = {path: parse_archive(data) for path, data in archive_files.items()}
+
+            changed = sum(compact_ticket(ticket) for ticket in tickets)
+            changed_files = []
+            for path, archive in archives.items():
+                file_changed = sum(compact_ticket(ticket) for ticket in archive)
+                if file_changed:
+                    changed += file_changed
+                    changed_files.append(path)
+            moved = [t for t in tickets if t.get('status') in CLOSED_STATUSES]
+            tickets = [t for t in tickets if t.get('status') not in CLOSED_STATUSES]
+            for ticket in moved:
+                if not ticket.get('completed_at'):
+                    # Время закрытия - последнее действие по тикету
+                    last = max((e['timestamp'] for e in ticket.get('history') or [] if e.get('timestamp')),
+                               key=parse_msk_time, default=ticket['created_at'])
+                    finalize_ticket(ticket, parse_msk_time(last).replace(tzinfo=timezone.utc))
+                elif 'durations' not in ticket:
+                    ticket['durations'] = status_durations(ticket)
+            if moved:
+                archives[self.archive_path] += moved
+                changed_files.append(self.archive_path)
+
+            tickets_after = json.dumps(tickets, ensure_ascii=False, indent=2).encode('utf-8')
+            archive_after = {
+                path: b"".join(map(archive_line, archives[path])) if path in changed_files else data
+                for path, data in archive_files.items()
+            }
+            report = {
+                'moved': len(moved),
+                'changed': changed,
+                'active': len(tickets),
+                'archive': sum(len(archive) for archive in archives.values()) + sum(
+                    self._segment_count(path) for path in self.archive_segments() if self._segment_info(path)[1]
+                ),
+                'invalid_mixers': sorted({t.get('mixer') for t in tickets
+                                          if not str(t.get('mixer', '')).startswith('Миксер_')}),
+                'tickets_bytes': (len(tickets_before), len(tickets_after)),
+                'archive_bytes': (sum(map(len, archive_files.values())), sum(map(len, archive_after.values()))),
+                'tickets_parse_seconds': (parse_seconds(tickets_before), parse_seconds(tickets_after)),
+                'archive_parse_seconds': (sum(parse_seconds(data, parse_archive) for data in archive_files.values()),
+                                          sum(parse_seconds(data, parse_archive) for data in archive_after.values())),
+            }
+            if dry_run:
+                return report
+
+            for path in dict.fromkeys(changed_files):
+                self._write_segment(path, archives[path])
+            self._save_tickets(tickets)
+            now = get_msk_time().isoformat()
+            self.events.append([
+                {'at': now, 'type': 'archived', 'ticket_id': t['ticket_id'], 'data': {}}
+                for t in moved if t.get('ticket_id')
+            ])
+            self.created_index.rebuild(self._load_tickets, self.archive_count, self.iter_archive)
+            self.cube.rebuild(self.archive_count, self.iter_archive)
+            return report
+
+    def get_tickets_between(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Тикеты (активные и архивные), созданные в [start, end), по возрастанию created_at
+
+        start и end - naive время по МСК. Диапазон ищется в created_index
+        двоичным поиском; архив читается, только если в диапазон попали
+        архивные тикеты, и только от первой до последней нужной позиции.
+        """
+        with self._lock:
+            loaded = {}
+
+            def load_tickets():
+                if 'tickets' not in loaded:
+                    loaded['tickets'] = self._load_tickets()
+                return loaded['tickets']
+
+            self.created_index.sync(load_tickets, self.archive_count, self.iter_archive)
+            entries = self.created_index.between(start, end)
+            positions = sorted(pos for _, pos in entries if pos >= 0)
+            archive = {}
+            if positions:
+                wanted = set(positions)
+                for pos, ticket in enumerate(self.iter_archive(positions[0]), positions[0]):
+                    if pos in wanted:
+                        archive[pos] = ticket
+                    if pos >= positions[-1]:
+                        break
+            active = {}
+            if any(pos < 0 for _, pos in entries):
+                active = {t.get('ticket_id'): t for t in load_tickets()}
+
+        result = []
+        for ticket_id, pos in entries:
+            ticket = archive.get(pos) if pos >= 0 else active.get(ticket_id)
+            if ticket is not None and ticket.get('ticket_id') == ticket_id:
+                result.append(ticket)
+        return result
+
+    def get_cube_slice(self, filters: Dict[str, List[str]], by: List[str] = (),
+                       start: str = None, end: str = None) -> Dict[str, Any]:
+        """Срез куба статистики архива (см. StatsCube.slice) и значения измерений для фильтров"""
+        with self._lock:
+            self.cube.sync(self.archive_count, self.iter_archive)
+            report = self.cube.slice(filters, by, start, end)
+            report['values'] = self.cube.values()
+            report['archive_count'] = self.cube.archive_count
+            return report
 
     def get_active_tickets(self) -> List[Dict[str, Any]]:
         """Возвращает активные тикеты"""
         tickets = self._load_tickets()
         return [t for t in tickets if t.get('status') not in ['completed', 'cancelled']]
 
+    def slice_active_tickets(self, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Срез активных тикетов: (тикеты с offset, не больше limit; всего активных)
+
+        Это срез полного прохода: tickets.json читается и фильтруется целиком
+        на каждую страницу, экономится только вывод. Для списков в десятки
+        тысяч активных тикетов нужен индекс по статусу, а не этот метод.
+        """
+        active = [t for t in self._load_tickets() if t.get('status') not in ['completed', 'cancelled']]
+        return active[offset:offset + limit], len(active)
+
     def get_tickets_by_status(self, status: str) -> List[Dict[str, Any]]:
         """Возвращает тикеты по статусу"""
         tickets = self._load_tickets()
@@ -210,18 +886,49 @@ class Database:
             'sample_sent', 'sample_received', 'analysis_in_progress'
         ]]
 
-    def get_mixer_status(self) -> Dict[str, Any]:
-        """Возвращает статус всех миксеров"""
-        tickets = self._load_tickets()
-        active_tickets = self.get_active_tickets()
-    
+    def clear_tickets(self):
+        """Удаляет все активные тикеты (без архивации)"""
+        with self._lock:
+            tickets = self._load_tickets()
+            now = get_msk_time().isoformat()
+            self._save_tickets([])
+            self.events.append([
+                {'at': now, 'type': 'deleted', 'ticket_id': t['ticket_id'], 'data': {}}
+                for t in tickets if t.get('ticket_id')
+            ])
+
+    def bootstrap_events(self) -> int:
+        """Создает журнал событий по текущим данным, если журнала еще нет; возвращает число событий"""
+        with self._lock:
+            if os.path.exists(self.events.path) and os.path.getsize(self.events.path):
+                return 0
+            events = events_from_tickets(itertools.chain(self.iter_archive(), self._load_tickets()))
+            self.events.reset()
+            self.events.append(events)
+            return len(events)
+
+    def get_shift_counters(self, at: datetime = None) -> Dict[str, Dict[str, int]]:
+        """Счетчики смен из журнала: {'ГГГГ-ММ-ДД смена': {'created', 'completed', 'corrections'}}"""
+        state = self.events.state_at(at) if at is not None else self.events.current()
+        return state['shifts']
+
+    def get_mixer_status(self, at: datetime = None, mixers: List[int] = None) -> Dict[str, Any]:
+        """Возвращает статус всех миксеров
+
+        at - момент в прошлом (naive, МСК): доска миксеров восстанавливается
+        из журнала событий от ближайшего снимка. mixers - только эти номера
+        миксеров (страница списка, см. board_mixers).
+        """
+        if at is None:
+            return self._mixer_board(self.get_active_tickets(), get_msk_time().replace(tzinfo=None), mixers)
+        state = self.events.state_at(at)
+        return self._mixer_board(list(state['tickets'].values()), at, mixers)
+
+    def _mixer_board(self, active_tickets: List[Dict[str, Any]], now: datetime,
+                     mixers: List[int] = None) -> Dict[str, Any]:
+        """Статус миксеров по активным тикетам на момент now"""
         status = {}
-        # Все миксеры из конфига
-        all_mixers = set()
-        for mixers in PRODUCT_MIXERS.values():
-            all_mixers.update(mixers)
-    
-        for mixer in sorted(all_mixers):
+        for mixer in board_mixers() if mixers is None else mixers:
             mixer_tickets = [t for t in active_tickets if t.get('mixer') == f"Миксер_{mixer}"]
             if mixer_tickets:
                 ticket = mixer_tickets[0]
@@ -239,7 +946,6 @@ class Database:
                     created_at_str = created_at_str.split('+')[0]  # Убираем временную зону
                     created_at = datetime.fromisoformat(created_at_str)
             
-                now = get_msk_time().replace(tzinfo=None)  # Делаем naive для сравнения
                 total_time = now - created_at
                 total_minutes = int(total_time.total_seconds() / 60)
             
@@ -0,0 +1,154 @@
+import copy
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils import parse_msk_time
+
+# Снимок состояния пишется после стольких событий с предыдущего снимка
+SNAPSHOT_EVERY = 500
+
+Event = Dict[str, Any]
+State = Dict[str, Any]
+
+
+class EventLog:
+    """Журнал событий тикетов (JSON Lines, только дописывается) со снимками
+
+    Событие: {'at': время по МСК, 'type', 'ticket_id', 'data'}. Состояние
+    (проекция) строится функцией reducer(state, event), которую передает
+    владелец журнала. Снимок - состояние после события с известным
+    смещением в файле журнала; воспроизведение на любой момент начинается
+    с ближайшего более раннего снимка, поэтому его длина ограничена
+    SNAPSHOT_EVERY событиями. Снимки дописываются попутно при
+    воспроизведении.
+
+    Текущая проекция держится в памяти и догоняет журнал чтением только
+    новых байт файла.
+    """
+
+    def __init__(self, path: str, reducer: Callable[[State, Event], None],
+                 initial_state: Callable[[], State], snapshot_every: int = SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_path = f"{path}.snapshots"
+        self.reducer = reducer
+        self.initial_state = initial_state
+        self.snapshot_every = snapshot_every
+        self._lock = threading.RLock()
+        self._current = initial_state()
+        self._current_offset = 0
+        self._current_count = 0
+        # (время события, смещение в журнале, позиция строки в файле снимков)
+        self._snapshots: List[Tuple[datetime, int, int]] = []
+        self._snapshots_read = 0
+
+    # Запись
+    def append(self, events: List[Event]) -> None:
+        """Дописывает события одной записью (O_APPEND: строки разных процессов не смешиваются)"""
+        if not events:
+            return
+        data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+
+    # Чтение
+    def read(self, offset: int = 0) -> Iterator[Tuple[int, Event]]:
+        """(смещение после события, событие) начиная с offset; недописанная строка пропускается"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                if line.strip():
+                    yield offset, json.loads(line)
+
+    def _replay(self, state: State, offset: int, count: int, until: Optional[datetime] = None) -> Tuple[int, int]:
+        """Применяет события после offset (до момента until); возвращает (offset, число событий)"""
+        for next_offset, event in self.read(offset):
+            at = parse_msk_time(event['at'])
+            if until is not None and at > until:
+                break
+            self.reducer(state, event)
+            offset, count = next_offset, count + 1
+            if count % self.snapshot_every == 0:
+                self._write_snapshot(at, offset, count, state)
+        return offset, count
+
+    # Снимки
+    def _load_snapshots(self) -> None:
+        try:
+            f = open(self.snapshot_path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self._snapshots_read)
+            position = self._snapshots_read
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                # В строке сначала заголовок, состояние читается только при использовании снимка
+                header = json.loads(line[:line.index(b', "state"')] + b"}")
+                self._snapshots.append((parse_msk_time(header['at']), header['offset'], position))
+                position += len(line)
+            self._snapshots_read = position
+        self._snapshots.sort(key=lambda s: s[1])
+
+    def _write_snapshot(self, at: datetime, offset: int, count: int, state: State) -> None:
+        if self._snapshots and offset <= self._snapshots[-1][1]:
+            return
+        # Заголовок идет первым, чтобы список снимков читался без разбора состояний
+        line = json.dumps({'at': at.isoformat(), 'offset': offset, 'count': count}, ensure_ascii=False)
+        line = line[:-1] + ', "state": ' + json.dumps(state, ensure_ascii=False) + "}\n"
+        with open(self.snapshot_path, 'ab') as f:
+            f.write(line.encode('utf-8'))
+        self._load_snapshots()
+
+    def _read_snapshot(self, position: int) -> Dict[str, Any]:
+        with open(self.snapshot_path, 'rb') as f:
+            f.seek(position)
+            return json.loads(f.readline())
+
+    # Проекции
+    def current(self) -> State:
+        """Текущее состояние (копия): догоняет журнал с последнего прочитанного смещения"""
+        with self._lock:
+            self._load_snapshots()
+            if self._current_offset == 0 and self._snapshots:
+                # Первое чтение в процессе - с последнего снимка, а не с начала журнала
+                snapshot = self._read_snapshot(self._snapshots[-1][2])
+                self._current = snapshot['state']
+                self._current_offset, self._current_count = snapshot['offset'], snapshot['count']
+            self._current_offset, self._current_count = self._replay(
+                self._current, self._current_offset, self._current_count
+            )
+            return copy.deepcopy(self._current)
+
+    def state_at(self, at: datetime) -> State:
+        """Состояние на момент at (naive, МСК): от ближайшего снимка не позже at"""
+        with self._lock:
+            self._load_snapshots()
+            usable = [s for s in self._snapshots if s[0] <= at]
+            if usable:
+                snapshot = self._read_snapshot(usable[-1][2])
+                state, offset, count = snapshot['state'], snapshot['offset'], snapshot['count']
+            else:
+                state, offset, count = self.initial_state(), 0, 0
+            self._replay(state, offset, count, until=at)
+            return state
+
+    def reset(self) -> None:
+        """Сбросить проекции в памяти и файл снимков (после перезаписи журнала)"""
+        with self._lock:
+            self._current = self.initial_state()
+            self._current_offset = self._current_count = 0
+            self._snapshots, self._snapshots_read = [], 0
+            if os.path.exists(self.snapshot_path):
+                os.remove(self.snapshot_path)
@@ -0,0 +1,39 @@
+import io
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+# Ширина колонок выгрузки тикетов (ID, даты, продукт ... время производства)
+EXPORT_COLUMN_WIDTHS = (15, 20, 20, 15, 15, 20, 15, 20, 20, 15, 10, 50, 10, 50, 15, 20)
+
+
+def write_rows(rows: Iterable[Dict[str, Any]], widths: Sequence[int] = (),
+               sheet_name: str = 'Тикеты') -> Tuple[Optional[io.BytesIO], int]:
+    """Пишет строки в xlsx потоково (write-only книга openpyxl)
+
+    Строки - словари с одинаковыми ключами, заголовки берутся из первой
+    строки. Строки не накапливаются в памяти, поэтому генератор по всему
+    архиву выгружается без списка тикетов и DataFrame. Возвращает (файл
+    в памяти, количество строк) или (None, 0), если строк нет.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    # Ширина колонок задается до первой строки
+    for i, width in enumerate(widths, 1):
+        worksheet.column_dimensions[get_column_letter(i)].width = width
+
+    count = 0
+    for row in rows:
+        if count == 0:
+            worksheet.append(list(row.keys()))
+        worksheet.append(list(row.values()))
+        count += 1
+    if not count:
+        workbook.close()
+        return None, 0
+
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output, count
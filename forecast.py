@@ -0,0 +1,427 @@
+import copy
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import (
+    PRODUCT_MIXERS, DAY_SHIFT_START, NIGHT_SHIFT_START, CAPACITY_TRIALS, CAPACITY_CACHE_SECONDS, CAPACITY_HISTORY,
+    CAPACITY_MIXER_IDLE_DAYS,
+)
+from database import ACTION_STATUS, status_durations
+from utils import get_msk_time, parse_msk_time
+
+logger = logging.getLogger(__name__)
+
+# Путь тикета без корректировок; после correction_required тикет снова идет с sample_sent
+STATUS_PATH = ['production_started', 'sample_sent', 'sample_received', 'awaiting_discharge']
+# Статусы, за которыми еще может последовать цикл корректировки
+BEFORE_ANALYSIS = {'production_started', 'sample_sent', 'sample_received', 'correction_required'}
+LOOP_STATUSES = ('correction_required', 'sample_sent', 'sample_received')
+
+# Пока по продукту меньше стольких завершенных тикетов, берутся средние по всем продуктам
+MIN_PRODUCT_SAMPLES = 5
+
+ALL_PRODUCTS = '*'
+
+
+class StatusStats:
+    """Накопленные суммы по завершенным тикетам одного продукта"""
+
+    def __init__(self):
+        self.tickets = 0
+        self.correction_loops = 0
+        self.minutes: Dict[str, int] = {}
+
+    def add(self, durations: Dict[str, Any]) -> None:
+        self.tickets += 1
+        self.correction_loops += durations.get('correction_loops', 0)
+        for status, minutes in durations.get('statuses', {}).items():
+            self.minutes[status] = self.minutes.get(status, 0) + minutes
+
+    def visits(self, status: str) -> int:
+        """Сколько раз тикеты побывали в статусе (циклы корректировки повторяют этапы)"""
+        if status == 'correction_required':
+            return self.correction_loops
+        if status in ('sample_sent', 'sample_received'):
+            return self.tickets + self.correction_loops
+        return self.tickets
+
+    def mean_visit(self, status: str) -> Optional[float]:
+        visits = self.visits(status)
+        return self.minutes.get(status, 0) / visits if visits else None
+
+    @property
+    def loops_per_ticket(self) -> float:
+        return self.correction_loops / self.tickets if self.tickets else 0.0
+
+
+def _mixer_number(mixer: str) -> int:
+    match = re.search(r'\d+', mixer)
+    return int(match.group()) if match else 0
+
+
+def current_status(ticket: Dict[str, Any]) -> Tuple[str, datetime]:
+    """Текущий статус тикета по history и время входа в него (naive, МСК)"""
+    status, since = None, parse_msk_time(ticket['created_at'])
+    for event in ticket.get('history') or []:
+        if event.get('action') in ACTION_STATUS and event.get('timestamp'):
+            status, since = ACTION_STATUS[event['action']], parse_msk_time(event['timestamp'])
+    return status or 'production_started', since
+
+
+class MixerForecast:
+    """Прогноз, через сколько минут освободится занятый миксер
+
+    Модель - средние длительности статусов по продуктам из сводки durations
+    архивных тикетов. Архив только дописывается, поэтому при его изменении
+    в модель добавляются лишь новые записи (в фоновом потоке), а прогноз
+    для клавиатуры считается по готовым суммам за доли миллисекунды.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._stats: Dict[str, StatusStats] = {}
+        self._consumed = 0
+        self._signature: Optional[Tuple[int, int]] = None
+
+    def _archive_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.db.archive_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def refresh(self) -> int:
+        """Добавляет в модель новые тикеты архива; возвращает их число
+
+        Архив читается без блокировки модели: новые суммы собираются в
+        копии и подменяют старые одним присваиванием, поэтому прогноз для
+        клавиатуры не ждет чтения архива.
+        """
+        with self._refreshing:
+            signature = self._archive_signature()
+            if signature == self._signature:
+                return 0
+            with self._lock:
+                stats, consumed = copy.deepcopy(self._stats), self._consumed
+            if self.db.archive_count() < consumed:
+                # Архив перезаписан (очистка, сжатие) - строим заново
+                stats, consumed = {}, 0
+            added = 0
+            # Читается только дописанный хвост архива
+            for ticket in self.db.iter_archive(consumed):
+                added += 1
+                durations = ticket.get('durations')
+                if durations is None:
+                    if not ticket.get('completed_at'):
+                        continue
+                    durations = status_durations(ticket)
+                for key in (ticket.get('product') or ALL_PRODUCTS, ALL_PRODUCTS):
+                    stats.setdefault(key, StatusStats()).add(durations)
+            with self._lock:
+                self._stats, self._consumed, self._signature = stats, consumed + added, signature
+            return added
+
+    def refresh_async(self) -> None:
+        """Обновление модели в фоне, если оно еще не идет"""
+        if self._refreshing.locked():
+            return
+
+        def run():
+            try:
+                added = self.refresh()
+                if added:
+                    logger.info(f"Модель прогноза миксеров: +{added} тикетов архива")
+            except Exception as e:
+                logger.error(f"Ошибка обновления модели прогноза миксеров: {e}")
+
+        threading.Thread(target=run, name="mixer-forecast", daemon=True).start()
+
+    def _product_stats(self, product: str) -> Optional[StatusStats]:
+        stats = self._stats.get(product)
+        if stats is None or stats.tickets < MIN_PRODUCT_SAMPLES:
+            stats = self._stats.get(ALL_PRODUCTS)
+        return stats
+
+    def minutes_to_free(self, ticket: Dict[str, Any], now: datetime) -> Optional[int]:
+        """Ожидаемые минуты до откачки активного тикета или None, если данных нет"""
+        with self._lock:
+            stats = self._product_stats(ticket.get('product'))
+            if stats is None:
+                return None
+
+            # Текущий статус и время с момента входа в него
+            status, since = current_status(ticket)
+            elapsed = max((now - since).total_seconds() / 60, 0)
+
+            remaining = max((stats.mean_visit(status) or 0) - elapsed, 0)
+            if status == 'correction_required':
+                following = STATUS_PATH[1:]
+            elif status in STATUS_PATH:
+                following = STATUS_PATH[STATUS_PATH.index(status) + 1:]
+            else:
+                following = []
+            remaining += sum(stats.mean_visit(s) or 0 for s in following)
+            if status in BEFORE_ANALYSIS:
+                remaining += stats.loops_per_ticket * sum(stats.mean_visit(s) or 0 for s in LOOP_STATUSES)
+            return int(round(remaining))
+
+    def rank_mixers(self, mixers: Sequence[str], active_tickets: Sequence[Dict[str, Any]],
+                    now: datetime) -> List[Tuple[str, Optional[int], bool]]:
+        """(миксер, минуты до освобождения, занят) - сначала свободные, затем по прогнозу"""
+        by_mixer = {t.get('mixer'): t for t in active_tickets}
+        ranked = []
+        for mixer in mixers:
+            ticket = by_mixer.get(mixer)
+            minutes = self.minutes_to_free(ticket, now) if ticket else None
+            ranked.append((mixer, minutes, ticket is not None))
+        # Занятые без прогноза - в конце
+        ranked.sort(key=lambda item: (item[2], item[1] is None, item[1] or 0, _mixer_number(item[0])))
+        return ranked
+
+
+# Столбцы выборки длительностей: статусы в порядке прохождения (циклы корректировки - суммой)
+STAGES = ('production_started', 'sample_sent', 'sample_received', 'correction_required', 'awaiting_discharge')
+# Простой миксера между откачкой и следующим замесом дольше этого - миксер не был нужен, в выборку не идет
+MAX_CHANGEOVER_MINUTES = 240
+# Предел замесов одного миксера за прогон
+MAX_CYCLES = 50
+
+
+def shift_end(now: datetime) -> datetime:
+    """Конец текущей смены (naive, МСК): ближайшие DAY_SHIFT_START или NIGHT_SHIFT_START часов"""
+    day_start = now.replace(hour=DAY_SHIFT_START, minute=0, second=0, microsecond=0)
+    if now.hour < DAY_SHIFT_START:
+        return day_start
+    if now.hour < NIGHT_SHIFT_START:
+        return now.replace(hour=NIGHT_SHIFT_START, minute=0, second=0, microsecond=0)
+    return day_start + timedelta(days=1)
+
+
+def _mixer_names() -> List[str]:
+    numbers = sorted({n for mixers in PRODUCT_MIXERS.values() for n in mixers})
+    return [f"Миксер_{n}" for n in numbers]
+
+
+class StageSamples:
+    """Последние CAPACITY_HISTORY завершенных тикетов группы: минуты по STAGES и циклы корректировки"""
+
+    def __init__(self):
+        self.rows: Deque[Tuple[List[int], int]] = deque(maxlen=CAPACITY_HISTORY)
+        self._arrays: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def add(self, durations: Dict[str, Any]) -> None:
+        statuses = durations.get('statuses', {})
+        self.rows.append(([statuses.get(s, 0) for s in STAGES], durations.get('correction_loops', 0)))
+        self._arrays = None
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(минуты: тикетов x STAGES, циклы корректировки)"""
+        if self._arrays is None:
+            self._arrays = (
+                np.array([row for row, _ in self.rows], dtype=float).reshape(-1, len(STAGES)),
+                np.array([loops for _, loops in self.rows], dtype=float),
+            )
+        return self._arrays
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+class ShiftCapacityForecast:
+    """Сколько замесов завершится до конца смены - прогноз методом Монте-Карло
+
+    Выборка строится по архиву так же, как у MixerForecast (дочитывается
+    только хвост): длительности статусов последних завершенных тикетов
+    по продукту и технологии, время замеса и простой между замесами по
+    каждому миксеру. Остаток текущего замеса занятого миксера берется из
+    тикетов той же группы, пробывших в текущем статусе дольше, чем уже
+    прошло; затем миксер после простоя берет следующий замес. Очереди
+    замесов в системе нет, поэтому прогноз отвечает на вопрос, сколько
+    можно успеть при обычных простоях. Моделируются занятые миксеры и
+    миксеры с замесами за последние CAPACITY_MIXER_IDLE_DAYS суток; миксеру
+    без своей истории простои и время замеса берутся из общей выборки. Все прогоны считаются разом
+    массивами NumPy, результат кэшируется на CAPACITY_CACHE_SECONDS.
+    """
+
+    def __init__(self, db, trials: int = CAPACITY_TRIALS, cache_seconds: int = CAPACITY_CACHE_SECONDS):
+        self.db = db
+        self.trials = trials
+        self.cache_seconds = cache_seconds
+        self._lock = threading.Lock()
+        self._cached: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._groups: Dict[Tuple[str, str], StageSamples] = {}
+        self._mixer_totals: Dict[str, Deque[float]] = {}
+        self._mixer_gaps: Dict[str, Deque[float]] = {}
+        self._last_completed: Dict[str, datetime] = {}
+        self._consumed = 0
+        self._signature: Optional[Tuple[int, int]] = None
+
+    # Выборка
+    def refresh(self) -> int:
+        """Добавляет в выборку новые тикеты архива; возвращает их число"""
+        try:
+            stat = os.stat(self.db.archive_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if signature == self._signature:
+            return 0
+        if self.db.archive_count() < self._consumed:
+            # Архив перезаписан - выборка строится заново
+            self._reset()
+        consumed = self._consumed
+        for ticket in self.db.iter_archive(consumed):
+            self._consumed += 1
+            self._add(ticket)
+        self._signature = signature
+        return self._consumed - consumed
+
+    def _add(self, ticket: Dict[str, Any]) -> None:
+        if not ticket.get('completed_at'):
+            return
+        durations = ticket.get('durations') or status_durations(ticket)
+        product = ticket.get('product') or ALL_PRODUCTS
+        technology = ticket.get('technology') or ALL_PRODUCTS
+        for key in ((product, technology), (product, ALL_PRODUCTS), (ALL_PRODUCTS, ALL_PRODUCTS)):
+            self._groups.setdefault(key, StageSamples()).add(durations)
+
+        mixer = ticket.get('mixer')
+        if not mixer:
+            return
+        total = ticket.get('total_production_time_minutes') or sum(durations.get('statuses', {}).values())
+        self._mixer_totals.setdefault(mixer, deque(maxlen=CAPACITY_HISTORY)).append(total)
+        created, completed = parse_msk_time(ticket['created_at']), parse_msk_time(ticket['completed_at'])
+        last = self._last_completed.get(mixer)
+        if last is not None:
+            gap = (created - last).total_seconds() / 60
+            if 0 <= gap <= MAX_CHANGEOVER_MINUTES:
+                self._mixer_gaps.setdefault(mixer, deque(maxlen=CAPACITY_HISTORY)).append(gap)
+        self._last_completed[mixer] = max(last, completed) if last else completed
+
+    def _samples(self, ticket: Dict[str, Any]) -> Optional[StageSamples]:
+        product = ticket.get('product') or ALL_PRODUCTS
+        for key in ((product, ticket.get('technology') or ALL_PRODUCTS), (product, ALL_PRODUCTS)):
+            samples = self._groups.get(key)
+            if samples is not None and len(samples) >= MIN_PRODUCT_SAMPLES:
+                return samples
+        return self._groups.get((ALL_PRODUCTS, ALL_PRODUCTS))
+
+    # Моделирование
+    def _remaining(self, ticket: Dict[str, Any], now: datetime, rng: np.random.Generator) -> Optional[np.ndarray]:
+        """Минуты до откачки активного тикета в каждом прогоне или None, если выборки нет"""
+        samples = self._samples(ticket)
+        if samples is None or not len(samples):
+            return None
+        rows, loops = samples.arrays()
+        status, since = current_status(ticket)
+        column = STAGES.index(status)
+        elapsed = max((now - since).total_seconds() / 60, 0)
+
+        # Условный остаток: тикеты, пробывшие в текущем статусе дольше, чем уже прошло
+        pool = np.flatnonzero(rows[:, column] > elapsed)
+        if not len(pool):
+            pool = np.arange(len(rows))
+        picked = rng.choice(pool, self.trials)
+        sample = rows[picked]
+        remaining = np.maximum(sample[:, column] - elapsed, 0)
+        if status == 'correction_required':
+            # После корректировки - новая проба: средний визит этого тикета в статусы пробы
+            visits = loops[picked] + 1
+            remaining += (sample[:, 1] + sample[:, 2]) / visits + sample[:, 4]
+        else:
+            remaining += sample[:, column + 1:].sum(axis=1)
+        return remaining
+
+    def forecast(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Прогноз завершенных замесов до конца текущей смены (из кэша, если он свежий)"""
+        with self._lock:
+            if now is None and self._cached and time.monotonic() - self._cached[0] < self.cache_seconds:
+                return self._cached[1]
+            self.refresh()
+            report = self._simulate(now or get_msk_time().replace(tzinfo=None))
+            if now is None:
+                self._cached = (time.monotonic(), report)
+            return report
+
+    def _simulate(self, now: datetime) -> Dict[str, Any]:
+        end = shift_end(now)
+        horizon = (end - now).total_seconds() / 60
+        rng = np.random.default_rng()
+        active = {t.get('mixer'): t for t in self.db.get_active_tickets()}
+        all_totals = [m for totals in self._mixer_totals.values() for m in totals]
+        all_gaps = [m for gaps in self._mixer_gaps.values() for m in gaps]
+        recent = now - timedelta(days=CAPACITY_MIXER_IDLE_DAYS)
+        simulated = [mixer for mixer in _mixer_names() + sorted(m for m in active if m and m not in _mixer_names())
+                     if mixer in active or self._last_completed.get(mixer, datetime.min) >= recent]
+
+        completed = np.zeros(self.trials, dtype=int)
+        mixers, tickets = [], []
+        for mixer in simulated:
+            free_at = np.zeros(self.trials)
+            done = np.zeros(self.trials, dtype=int)
+            ticket = active.get(mixer)
+            if ticket is not None:
+                remaining = self._remaining(ticket, now, rng)
+                if remaining is None:
+                    # Нет выборки - миксер считается занятым до конца смены
+                    free_at = np.full(self.trials, np.inf)
+                else:
+                    free_at = remaining
+                    finished = remaining <= horizon
+                    done += finished
+                    tickets.append({
+                        'ticket_id': ticket.get('ticket_id'),
+                        'mixer': mixer,
+                        'product': ticket.get('product'),
+                        'status': current_status(ticket)[0],
+                        'probability': round(float(finished.mean()), 3),
+                        'minutes_p50': int(np.median(remaining)),
+                    })
+
+            # Следующие замесы: простой и время замеса из истории миксера (нет истории - всех миксеров);
+            # без выборки простоев следующие замесы не моделируются
+            totals = np.array(self._mixer_totals.get(mixer) or all_totals, dtype=float)
+            gaps = np.array(self._mixer_gaps.get(mixer) or all_gaps, dtype=float)
+            if len(totals) and len(gaps):
+                for _ in range(MAX_CYCLES):
+                    if not (free_at < horizon).any():
+                        break
+                    free_at = free_at + rng.choice(gaps, self.trials) + rng.choice(totals, self.trials)
+                    done += free_at <= horizon
+
+            completed += done
+            mixers.append({
+                'mixer': mixer,
+                'busy': ticket is not None,
+                'expected': round(float(done.mean()), 2),
+                'p10': int(np.percentile(done, 10)),
+                'p90': int(np.percentile(done, 90)),
+            })
+
+        p10, p50, p90 = (int(v) for v in np.percentile(completed, [10, 50, 90]))
+        return {
+            'generated_at': now.isoformat(),
+            'shift_end': end.isoformat(),
+            'minutes_left': int(horizon),
+            'trials': self.trials,
+            'history': len(self._groups.get((ALL_PRODUCTS, ALL_PRODUCTS)) or ()),
+            'expected': round(float(completed.mean()), 1),
+            'p10': p10,
+            'p50': p50,
+            'p90': p90,
+            'mixers': mixers,
+            'tickets': sorted(tickets, key=lambda t: -t['probability']),
+        }
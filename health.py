@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    STORAGE_HEALTH_FILE, STORAGE_HEALTH_INTERVAL, STORAGE_HEALTH_KEEP_DAYS,
+    TICKETS_MAX_CLOSED, TICKETS_MAX_BYTES, ARCHIVE_SEGMENT_MAX_BYTES,
+)
+from database import CLOSED_STATUSES, parse_archive
+from utils import get_msk_time, parse_msk_time
+
+logger = logging.getLogger(__name__)
+
+
+# Время чтения и разбора архива замеряется на начале текущего файла не больше такого размера
+ARCHIVE_SAMPLE_BYTES = 256 * 1024
+
+
+def _timed_parse(path: str, limit: Optional[int] = None) -> Tuple[int, float, float, List[Dict[str, Any]]]:
+    """(прочитано байт, мс чтения, мс разбора, разобранные записи) для файла или его начала
+
+    С limit читается не больше limit байт, обрезанных по последней полной
+    строке (JSON Lines). Записи возвращаются вызывающему для подсчета и не
+    сохраняются в замере.
+    """
+    started = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read() if limit is None else f.read(limit)
+    except FileNotFoundError:
+        return 0, 0.0, 0.0, []
+    if limit is not None and len(data) == limit:
+        data = data[:data.rfind(b"\n") + 1]
+    loaded = time.perf_counter()
+    try:
+        records = parse_archive(data)
+    except json.JSONDecodeError:
+        records = []
+    parsed = time.perf_counter()
+    return len(data), round((loaded - started) * 1000, 2), round((parsed - loaded) * 1000, 2), records
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class StorageHealth:
+    """Фоновый монитор файлов базы
+
+    Раз в STORAGE_HEALTH_INTERVAL секунд замеряет размеры tickets.json и
+    архива, время их чтения и разбора, число записей и дописывает замер
+    в общий для бота и веб-приложения журнал (storage_health.jsonl в
+    каталоге базы) - по нему строится страница /admin/storage.
+
+    При maintain=True (только один процесс - бот) раз в сутки старые
+    сегменты архива переводятся в сжатый вид (freeze_segments): закрытые
+    сегменты никто не дописывает. Сжатие базы (compact) и закрытие
+    текущего файла архива как сегмента (roll_archive) переписывают файлы,
+    которые сайт меняет без межпроцессной блокировки, поэтому
+    автоматически не запускаются: при превышении порогов в журнал пишется
+    напоминание выполнить manage.py compact / archive-roll при
+    остановленных боте и сайте.
+    """
+
+    def __init__(self, db, source: str, maintain: bool = False, interval: int = STORAGE_HEALTH_INTERVAL):
+        self.db = db
+        self.source = source
+        self.maintain = maintain
+        self.interval = interval
+        self.path = os.path.join(os.path.dirname(db.db_path), STORAGE_HEALTH_FILE)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pruned_at: Optional[datetime] = None
+        self._frozen_at: Optional[datetime] = None
+        self._compact_advised = False
+        self._roll_advised = False
+
+    def start(self) -> None:
+        """Запускает проверки в фоновом потоке (повторный вызов ничего не делает)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.check()
+                except Exception as e:
+                    logger.error(f"Ошибка проверки хранилища: {e}")
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=run, name="storage-health", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def sample(self) -> Dict[str, Any]:
+        """Замер файлов базы
+
+        Целиком разбирается только tickets.json. Число записей архива
+        берется из построчных счетчиков базы (кэшируются по подписи файла,
+        сжатые сегменты не перечитываются), время чтения и разбора архива -
+        по началу текущего файла (ARCHIVE_SAMPLE_BYTES).
+        """
+        tickets_bytes, tickets_load_ms, tickets_parse_ms, tickets = _timed_parse(self.db.db_path)
+        tickets_records = len(tickets)
+        tickets_closed = sum(1 for t in tickets if t.get('status') in CLOSED_STATUSES)
+        del tickets
+
+        segments = self.db.archive_segments()
+        _, archive_load_ms, archive_parse_ms, _ = _timed_parse(self.db.archive_path, ARCHIVE_SAMPLE_BYTES)
+        return {
+            'at': get_msk_time().isoformat(),
+            'source': self.source,
+            'tickets_bytes': tickets_bytes,
+            'tickets_load_ms': tickets_load_ms,
+            'tickets_parse_ms': tickets_parse_ms,
+            'tickets_records': tickets_records,
+            'tickets_closed': tickets_closed,
+            'archive_bytes': sum(_size(path) for path in segments + [self.db.archive_path]),
+            'archive_current_bytes': _size(self.db.archive_path),
+            'archive_segments': len(segments),
+            'archive_load_ms': archive_load_ms,
+            'archive_parse_ms': archive_parse_ms,
+            'archive_records': self.db.archive_count(),
+            'events_bytes': _size(self.db.events.path),
+            'actions': [],
+        }
+
+    def check(self) -> Dict[str, Any]:
+        """Замер, обслуживание по порогам (при maintain) и запись в журнал"""
+        with self._lock:
+            sample = self.sample()
+            if self.maintain:
+                sample['actions'] = self._maintain(sample)
+            self._append(sample)
+            return sample
+
+    def _maintain(self, sample: Dict[str, Any]) -> List[str]:
+        actions = []
+        needs_compact = sample['tickets_closed'] >= TICKETS_MAX_CLOSED or (
+            sample['tickets_closed'] and sample['tickets_bytes'] > TICKETS_MAX_BYTES)
+        if needs_compact and not self._compact_advised:
+            # Напоминание - один раз на превышение порога, а не в каждом замере
+            actions.append(f"Нужно сжатие базы: {sample['tickets_closed']} закрытых тикетов в tickets.json "
+                           f"({sample['tickets_bytes']} байт) - manage.py compact при остановленных боте и сайте")
+        self._compact_advised = bool(needs_compact)
+        needs_roll = sample['archive_current_bytes'] > ARCHIVE_SEGMENT_MAX_BYTES
+        if needs_roll and not self._roll_advised:
+            actions.append(f"Текущий файл архива вырос до {sample['archive_current_bytes']} байт - "
+                           f"manage.py archive-roll при остановленных боте и сайте")
+        self._roll_advised = needs_roll
+        now = parse_msk_time(sample['at'])
+        if self._frozen_at is None or now - self._frozen_at > timedelta(days=1):
+            self._frozen_at = now
+            for path in self.db.freeze_segments():
+                actions.append(f"Сегмент архива сжат: {os.path.basename(path)}")
+        for action in actions:
+            logger.info(action)
+        return actions
+
+    def _append(self, sample: Dict[str, Any]) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+        now = parse_msk_time(sample['at'])
+        if self._pruned_at is None or now - self._pruned_at > timedelta(days=1):
+            self._prune(now)
+            self._pruned_at = now
+
+    def _prune(self, now: datetime) -> None:
+        """Удаляет из журнала замеры старше STORAGE_HEALTH_KEEP_DAYS"""
+        samples = self.history(days=STORAGE_HEALTH_KEEP_DAYS, now=now)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(s, ensure_ascii=False) + "\n" for s in samples)
+        os.replace(tmp_path, self.path)
+
+    def history(self, days: int = 7, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Замеры всех процессов за последние days суток по возрастанию времени"""
+        since = (now or get_msk_time().replace(tzinfo=None)) - timedelta(days=days)
+        samples = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        sample = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if parse_msk_time(sample['at']) >= since:
+                        samples.append(sample)
+        except FileNotFoundError:
+            pass
+        samples.sort(key=lambda s: s['at'])
+        return samples
+
+
+def storage_trends(samples: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """По каждой метрике: последнее значение, минимум, максимум и прирост в сутки"""
+    metrics = ('tickets_bytes', 'tickets_records', 'tickets_closed', 'tickets_load_ms', 'tickets_parse_ms',
+               'archive_bytes', 'archive_records', 'archive_segments', 'archive_load_ms', 'archive_parse_ms',
+               'events_bytes')
+    trends = {}
+    if not samples:
+        return trends
+    days = (parse_msk_time(samples[-1]['at']) - parse_msk_time(samples[0]['at'])).total_seconds() / 86400
+    for name in metrics:
+        values = [s.get(name, 0) for s in samples]
+        trends[name] = {
+            'last': values[-1],
+            'min': min(values),
+            'max': max(values),
+            'per_day': (values[-1] - values[0]) / days if days > 0 else 0,
+        }
+    return trends
@@ -0,0 +1,212 @@
+import json
+import os
+from bisect import bisect_left
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils import parse_msk_time
+
+# Версия формата файла индекса: другой версии файл игнорируется и индекс строится заново
+INDEX_VERSION = 1
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def created_epoch(timestamp: str) -> int:
+    """Секунды от эпохи для времени по МСК из тикета"""
+    return int((parse_msk_time(timestamp) - EPOCH).total_seconds())
+
+
+def file_signature(path: str) -> Optional[List[int]]:
+    try:
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        return None
+
+
+class CreatedAtIndex:
+    """Упорядоченный индекс created_at -> ticket_id
+
+    Три параллельных списка, отсортированных по времени создания: секунды
+    от эпохи, ID тикета и его позиция в архиве (-1 - тикет активный).
+    Архив только дописывается, поэтому позиция архивного тикета не
+    меняется, и выборка за период - два bisect и срез.
+
+    Индекс хранится в файле рядом с базой. Свои изменения Database вносит
+    сразу (on_created, on_archived); записи другого процесса (бот и
+    веб-приложение работают с одними файлами) обнаруживаются по размеру и
+    времени изменения файлов и догоняются в sync().
+    """
+
+    def __init__(self, path: str, db_path: str, archive_path: str):
+        self.path = path
+        self.db_path = db_path
+        self.archive_path = archive_path
+        self._reset()
+        self._load()
+
+    def _reset(self) -> None:
+        self.epochs: List[int] = []
+        self.ids: List[str] = []
+        self.archive_pos: List[int] = []
+        self.active: Dict[str, int] = {}  # ID активного тикета -> epoch
+        self.archive_count = 0
+        self.tickets_signature: Optional[List[int]] = None
+        self.archive_signature: Optional[List[int]] = None
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if data.get('version') != INDEX_VERSION:
+            return
+        self.epochs = data['epochs']
+        self.ids = data['ids']
+        self.archive_pos = data['archive_pos']
+        self.archive_count = data['archive_count']
+        self.tickets_signature = data['tickets_signature']
+        self.archive_signature = data['archive_signature']
+        self.active = {
+            ticket_id: epoch for ticket_id, epoch, pos in zip(self.ids, self.epochs, self.archive_pos) if pos < 0
+        }
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'archive_count': self.archive_count,
+                'tickets_signature': self.tickets_signature,
+                'archive_signature': self.archive_signature,
+                'epochs': self.epochs,
+                'ids': self.ids,
+                'archive_pos': self.archive_pos,
+            }, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # Изменение индекса
+    def _find(self, epoch: int, ticket_id: str) -> int:
+        i = bisect_left(self.epochs, epoch)
+        while i < len(self.epochs) and self.epochs[i] == epoch:
+            if self.ids[i] == ticket_id:
+                return i
+            i += 1
+        return -1
+
+    def _put(self, ticket: Dict[str, Any], pos: int) -> None:
+        """Добавляет тикет или обновляет его позицию в архиве"""
+        ticket_id = ticket.get('ticket_id')
+        if not ticket_id or not ticket.get('created_at'):
+            return
+        epoch = created_epoch(ticket['created_at'])
+        i = self._find(epoch, ticket_id)
+        if i >= 0:
+            self.archive_pos[i] = pos
+        elif self.epochs and epoch >= self.epochs[-1]:
+            # Обычный случай: новый тикет позже всех
+            self.epochs.append(epoch)
+            self.ids.append(ticket_id)
+            self.archive_pos.append(pos)
+        else:
+            i = bisect_left(self.epochs, epoch)
+            self.epochs.insert(i, epoch)
+            self.ids.insert(i, ticket_id)
+            self.archive_pos.insert(i, pos)
+        if pos < 0:
+            self.active[ticket_id] = epoch
+        else:
+            self.active.pop(ticket_id, None)
+
+    def _remove_active(self, ticket_id: str) -> None:
+        epoch = self.active.pop(ticket_id)
+        i = self._find(epoch, ticket_id)
+        if i >= 0:
+            del self.epochs[i], self.ids[i], self.archive_pos[i]
+
+    def in_sync(self) -> bool:
+        """Вызывается до записи файлов базы: был ли индекс актуален"""
+        return (file_signature(self.db_path) == self.tickets_signature
+                and file_signature(self.archive_path) == self.archive_signature)
+
+    def apply(self, was_in_sync: bool, created: Sequence[Dict[str, Any]] = (),
+              archived: Sequence[Dict[str, Any]] = (), first_archive_pos: int = 0) -> None:
+        """Изменения, только что записанные этим процессом
+
+        Если до записи индекс был актуален, запоминаются новые подписи
+        файлов, и sync() не будет перечитывать их; иначе sync() догонит
+        и чужие изменения. Файл индекса перезаписывается, только когда
+        меняется состав индекса: обычные обновления тикетов его не трогают.
+        """
+        for ticket in created:
+            self._put(ticket, -1)
+        for offset, ticket in enumerate(archived):
+            self._put(ticket, first_archive_pos + offset)
+        if archived:
+            self.archive_count = first_archive_pos + len(archived)
+        if was_in_sync:
+            self.tickets_signature = file_signature(self.db_path)
+            self.archive_signature = file_signature(self.archive_path)
+        if created or archived:
+            self.save()
+
+    def sync(self, load_tickets: Callable[[], List[Dict[str, Any]]], archive_count: Callable[[], int],
+             iter_archive: Callable[[int], Iterable[Dict[str, Any]]]) -> bool:
+        """Догоняет изменения файлов, сделанные в обход этого объекта; True - индекс изменился
+
+        iter_archive(start) - тикеты архива с позиции start: читается
+        только дописанный хвост архива.
+        """
+        tickets_signature = file_signature(self.db_path)
+        archive_signature = file_signature(self.archive_path)
+        changed = False
+
+        if archive_signature != self.archive_signature:
+            count = archive_count()
+            if count < self.archive_count:
+                # Архив перезаписан (очистка, сжатие) - индекс строится заново
+                self._reset()
+            for pos, ticket in enumerate(iter_archive(self.archive_count), self.archive_count):
+                self._put(ticket, pos)
+                count = max(count, pos + 1)
+            changed = count != self.archive_count or changed
+            self.archive_count = count
+            self.archive_signature = archive_signature
+            # Тикеты, ушедшие в архив, больше не активные - сверяем и активный файл
+            self.tickets_signature = None
+
+        if tickets_signature != self.tickets_signature:
+            tickets = load_tickets()
+            current = {t.get('ticket_id') for t in tickets}
+            for ticket_id in [i for i in self.active if i not in current]:
+                # Удален из активных без архивации (очистка базы)
+                self._remove_active(ticket_id)
+                changed = True
+            for ticket in tickets:
+                if ticket.get('ticket_id') not in self.active:
+                    self._put(ticket, -1)
+                    changed = True
+            self.tickets_signature = tickets_signature
+
+        if changed:
+            self.save()
+        return changed
+
+    def rebuild(self, load_tickets: Callable[[], List[Dict[str, Any]]], archive_count: Callable[[], int],
+                iter_archive: Callable[[int], Iterable[Dict[str, Any]]]) -> None:
+        """Строит индекс заново (после перезаписи файлов базы)"""
+        self._reset()
+        self.sync(load_tickets, archive_count, iter_archive)
+        self.save()
+
+    # Запросы
+    def between(self, start: datetime, end: datetime) -> List[Tuple[str, int]]:
+        """(ticket_id, позиция в архиве или -1) для start <= created_at < end по возрастанию времени"""
+        low = bisect_left(self.epochs, int((start - EPOCH).total_seconds()))
+        high = bisect_left(self.epochs, int((end - EPOCH).total_seconds()))
+        return list(zip(self.ids[low:high], self.archive_pos[low:high]))
@@ -0,0 +1,129 @@
+import heapq
+import itertools
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import LAB_TIMEOUT
+from utils import get_msk_time, parse_msk_time
+
+# Статусы тикета, пока проба в лаборатории
+LAB_STATUSES = ('sample_sent', 'sample_received', 'analysis_in_progress')
+
+
+def lab_deadline(ticket: Dict[str, Any]) -> datetime:
+    """Срок анализа (naive, МСК): последняя отправка пробы в лабораторию + LAB_TIMEOUT"""
+    sent = [e['timestamp'] for e in ticket.get('history') or []
+            if e.get('action') == 'sample_sent_to_lab' and e.get('timestamp')]
+    since = max(sent, key=parse_msk_time) if sent else ticket['created_at']
+    return parse_msk_time(since) + timedelta(minutes=LAB_TIMEOUT)
+
+
+class LabQueue:
+    """Очередь лаборатории по остатку времени до LAB_TIMEOUT
+
+    Куча (heapq) из (срок, порядковый номер, ID тикета): самая срочная
+    проба всегда сверху. Очередь хранит только сроки и догоняет журнал
+    событий базы чтением новых строк, как проекции EventLog, поэтому
+    пробы, отправленные через бота, встают по сроку и на доске сайта.
+    Сами тикеты (с версией для проверки при записи) всегда берутся из
+    базы, куча задает только порядок. Тикет, вышедший из лаборатории, из
+    кучи сразу не удаляется: его запись отбрасывается, когда доходит до
+    верха или при перестройке кучи.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._deadlines: Dict[str, datetime] = {}  # тикеты в лаборатории -> срок
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._counter = itertools.count()
+        self._offset: Optional[int] = None
+
+    def _load(self) -> None:
+        """Начальные сроки из tickets.json; журнал дальше читается с его текущего конца"""
+        try:
+            offset = os.path.getsize(self.db.events.path)
+        except OSError:
+            offset = 0
+        self._deadlines, self._heap = {}, []
+        for ticket in self.db.get_lab_tickets():
+            if ticket.get('ticket_id'):
+                self._push(ticket['ticket_id'], lab_deadline(ticket))
+        # События после замера размера, уже попавшие в tickets.json, применятся
+        # повторно: срок считается по времени события, поэтому результат тот же
+        self._offset = offset
+
+    def _push(self, ticket_id: str, deadline: datetime) -> None:
+        self._deadlines[ticket_id] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), ticket_id))
+
+    def _discard(self, ticket_id: str) -> None:
+        self._deadlines.pop(ticket_id, None)
+        if len(self._heap) > 2 * len(self._deadlines) + 16:
+            # Устаревших записей больше половины - куча перестраивается
+            self._heap = [entry for entry in self._heap if self._deadlines.get(entry[2]) == entry[0]]
+            heapq.heapify(self._heap)
+
+    def _apply(self, event: Dict[str, Any]) -> None:
+        ticket_id = event['ticket_id']
+        if event['type'] in ('archived', 'deleted'):
+            self._discard(ticket_id)
+            return
+        status = event['data'].get('status') if event['type'] == 'updated' else None
+        if status is None:
+            return
+        if status not in LAB_STATUSES:
+            self._discard(ticket_id)
+        elif status == 'sample_sent':
+            # Проба пришла (в том числе повторно после корректировки) - новый срок
+            deadline = parse_msk_time(event['at']) + timedelta(minutes=LAB_TIMEOUT)
+            if self._deadlines.get(ticket_id) != deadline:
+                self._push(ticket_id, deadline)
+
+    def refresh(self) -> None:
+        """Догоняет журнал событий (и других процессов)"""
+        with self._lock:
+            try:
+                size = os.path.getsize(self.db.events.path)
+            except OSError:
+                size = 0
+            if self._offset is None or size < self._offset:
+                # Первый вызов или журнал пересоздан
+                self._load()
+            for offset, event in self.db.events.read(self._offset):
+                self._apply(event)
+                self._offset = offset
+
+    def tickets(self, now: Optional[datetime] = None) -> List[Tuple[Dict[str, Any], int]]:
+        """(тикет, минут до LAB_TIMEOUT; меньше нуля - просрочка) от самого срочного"""
+        return self.page(0, None, now)[0]
+
+    def page(self, offset: int, limit: Optional[int],
+             now: Optional[datetime] = None) -> Tuple[List[Tuple[Dict[str, Any], int]], int]:
+        """Страница очереди: (элементы tickets() с offset, не больше limit; всего проб)
+
+        Тикеты - текущие записи tickets.json. Тикет, которого еще нет в
+        куче (событие не дочитано), встает по сроку из своей истории.
+        """
+        self.refresh()
+        lab = {t['ticket_id']: t for t in self.db.get_lab_tickets() if t.get('ticket_id')}
+        now = now or get_msk_time().replace(tzinfo=None)
+        with self._lock:
+            while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            missing = sorted((lab_deadline(ticket), ticket_id) for ticket_id, ticket in lab.items()
+                             if ticket_id not in self._deadlines)
+            # Для страницы из кучи нужны первые offset + limit годных записей и все негодные
+            # (устаревшие сроки и тикеты, уже вышедшие из лаборатории по данным базы)
+            in_lab = sum(1 for ticket_id in self._deadlines if ticket_id in lab)
+            count = len(self._heap) if limit is None else offset + limit + len(self._heap) - in_lab
+            queued = [(deadline, ticket_id) for deadline, _, ticket_id in heapq.nsmallest(count, self._heap)
+                      if self._deadlines.get(ticket_id) == deadline and ticket_id in lab]
+        ordered = heapq.merge(queued, missing)
+        stop = None if limit is None else offset + limit
+        return [
+            (lab[ticket_id], int((deadline - now).total_seconds() // 60))
+            for deadline, ticket_id in itertools.islice(ordered, offset, stop)
+        ], len(lab)
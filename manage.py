@@ -0,0 +1,171 @@
+"""Служебные команды для файлов базы
+
+    python manage.py backfill-durations
+    python manage.py backfill-durations --force --archive archive_tickets.json
+    python manage.py events-bootstrap
+    python manage.py events-rebuild --out rebuilt
+    python manage.py compact --dry-run
+    python manage.py archive-roll
+    python manage.py archive-freeze --days 90
+    python manage.py backup
+    python manage.py backup-restore --out restored
+"""
+import argparse
+import json
+import os
+import time
+
+from backup import BackupStore
+from config import COLD_SEGMENT_AGE_DAYS
+from database import Database, archive_line, rebuild_from_events
+from search import SearchIndex
+
+
+def backfill_durations(args) -> None:
+    """Сводка durations для тикетов, заархивированных до ее появления"""
+    db = Database(args.db, args.archive)
+    started = time.perf_counter()
+    changed = db.backfill_durations(force=args.force)
+    print(f"Обновлено тикетов архива: {changed} за {time.perf_counter() - started:.1f} с")
+
+
+def events_bootstrap(args) -> None:
+    """Журнал событий для базы, которая велась до его появления"""
+    db = Database(args.db, args.archive)
+    count = db.bootstrap_events()
+    if count:
+        print(f"Журнал событий создан: {count} событий ({db.events.path})")
+    else:
+        print(f"Журнал событий уже есть: {db.events.path}")
+
+
+def events_rebuild(args) -> None:
+    """Восстанавливает tickets.json и архив из журнала событий в каталог --out"""
+    db = Database(args.db, args.archive)
+    started = time.perf_counter()
+    active, archive = rebuild_from_events(event for _, event in db.events.read())
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, os.path.basename(args.db)), 'w', encoding='utf-8') as f:
+        json.dump(active, f, ensure_ascii=False, indent=2)
+    # Архив - JSON Lines, как его пишет Database
+    with open(os.path.join(args.out, os.path.basename(args.archive)), 'wb') as f:
+        f.writelines(archive_line(ticket) for ticket in archive)
+    print(f"Активных тикетов: {len(active)}, в архиве: {len(archive)} "
+          f"({args.out}, {time.perf_counter() - started:.1f} с)")
+
+
+def compact(args) -> None:
+    """Сжатие базы: закрытые тикеты в архив, единый формат времени, без поля action"""
+    db = Database(args.db, args.archive)
+    report = db.compact(dry_run=args.dry_run)
+    print(f"{'Будет перенесено' if args.dry_run else 'Перенесено'} в архив: {report['moved']}, "
+          f"изменено тикетов: {report['changed']}")
+    print(f"Активных тикетов: {report['active']}, в архиве: {report['archive']}")
+    for name in ('tickets', 'archive'):
+        before, after = report[f'{name}_bytes']
+        parse_before, parse_after = report[f'{name}_parse_seconds']
+        print(f"{name}: {before / 1024:.1f} -> {after / 1024:.1f} КБ ({(after - before) / 1024:+.1f} КБ), "
+              f"разбор {parse_before * 1000:.2f} -> {parse_after * 1000:.2f} мс")
+    before, after = report['tickets_parse_seconds']
+    print(f"Каждое чтение активных тикетов быстрее на {(before - after) * 1000:.2f} мс")
+    if report['invalid_mixers']:
+        print(f"Активные тикеты с неизвестными миксерами: {', '.join(map(str, report['invalid_mixers']))}")
+    if not args.dry_run:
+        SearchIndex(db).rebuild()
+        print("Индексы перестроены")
+
+
+def archive_roll(args) -> None:
+    """Закрытие текущего файла архива как сегмента"""
+    db = Database(args.db, args.archive)
+    segment = db.roll_archive()
+    if segment:
+        print(f"Новый сегмент архива: {segment}")
+    else:
+        print("Текущий файл архива пуст")
+
+
+def archive_freeze(args) -> None:
+    """Сжатие старых сегментов архива в gzip JSON Lines"""
+    db = Database(args.db, args.archive)
+    before = sum(os.path.getsize(path) for path in db.archive_segments())
+    frozen = db.freeze_segments(args.days)
+    after = sum(os.path.getsize(path) for path in db.archive_segments())
+    print(f"Сжато сегментов: {len(frozen)}, сегменты архива {before / 1024:.1f} -> {after / 1024:.1f} КБ")
+
+
+def backup(args) -> None:
+    """Резервная копия файлов базы и очистка старых копий"""
+    store = BackupStore(Database(args.db, args.archive))
+    started = time.perf_counter()
+    manifest = store.create()
+    removed = store.prune()
+    print(f"Копия {manifest['id']}: {len(manifest['files'])} файлов, {manifest['total_bytes'] / 1024:.1f} КБ, "
+          f"новых данных {manifest['new_bytes'] / 1024:.1f} КБ ({manifest['new_chunks']} блоков), "
+          f"{time.perf_counter() - started:.1f} с")
+    if removed:
+        print(f"Удалено старых копий: {removed}")
+
+
+def backup_list(args) -> None:
+    store = BackupStore(Database(args.db, args.archive))
+    for manifest in store.manifests():
+        print(f"{manifest['id']}  {len(manifest['files'])} файлов  {manifest['total_bytes'] / 1024:.1f} КБ  "
+              f"(новых {manifest['new_bytes'] / 1024:.1f} КБ)")
+
+
+def backup_restore(args) -> None:
+    """Восстановление копии в каталог --out или на место (бот и сайт остановлены)"""
+    store = BackupStore(Database(args.db, args.archive))
+    started = time.perf_counter()
+    manifest = store.restore(args.id, args.out)
+    print(f"Восстановлена копия {manifest['id']}: {', '.join(manifest['files'])} "
+          f"({time.perf_counter() - started:.1f} с)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="tickets.json", help="файл активных тикетов")
+    parser.add_argument("--archive", default="archive_tickets.json", help="файл архива")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill-durations", help="посчитать время по статусам для старого архива")
+    backfill.add_argument("--force", action="store_true", help="пересчитать и у тикетов, где сводка уже есть")
+    backfill.set_defaults(handler=backfill_durations)
+
+    commands.add_parser(
+        "events-bootstrap", help="создать журнал событий по текущим тикетам и архиву"
+    ).set_defaults(handler=events_bootstrap)
+
+    rebuild = commands.add_parser("events-rebuild", help="восстановить файлы базы из журнала событий")
+    rebuild.add_argument("--out", required=True, help="каталог для восстановленных файлов")
+    rebuild.set_defaults(handler=events_rebuild)
+
+    compaction = commands.add_parser(
+        "compact", help="перенести закрытые тикеты в архив и нормализовать записи (бот и сайт остановлены)"
+    )
+    compaction.add_argument("--dry-run", action="store_true", help="только отчет, файлы не меняются")
+    compaction.set_defaults(handler=compact)
+
+    commands.add_parser(
+        "archive-roll", help="закрыть текущий файл архива как сегмент (бот и сайт остановлены)"
+    ).set_defaults(handler=archive_roll)
+
+    freeze = commands.add_parser("archive-freeze", help="сжать старые сегменты архива")
+    freeze.add_argument("--days", type=int, default=COLD_SEGMENT_AGE_DAYS,
+                        help="сжимать сегменты, все тикеты которых завершены раньше стольких суток назад")
+    freeze.set_defaults(handler=archive_freeze)
+
+    commands.add_parser("backup", help="создать резервную копию").set_defaults(handler=backup)
+    commands.add_parser("backup-list", help="список резервных копий").set_defaults(handler=backup_list)
+    restore = commands.add_parser("backup-restore", help="восстановить резервную копию")
+    restore.add_argument("--id", help="копия из backup-list; по умолчанию последняя")
+    restore.add_argument("--out", help="каталог для файлов; по умолчанию файлы базы заменяются на месте")
+    restore.set_defaults(handler=backup_restore)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence, Tuple
+
+from telegram.request import HTTPXRequest
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Монотонно растущий счетчик с метками"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма длительностей с метками (накопительные бакеты)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики по бакетам..., сумма, количество]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет время выполнения блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return int(state[-1]) if state else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound:g}"')
+                    lines.append(f"{self.name}_bucket{labels} {count:g}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {state[-1]:g}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]:g}")
+        return lines
+
+
+class MetricsRegistry:
+    """Метрики процесса (веб-приложения или бота)"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus"""
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Хранилище (database.py)
+STORAGE_SECONDS = REGISTRY.histogram(
+    "gms_storage_operation_seconds", "Время чтения/записи файлов хранилища", ["operation", "file"]
+)
+STORAGE_BYTES = REGISTRY.counter(
+    "gms_storage_bytes_total", "Байт прочитано/записано в файлы хранилища", ["operation", "file"]
+)
+
+# Веб-приложение (app.py)
+HTTP_REQUESTS = REGISTRY.counter(
+    "gms_http_requests_total", "Запросы к веб-приложению", ["endpoint", "method", "status"]
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "gms_http_request_seconds", "Время обработки запросов веб-приложения", ["endpoint"]
+)
+
+# Бот (bot.py)
+BOT_HANDLER_SECONDS = REGISTRY.histogram(
+    "gms_bot_handler_seconds", "Время работы обработчиков бота", ["handler"]
+)
+BOT_HANDLER_ERRORS = REGISTRY.counter(
+    "gms_bot_handler_errors_total", "Исключения в обработчиках бота", ["handler"]
+)
+TELEGRAM_REQUESTS = REGISTRY.counter(
+    "gms_telegram_requests_total", "Запросы к Telegram Bot API", ["method", "status"]
+)
+TELEGRAM_SECONDS = REGISTRY.histogram(
+    "gms_telegram_request_seconds", "Время запросов к Telegram Bot API", ["method"]
+)
+
+
+def _files_size(paths) -> int:
+    """Суммарный размер существующих файлов"""
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def instrument_storage(operation: str, file_label: str, path_attr: str):
+    """Декоратор для методов Database: время операции и объем прочитанного/записанного
+
+    path_attr - атрибут с путем к файлу или метод, возвращающий список файлов
+    (архив читается по всем сегментам). load и save читают/пишут файлы
+    целиком, поэтому считается их размер; append дописывает в конец файла,
+    поэтому считается только прирост размера.
+    """
+    def paths_of(self) -> List[str]:
+        paths = getattr(self, path_attr)
+        return paths() if callable(paths) else [paths]
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            before = _files_size(paths_of(self)) if operation == "append" else 0
+            with STORAGE_SECONDS.time(operation=operation, file=file_label):
+                result = func(self, *args, **kwargs)
+            written = _files_size(paths_of(self)) - before
+            if written > 0:
+                STORAGE_BYTES.inc(written, operation=operation, file=file_label)
+            return result
+        return wrapper
+    return decorator
+
+
+def instrument_handler(callback):
+    """Оборачивает async-обработчик бота замером времени и счетчиком ошибок"""
+    name = getattr(callback, "__name__", "handler")
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            BOT_HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            BOT_HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+    return wrapper
+
+
+def wrap_application_handlers(application, wrap) -> None:
+    """Применяет wrap ко всем обработчикам приложения, включая вложенные в ConversationHandler"""
+    def walk(handlers):
+        for handler in handlers:
+            nested = []
+            for attr in ("entry_points", "fallbacks"):
+                nested.extend(getattr(handler, attr, None) or [])
+            states = getattr(handler, "states", None)
+            if isinstance(states, dict):
+                for state_handlers in states.values():
+                    nested.extend(state_handlers)
+            if nested:
+                walk(nested)
+            elif getattr(handler, "callback", None) is not None:
+                handler.callback = wrap(handler.callback)
+
+    for group_handlers in application.handlers.values():
+        walk(group_handlers)
+
+
+def instrument_application_handlers(application) -> None:
+    """Оборачивает все обработчики приложения замером времени"""
+    wrap_application_handlers(application, instrument_handler)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTP-клиент Bot API, который считает вызовы и их время по методам"""
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        status = "error"
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            status = str(code)
+            return code, payload
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, method=api_method)
+            TELEGRAM_REQUESTS.inc(method=api_method, status=status)
+
+
+def start_metrics_server(host: str, port: int, registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """Запускает /metrics в фоновом потоке (для бота, у которого нет Flask)"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
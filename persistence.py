@@ -0,0 +1,159 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранение состояний ConversationHandler и user_data в SQLite
+
+    Чтобы рестарт бота не выкидывал операторов из середины сценария:
+    - user_data не читается целиком при старте, а подгружается для
+      пользователя при первом его апдейте (refresh_user_data);
+    - изменения копятся в памяти и записываются одной транзакцией в
+      фоновом потоке, не задерживая обработку апдейтов.
+    """
+
+    def __init__(self, path: str = "bot_state.sqlite3", update_interval: float = 5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn_lock = threading.Lock()
+        self._create_tables()
+
+        self._loaded_users: Set[int] = set()
+        # None в значении означает удаление записи
+        self._pending_user_data: Dict[int, Optional[str]] = {}
+        self._pending_conversations: Dict[Tuple[str, str], Optional[int]] = {}
+        self._write_task: Optional[asyncio.Task] = None
+
+    def _create_tables(self):
+        """Создает таблицы при первом запуске"""
+        with self._conn_lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, state INTEGER NOT NULL, PRIMARY KEY (name, key))"
+            )
+
+    def _load_user_row(self, user_id: int) -> Optional[str]:
+        with self._conn_lock:
+            row = self._conn.execute("SELECT data FROM user_data WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def _commit(self, user_data: Dict[int, Optional[str]], conversations: Dict[Tuple[str, str], Optional[int]]):
+        """Записывает накопленные изменения одной транзакцией"""
+        with self._conn_lock, self._conn:
+            for user_id, data in user_data.items():
+                if data is None:
+                    self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)", (user_id, data)
+                    )
+            for (name, key), state in conversations.items():
+                if state is None:
+                    self._conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                        (name, key, state)
+                    )
+
+    async def _write_pending(self) -> None:
+        """Сбрасывает накопленные изменения на диск в отдельном потоке"""
+        # Даем PTB поставить в очередь все изменения текущего цикла сохранения
+        await asyncio.sleep(0)
+        while self._pending_user_data or self._pending_conversations:
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            await asyncio.to_thread(self._commit, user_data, conversations)
+
+    def _schedule_write(self) -> None:
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    # user_data: ленивая загрузка по пользователю
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        if user_id in self._pending_user_data:
+            return
+        data = await asyncio.to_thread(self._load_user_row, user_id)
+        if data and not user_data:
+            user_data.update(json.loads(data))
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._loaded_users.add(user_id)
+        self._pending_user_data[user_id] = json.dumps(data, ensure_ascii=False, default=str)
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._loaded_users.discard(user_id)
+        self._pending_user_data[user_id] = None
+        self._schedule_write()
+
+    # Состояния разговоров: их немного, читаются одним запросом при старте
+    async def get_conversations(self, name: str) -> Dict[Tuple[Any, ...], object]:
+        def load():
+            with self._conn_lock:
+                return self._conn.execute(
+                    "SELECT key, state FROM conversations WHERE name = ?", (name,)
+                ).fetchall()
+
+        rows = await asyncio.to_thread(load)
+        return {tuple(json.loads(key)): state for key, state in rows}
+
+    async def update_conversation(self, name: str, key: Tuple[Any, ...], new_state: Optional[object]) -> None:
+        self._pending_conversations[(name, json.dumps(list(key)))] = new_state
+        self._schedule_write()
+
+    async def flush(self) -> None:
+        """Дописывает все изменения при остановке бота"""
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
+        with self._conn_lock:
+            self._conn.close()
+
+    # chat_data, bot_data и callback_data бот не использует
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
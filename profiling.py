@@ -0,0 +1,278 @@
+import cProfile
+import functools
+import glob
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from config import PROFILE_DIR
+
+MODES = ("cprofile", "sampling")
+
+# Сколько секунд take() доверяет прочитанному armed.json, не проверяя файл
+ARMED_CHECK_SECONDS = 1.0
+
+
+def _short_path(filename: str) -> str:
+    """Последние два компонента пути: flask/app.py не путается с app.py проекта"""
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:]) if len(parts) > 1 else filename
+
+
+class StackSampler:
+    """Сэмплирующий профайлер одного потока
+
+    Фоновый поток раз в interval секунд снимает стек профилируемого потока
+    через sys._current_frames(). Накладные расходы не зависят от числа
+    вызовов функций, поэтому режим можно включать в продакшене.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.self_counts[self._label(frame)] += 1
+            seen = set()
+            while frame is not None:
+                label = self._label(frame)
+                if label not in seen:
+                    self.total_counts[label] += 1
+                    seen.add(label)
+                frame = frame.f_back
+
+    @staticmethod
+    def _label(frame) -> str:
+        code = frame.f_code
+        return f"{_short_path(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'interval': self.interval,
+            'samples': self.samples,
+            'self': dict(self.self_counts),
+            'total': dict(self.total_counts),
+        }
+
+
+class Profiler:
+    """Профилирование следующих N запросов к маршруту или вызовов обработчика
+
+    Цели включаются через файл armed.json в profile_dir, поэтому веб-панель
+    может включить профилирование и для процесса бота. Цель называется
+    "route:<endpoint>" для Flask или "handler:<имя функции>" для бота.
+
+    В боте обработчики работают в одном потоке событийного цикла, поэтому
+    в профиль попадает и то, что цикл выполнял параллельно с обработчиком.
+    cProfile в процессе может работать только один: сессии cProfile идут
+    по очереди, а вызов, начавшийся во время чужой сессии, профилируется
+    сэмплированием.
+    """
+
+    def __init__(self, profile_dir: str = PROFILE_DIR):
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._armed: Dict[str, Dict[str, Any]] = {}
+        self._armed_mtime: Optional[float] = None
+        self._armed_checked = 0.0
+        self._cprofile_busy = threading.Lock()
+
+    @property
+    def armed_path(self) -> str:
+        return os.path.join(self.profile_dir, "armed.json")
+
+    def _read_armed(self, max_age: float = 0.0) -> Dict[str, Dict[str, Any]]:
+        """Читает armed.json, только если он изменился; max_age - сколько секунд не проверять файл"""
+        if max_age and time.monotonic() - self._armed_checked < max_age:
+            return self._armed
+        self._armed_checked = time.monotonic()
+        try:
+            mtime = os.stat(self.armed_path).st_mtime
+        except OSError:
+            self._armed, self._armed_mtime = {}, None
+            return self._armed
+        if mtime != self._armed_mtime:
+            try:
+                with open(self.armed_path, 'r', encoding='utf-8') as f:
+                    self._armed = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._armed = {}
+            self._armed_mtime = mtime
+        return self._armed
+
+    def _write_armed(self, armed: Dict[str, Dict[str, Any]]) -> None:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        tmp_path = self.armed_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(armed, f, ensure_ascii=False)
+        os.replace(tmp_path, self.armed_path)
+        self._armed, self._armed_mtime = armed, os.stat(self.armed_path).st_mtime
+
+    def arm(self, target: str, count: int, mode: str = "cprofile") -> None:
+        """Включает профилирование следующих count вызовов цели"""
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode}")
+        with self._lock:
+            armed = dict(self._read_armed())
+            if count > 0:
+                armed[target] = {'remaining': count, 'mode': mode}
+            else:
+                armed.pop(target, None)
+            self._write_armed(armed)
+
+    def armed(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return dict(self._read_armed())
+
+    def take(self, target: str) -> Optional[str]:
+        """Списывает один вызов цели; возвращает режим или None, если цель не включена"""
+        # Частый путь (цель не включена) - без обращения к файлу чаще раза в ARMED_CHECK_SECONDS
+        if not self._read_armed(ARMED_CHECK_SECONDS).get(target):
+            return None
+        with self._lock:
+            armed = dict(self._read_armed())
+            entry = armed.get(target)
+            if not entry:
+                return None
+            if entry['remaining'] <= 1:
+                armed.pop(target)
+            else:
+                armed[target] = dict(entry, remaining=entry['remaining'] - 1)
+            self._write_armed(armed)
+            return entry['mode']
+
+    def start(self, target: str) -> Optional[Dict[str, Any]]:
+        """Начинает сессию профилирования, если цель включена"""
+        mode = self.take(target)
+        if mode is None:
+            return None
+        if mode == "cprofile" and not self._cprofile_busy.acquire(blocking=False):
+            # Идет другая сессия cProfile (параллельный обработчик или запрос):
+            # второй профайлер заменил бы первый и испортил оба профиля
+            mode = "sampling"
+        session = {'target': target, 'mode': mode, 'started': time.perf_counter()}
+        if mode == "cprofile":
+            session['profile'] = cProfile.Profile()
+            try:
+                session['profile'].enable()
+            except ValueError:
+                # cProfile включен в обход Profiler (Python 3.12+ это проверяет)
+                self._cprofile_busy.release()
+                return None
+        else:
+            session['sampler'] = StackSampler(threading.get_ident())
+            session['sampler'].start()
+        return session
+
+    def finish(self, session: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Завершает сессию и сохраняет результат; возвращает путь к файлу"""
+        if session is None:
+            return None
+        if session['mode'] == "cprofile":
+            session['profile'].disable()
+            self._cprofile_busy.release()
+        elapsed_ms = int((time.perf_counter() - session['started']) * 1000)
+        os.makedirs(self.profile_dir, exist_ok=True)
+        safe_target = session['target'].replace(":", "_").replace("/", "_")
+        base = os.path.join(self.profile_dir, f"{safe_target}_{time.strftime('%Y%m%d-%H%M%S')}_{elapsed_ms}ms_{os.getpid()}")
+
+        if session['mode'] == "cprofile":
+            path = base + ".pstats"
+            session['profile'].dump_stats(path)
+        else:
+            session['sampler'].stop()
+            path = base + ".samples.json"
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(dict(session['sampler'].to_dict(), target=session['target']), f, ensure_ascii=False)
+        return path
+
+    def wrap_handler(self, callback):
+        """Оборачивает async-обработчик бота: профилирует, когда он включен"""
+        target = f"handler:{getattr(callback, '__name__', 'handler')}"
+
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            session = self.start(target)
+            try:
+                return await callback(update, context)
+            finally:
+                self.finish(session)
+        return wrapper
+
+    def list_profiles(self, target: str = None) -> List[Dict[str, Any]]:
+        """Сохраненные профили (новые сверху)"""
+        prefix = target.replace(":", "_").replace("/", "_") + "_" if target else ""
+        files = glob.glob(os.path.join(self.profile_dir, f"{prefix}*.pstats"))
+        files += glob.glob(os.path.join(self.profile_dir, f"{prefix}*.samples.json"))
+        files.sort(key=os.path.getmtime, reverse=True)
+        return [{
+            'name': os.path.basename(path),
+            'path': path,
+            'size': os.path.getsize(path),
+            'mode': 'cprofile' if path.endswith('.pstats') else 'sampling',
+        } for path in files]
+
+    def top_functions(self, target: str = None, limit: int = 30) -> Dict[str, Any]:
+        """Сводный топ функций по всем сохраненным профилям цели"""
+        profiles = self.list_profiles(target)
+        result: Dict[str, Any] = {'cprofile': [], 'sampling': [], 'cprofile_files': 0, 'sampling_files': 0}
+
+        pstats_files = [p['path'] for p in profiles if p['mode'] == 'cprofile']
+        if pstats_files:
+            stats = pstats.Stats(*pstats_files)
+            rows = []
+            for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+                rows.append({
+                    'function': f"{_short_path(filename)}:{line}({func})",
+                    'calls': nc,
+                    'tottime': round(tt, 4),
+                    'cumtime': round(ct, 4),
+                })
+            rows.sort(key=lambda r: r['cumtime'], reverse=True)
+            result['cprofile'] = rows[:limit]
+            result['cprofile_files'] = len(pstats_files)
+
+        samples_total = 0
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for profile in profiles:
+            if profile['mode'] != 'sampling':
+                continue
+            with open(profile['path'], 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            samples_total += data['samples']
+            self_counts.update(data['self'])
+            total_counts.update(data['total'])
+            result['sampling_files'] += 1
+        if samples_total:
+            result['sampling'] = [{
+                'function': label,
+                'total_pct': round(100 * count / samples_total, 1),
+                'self_pct': round(100 * self_counts.get(label, 0) / samples_total, 1),
+            } for label, count in total_counts.most_common(limit)]
+        return result
+
+
+PROFILER = Profiler()
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import MSK_TIMEZONE_OFFSET
+
+# Лимит длины сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Элементов на странице и максимальная длина одного элемента:
+# PAGE_SIZE * MAX_ITEM_LENGTH + заголовок всегда меньше лимита Telegram
+PAGE_SIZE = 10
+MAX_ITEM_LENGTH = 350
+
+# Справочники для списков бота (строятся один раз при импорте)
+ACTIVE_STATUS_LABELS = {
+    'production_started': '🏭 Производство',
+    'awaiting_sample': '⏳ Ожидание пробы',
+    'sample_sent': '📤 Проба отправлена',
+    'sample_received': '🔬 В лаборатории',
+    'analysis_in_progress': '⚗️ Анализ',
+    'correction_required': '⚠️ Корректировка',
+    'awaiting_discharge': '🔄 Ожидание откачки'
+}
+
+LAB_STATUS_LABELS = {
+    'sample_sent': '📤 Ожидание приема',
+    'sample_received': '🔬 Принята',
+    'analysis_in_progress': '⚗️ Анализ'
+}
+
+# Шаги тикета на доске миксеров и в кнопках тикетов производства
+MIXER_STEP_LABELS = {
+    'awaiting_sample': 'Ожид. пробу',
+    'awaiting_lab_reception': 'Ожид. лаб',
+    'analysis_in_progress': 'Анализ',
+    'awaiting_discharge': 'Ожид. откачки',
+    'awaiting_correction': 'Ожид. исправления'
+}
+
+# Шаги тикета в кнопках действий лаборатории
+LAB_ACTION_STEP_LABELS = {
+    'awaiting_lab_reception': 'Ожид. приема',
+    'analysis_in_progress': 'Анализ'
+}
+
+# Шаги тикета в списке текущих анализов
+LAB_ANALYSIS_STEP_LABELS = {
+    'awaiting_lab_reception': 'Ожидание приема',
+    'analysis_in_progress': 'Анализ в процессе'
+}
+
+
+def format_minutes(minutes: int) -> str:
+    """Форматирует минуты как '45 мин' или '2ч 5мин'"""
+    if minutes < 60:
+        return f"{minutes} мин"
+    return f"{minutes // 60}ч {minutes % 60}мин"
+
+
+def format_active_item(ticket: Dict[str, Any]) -> str:
+    status_text = ACTIVE_STATUS_LABELS.get(ticket['status'], ticket['status'])
+    return (
+        f"• {ticket['ticket_id']} - {ticket['mixer']}\n"
+        f"  {ticket['product']} | {ticket['brand']}\n"
+        f"  {status_text}\n\n"
+    )
+
+
+def format_lab_deadline(minutes_left: int) -> str:
+    """Остаток времени до LAB_TIMEOUT: '⏳ 12 мин' или '🔥 просрочка 5 мин'"""
+    if minutes_left < 0:
+        return f"🔥 просрочка {format_minutes(-minutes_left)}"
+    return f"⏳ {format_minutes(minutes_left)}"
+
+
+def format_lab_item(item: Tuple[Dict[str, Any], int]) -> str:
+    ticket, minutes_left = item
+    step_text = LAB_STATUS_LABELS.get(ticket['status'], ticket['status'])
+
+    # Время с момента создания тикета
+    created_at_str = ticket['created_at']
+    if 'Z' in created_at_str:
+        created_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
+        created_at = created_at + timedelta(hours=MSK_TIMEZONE_OFFSET)
+        created_at = created_at.replace(tzinfo=None)
+    else:
+        created_at = datetime.fromisoformat(created_at_str.split('+')[0])
+    minutes = int((datetime.now() - created_at).total_seconds() / 60)
+
+    return (
+        f"• {ticket['ticket_id']} - {ticket['mixer']}\n"
+        f"  {ticket['product']} | {step_text}\n"
+        f"  Время: {format_minutes(minutes)} | {format_lab_deadline(minutes_left)}\n\n"
+    )
+
+
+def format_mixer_item(item: Tuple[str, Dict[str, Any]]) -> str:
+    mixer, info = item
+    if info.get('status') == 'free':
+        return f"✅ {mixer}: Свободен\n"
+    step_text = MIXER_STEP_LABELS.get(info.get('current_step', ''), info.get('current_step', 'В работе'))
+    return (
+        f"🔄 {mixer}: {info.get('product', 'N/A')} ({info.get('ticket_id', 'N/A')})\n"
+        f"   Шаг: {step_text}\n"
+        f"   Время: {format_minutes(info.get('total_time_minutes', 0))}\n\n"
+    )
+
+
+def format_search_item(result: Dict[str, Any]) -> str:
+    texts = "\n".join(f"  📝 {text}" for text in result.get('texts', []))
+    return (
+        f"• {result['ticket_id']} - {result.get('mixer', 'N/A')}\n"
+        f"  {result.get('product', 'N/A')} | {(result.get('created_at') or '')[:10]}\n"
+        f"{texts}\n\n"
+    )
+
+
+def page_count(total_items: int, page_size: int = PAGE_SIZE) -> int:
+    return max(1, (total_items + page_size - 1) // page_size)
+
+
+def page_bounds(page: int, total_items: int, page_size: int = PAGE_SIZE) -> Tuple[int, int]:
+    """(номер страницы после нормализации, смещение ее первого элемента)"""
+    page = min(max(page, 0), page_count(total_items, page_size) - 1)
+    return page, page * page_size
+
+
+def render_page(title: str, items: Sequence[Any], page: int, total_items: int,
+                format_item: Callable[[Any], str], page_size: int = PAGE_SIZE) -> Tuple[str, int, int]:
+    """Рендерит одну страницу списка
+
+    items - уже выбранные элементы страницы page (источник отдает только
+    их), total_items - длина всего списка. Возвращает (текст, номер
+    страницы после нормализации, количество страниц).
+    """
+    pages = page_count(total_items, page_size)
+    page = min(max(page, 0), pages - 1)
+
+    parts: List[str] = [title]
+    if pages > 1:
+        parts.append(f" (стр. {page + 1}/{pages})")
+    parts.append(":\n\n")
+    for item in items[:page_size]:
+        text = format_item(item)
+        if len(text) > MAX_ITEM_LENGTH:
+            text = text[:MAX_ITEM_LENGTH - 2] + "…\n"
+        parts.append(text)
+
+    return "".join(parts)[:TELEGRAM_MESSAGE_LIMIT], page, pages
+
+
+def page_keyboard(view: str, page: int, pages: int) -> Optional[InlineKeyboardMarkup]:
+    """Кнопки 'назад/вперед' для списка; None, если страница одна"""
+    if pages <= 1:
+        return None
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"page:{view}:{page - 1}"))
+    buttons.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f"page:{view}:{page}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton("Вперед ▶️", callback_data=f"page:{view}:{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
@@ -0,0 +1,239 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import SEARCH_INDEX_PATH
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файла индекса: при изменении токенизации или формата индекс строится заново
+INDEX_VERSION = 2
+
+# Через сколько секунд после изменения архивной части индекс сохраняется в файл (в фоне)
+SAVE_DELAY_SECONDS = 30
+
+TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+
+# Окончания русских слов, от длинных к коротким (упрощенный стеммер)
+RUSSIAN_ENDINGS = sorted([
+    'ившись', 'ывшись', 'ивши', 'ывши', 'ающий', 'яющий', 'ующий', 'ировать', 'ировал', 'ирован',
+    'ость', 'ости', 'ение', 'ения', 'ению', 'ением', 'ении', 'ание', 'ания', 'анию', 'анием', 'ании',
+    'ейший', 'ейшая', 'ейшее', 'ыми', 'ими', 'ого', 'его', 'ому', 'ему', 'ами', 'ями', 'ах', 'ях',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ом', 'ем', 'ам', 'ям',
+    'ов', 'ев', 'ить', 'ать', 'ять', 'еть', 'уть', 'ла', 'ло', 'ли', 'ть',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+# Основа короче этого не обрезается ("ph", "кг" и числа остаются как есть)
+MIN_STEM_LENGTH = 3
+
+
+def stem(word: str) -> str:
+    """Отрезает самое длинное известное окончание, оставляя основу не короче MIN_STEM_LENGTH"""
+    if not re.search('[а-я]', word):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Нижний регистр, ё -> е, слова и числа, основы слов"""
+    text = (text or '').lower().replace('ё', 'е')
+    return [stem(word) for word in TOKEN_RE.findall(text)]
+
+
+def ticket_texts(ticket: Dict[str, Any]) -> List[str]:
+    """Тексты тикета для поиска: корректировки и показатели анализов"""
+    texts = [c.get('note') for c in ticket.get('corrections_history') or []]
+    texts += [a.get('details') for a in ticket.get('analyses_history') or []]
+    return [text for text in texts if text]
+
+
+class SearchIndex:
+    """Инвертированный индекс по корректировкам и результатам анализов
+
+    postings: основа слова -> {ticket_id: число вхождений}; docs: ticket_id ->
+    краткие данные тикета, его тексты для выдачи и число вхождений каждой
+    основы, чтобы выдача не читала архив. Индекс догоняет базу
+    инкрементально: из архива (он только дописывается) берутся новые
+    записи, из активных тикетов - изменившиеся по version.
+
+    В файл пишется только архивная часть docs: postings восстанавливаются
+    из них при загрузке, активные тикеты (их немного) индексируются по
+    tickets.json заново при старте. Запись идет в фоновом потоке не чаще
+    раза в SAVE_DELAY_SECONDS и только после изменения архивной части,
+    поэтому поиск файл индекса не переписывает.
+    """
+
+    def __init__(self, db, path: str = SEARCH_INDEX_PATH, save_delay: float = SAVE_DELAY_SECONDS):
+        self.db = db
+        self.path = path
+        self.save_delay = save_delay
+        self._lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+        self._reset()
+        self._load()
+
+    def _reset(self) -> None:
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.archive_consumed = 0
+        self.archive_signature: Optional[List[int]] = None
+        self.active_versions: Dict[str, int] = {}
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if data.get('version') != INDEX_VERSION:
+            return
+        self.docs = data['docs']
+        for ticket_id, doc in self.docs.items():
+            for term, count in doc['terms'].items():
+                self.postings.setdefault(term, {})[ticket_id] = count
+        self.archive_consumed = data['archive_consumed']
+        self.archive_signature = data['archive_signature']
+
+    def _save(self) -> None:
+        """Записывает архивную часть индекса (вызывается под self._lock)"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'archive_consumed': self.archive_consumed,
+                'archive_signature': self.archive_signature,
+                'docs': {ticket_id: doc for ticket_id, doc in self.docs.items()
+                         if ticket_id not in self.active_versions},
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def _schedule_save(self) -> None:
+        """Отложенная запись в фоне; несколько изменений подряд дают одну запись"""
+        if self._save_timer is not None:
+            return
+
+        def run():
+            try:
+                with self._lock:
+                    self._save_timer = None
+                    self._save()
+            except Exception as e:
+                logger.error(f"Ошибка записи индекса поиска: {e}")
+
+        self._save_timer = threading.Timer(self.save_delay, run)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def _remove(self, ticket_id: str) -> None:
+        doc = self.docs.pop(ticket_id, None)
+        if doc is None:
+            return
+        for term in doc['terms']:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(ticket_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def _add(self, ticket: Dict[str, Any]) -> None:
+        ticket_id = ticket['ticket_id']
+        self._remove(ticket_id)
+        texts = ticket_texts(ticket)
+        counts: Dict[str, int] = {}
+        for text in texts:
+            for term in tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+        if not counts:
+            return
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[ticket_id] = count
+        self.docs[ticket_id] = {
+            'product': ticket.get('product'),
+            'mixer': ticket.get('mixer'),
+            'created_at': ticket.get('created_at'),
+            'texts': texts,
+            'terms': counts,
+            'length': sum(counts.values()),
+        }
+
+    def _archive_signature(self) -> Optional[List[int]]:
+        try:
+            stat = os.stat(self.db.archive_path)
+            return [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            return None
+
+    def refresh(self) -> bool:
+        """Догоняет базу; возвращает True, если индекс изменился"""
+        with self._lock:
+            changed = False
+            signature = self._archive_signature()
+            if signature != self.archive_signature:
+                if self.db.archive_count() < self.archive_consumed:
+                    # Архив перезаписан - индекс строится заново
+                    self._reset()
+                # Читается только дописанный хвост архива
+                for ticket in self.db.iter_archive(self.archive_consumed):
+                    self._add(ticket)
+                    self.active_versions.pop(ticket.get('ticket_id'), None)
+                    self.archive_consumed += 1
+                self.archive_signature = signature
+                self._schedule_save()
+                changed = True
+
+            active = {t['ticket_id']: t for t in self.db._load_tickets() if t.get('ticket_id')}
+            for ticket_id in list(self.active_versions):
+                if ticket_id not in active:
+                    # Удален из активных, но в архив не попал (очистка базы)
+                    self._remove(ticket_id)
+                    del self.active_versions[ticket_id]
+                    changed = True
+            for ticket_id, ticket in active.items():
+                if self.active_versions.get(ticket_id) != ticket.get('version', 0):
+                    self._add(ticket)
+                    self.active_versions[ticket_id] = ticket.get('version', 0)
+                    changed = True
+            return changed
+
+    def rebuild(self) -> None:
+        """Строит индекс заново (после перезаписи файлов базы) и сразу сохраняет"""
+        with self._lock:
+            self._reset()
+        self.refresh()
+        with self._lock:
+            self._save()
+
+    def search(self, query: str, limit: int = 50) -> Tuple[List[Dict[str, Any]], int]:
+        """(первые limit тикетов по убыванию релевантности, всего найдено)
+
+        Сначала совпавшие по большему числу слов, затем по TF-IDF.
+        """
+        self.refresh()
+        terms = set(tokenize(query))
+        with self._lock:
+            total = len(self.docs)
+            scores: Dict[str, Tuple[int, float]] = {}
+            for term in terms:
+                postings = self.postings.get(term, {})
+                if not postings:
+                    continue
+                idf = math.log(1 + total / len(postings))
+                for ticket_id, count in postings.items():
+                    matched, score = scores.get(ticket_id, (0, 0.0))
+                    tf = count / self.docs[ticket_id]['length']
+                    scores[ticket_id] = (matched + 1, score + tf * idf)
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))[:limit]
+            return [
+                dict(ticket_id=ticket_id, matched=matched, score=round(score, 4),
+                     **{k: v for k, v in self.docs[ticket_id].items() if k not in ('terms', 'length')})
+                for ticket_id, (matched, score) in ranked
+            ], len(scores)
@@ -1,5 +1,5 @@
-from datetime import datetime, time, timedelta, timezone
-from typing import Dict, Any, List
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Any, List, Tuple
 from config import DAY_SHIFT_START, NIGHT_SHIFT_START, MSK_TIMEZONE_OFFSET, PRODUCTION_TIMEOUT, LAB_TIMEOUT
 
 def get_msk_time() -> datetime:
@@ -8,6 +8,12 @@ def get_msk_time() -> datetime:
     msk_time = utc_time + timedelta(hours=MSK_TIMEZONE_OFFSET)
     return msk_time
 
+def parse_msk_time(timestamp: str) -> datetime:
+    """Naive datetime по МСК из ISO-строки тикета (с 'Z' или '+00:00' или без зоны)"""
+    if 'Z' in timestamp:
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).replace(tzinfo=None)
+    return datetime.fromisoformat(timestamp.split('+')[0])
+
 def get_current_shift() -> str:
     """Возвращает текущую смену по МСК"""
     now = get_msk_time()
@@ -18,6 +24,14 @@ def get_current_shift() -> str:
     else:
         return "ночная"
 
+def shift_of(moment: datetime) -> Tuple[str, date]:
+    """Смена и день смены момента времени (ночь после полуночи - смена предыдущего дня)"""
+    if moment.hour < DAY_SHIFT_START:
+        return "ночная", (moment - timedelta(days=1)).date()
+    if moment.hour < NIGHT_SHIFT_START:
+        return "дневная", moment.date()
+    return "ночная", moment.date()
+
 def format_msk_time(dt: datetime = None) -> str:
     """Форматирует время по МСК"""
     if dt is None:
@@ -0,0 +1,145 @@
+import asyncio
+import hmac
+import json
+import logging
+from typing import Optional
+
+from telegram import Bot, Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY_SIZE = 1024 * 1024
+MAX_HEADERS_SIZE = 16 * 1024
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+class WebhookServer:
+    """Локальный HTTP-приемник апдейтов Telegram
+
+    Слушает только POST на заданный путь, проверяет секретный токен из
+    заголовка X-Telegram-Bot-Api-Secret-Token (без токена приемник не
+    создается: иначе любой мог бы прислать апдейт от имени оператора) и
+    кладет апдейты в очередь
+    приложения. Если в очереди накопилось max_queue апдейтов, отвечает 503,
+    и Telegram повторит доставку позже.
+    """
+
+    def __init__(self, bot: Bot, update_queue: asyncio.Queue, path: str, secret: str, max_queue: int = 1000):
+        if not secret:
+            raise ValueError("Для webhook нужен секретный токен (WEBHOOK_SECRET в config.py)")
+        self.bot = bot
+        self.update_queue = update_queue
+        self.path = path
+        self.secret = secret
+        self.max_queue = max_queue
+        self.accepted = 0
+        self.rejected = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str, port: int) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"Webhook слушает http://{host}:{self.port}{self.path}")
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            status = await self._handle_request(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, KeyError, TypeError):
+            status = 400
+        if status != 200:
+            self.rejected += 1
+        body = STATUS_TEXT[status].encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: text/plain\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader) -> int:
+        head = await reader.readuntil(b"\r\n\r\n")
+        if len(head) > MAX_HEADERS_SIZE:
+            return 413
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if target.split("?", 1)[0] != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, ""), self.secret):
+            return 403
+
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY_SIZE:
+            return 413
+        data = json.loads(await reader.readexactly(length))
+        if not isinstance(data, dict):
+            return 400
+
+        if self.update_queue.qsize() >= self.max_queue:
+            logger.warning("Очередь webhook переполнена, апдейт отклонен")
+            return 503
+        await self.update_queue.put(Update.de_json(data, self.bot))
+        self.accepted += 1
+        return 200
+
+
+async def run_webhook(application: Application, listen: str, port: int, path: str,
+                      secret: str, max_queue: int = 1000, webhook_url: str = "") -> None:
+    """Запускает бота в режиме webhook до отмены задачи (Ctrl+C)
+
+    Без секретного токена не запускается. Если задан webhook_url, адрес
+    регистрируется в Telegram через setWebhook; иначе считается, что его
+    уже настроили снаружи (прокси, тестовый отправитель).
+    """
+    if not secret:
+        raise ValueError("Для webhook нужен секретный токен (WEBHOOK_SECRET в config.py)")
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        server = WebhookServer(application.bot, application.update_queue, path, secret, max_queue)
+        await server.start(listen, port)
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES
+            )
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+            await application.stop()